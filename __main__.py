@@ -1,18 +1,23 @@
-"""Main application server starter.
+"""Development application server starter.
 
     This file is used to:
-        1. Initialize Cache and DB
-        2. Register API Namespaces (refer to routes.py)
-        3. Initialize the application server
+        1. Create the application (refer to app.py; this also registers the API namespaces of routes.py)
+        2. Initialize the DB (and the in-process date coverage index; and the in-memory records, with `READ_ENGINE=memory`)
+        3. Initialize the (development) application server
+
+    In production, the application is served by `gunicorn` instead (refer to wsgi.py).
 """
-from app import app as application, db, api, cache
-from conf.settings import DEBUG, APP_PORT
-from routes import api as ns
+from app import create_app, db
+from conf.settings import DEBUG, APP_PORT, READ_ENGINE
+from financial.coverage import coverage
+from financial.series_store import store
 
-api.add_namespace(ns)
+application = create_app()
 
 with application.app_context():
-    cache.init_app(application)
     db.initialize()
+    coverage.build()
+    if READ_ENGINE == "memory":
+        store.build()
 
 application.run(debug=DEBUG, use_reloader=True, host="0.0.0.0", port=APP_PORT)
@@ -1,3 +1,14 @@
+"""Application factory.
+
+The extensions (`db`, `cache`) are created unbound at import time, so the models and the
+services can import them; `create_app` builds a configured Flask application and binds them.
+
+Example:
+    from app import create_app, db
+    application = create_app()
+    with application.app_context():
+        db.initialize()
+"""
 from flask import Flask
 from flask_restx import Api
 from __init__ import __proj_name__, __version__
@@ -5,45 +16,66 @@ import logging
 import dotenv
 import os
 from pathlib import Path
-from conf.settings import APP_ENV, LOGS_DIR
+from typing import Any, Dict, Optional
+from conf.settings import APP_ENV, LOGS_DIR, CACHE_DIR, CACHE_L1_MAX_BYTES, CACHE_L1_TIMEOUT, CACHE_REDIS_URL, LOG_QUEUE, LOG_SAMPLE_RATES
+from conf.settings import PROFILE_TOKEN, PROFILE_SAMPLE_RATE, PROFILE_INTERVAL_SECONDS, PROFILES_DIR, METRICS_ENABLED
+from lib.logging import QueuedLogging
 from lib.db import DatabaseRouter
-from flask_cors import CORS
 from flask_caching import Cache
 
 
 env_path = ".env.prod" if APP_ENV == 'prod' else None
 dotenv.load_dotenv(env_path)
 
-# TODO: Migrate from static application creation to Application Creator Factory design.
-# This will supply the application with a flexible configurable feature.
-
-# Flask Initialization
-app = Flask(f"{__proj_name__}")
-app.config['OPENAPI_VERSION'] = '3.0.2'
-if APP_ENV == 'prod':
-    CORS(app, origins=os.getenv("ALLOWED_HOSTS", "*").split(","))
-api = Api(
-    app,
-    title=f"{__proj_name__} REST API",
-    version=__version__,
-    prefix="/api",
-    doc="/api"
-)
-
-# Application Configuration
-# - Logger:
-logging.basicConfig(
-    filename=Path(LOGS_DIR, APP_ENV + '.log'),
-    encoding='utf-8',
-    format="(%(asctime)s)[%(levelname)s] %(name)s: %(message)s",
-    level=logging.INFO,
-    datefmt='%m/%d/%Y %I:%M:%S %p'
-)
+# - Logger: Written to the file by a background thread, with the sampling of `LOG_SAMPLE_RATES`
+log = QueuedLogging(Path(LOGS_DIR, APP_ENV + '.log'), sample_rates=LOG_SAMPLE_RATES, queued=LOG_QUEUE, level=logging.INFO)
 
 # - Database Connection
-db = DatabaseRouter.getDatabaseClient(engine=os.getenv("DB_ENGINE"))(app)
+db = DatabaseRouter.getDatabaseClient(engine=os.getenv("DB_ENGINE"))()
+
+# - Cache: Per-process LRU (L1), backed by a cache shared by the workers of the host (L2)
+cache = Cache()
+
+
+def create_app(config: Optional[Dict[str, Any]] = None) -> Flask:
+    """Creates the Flask application, binds the extensions and registers the API namespaces.
+
+    Args:
+        config (Optional[Dict[str, Any]], optional): Overrides of the default configuration.
+    """
+    # Imported here; the routes import the models, which import the extensions of this module
+    from routes import api as ns
+
+    app = Flask(f"{__proj_name__}")
+    app.config['OPENAPI_VERSION'] = '3.0.2'
+    app.config['CACHE_TYPE'] = 'lib.cache.TwoTierCache'
+    app.config['CACHE_DEFAULT_TIMEOUT'] = 300
+    app.config['CACHE_DIR'] = CACHE_DIR
+    app.config['CACHE_L1_MAX_BYTES'] = CACHE_L1_MAX_BYTES
+    app.config['CACHE_L1_TIMEOUT'] = CACHE_L1_TIMEOUT
+    app.config['CACHE_REDIS_URL'] = CACHE_REDIS_URL
+    app.config.update(config or {})
+    if APP_ENV == 'prod':
+        from flask_cors import CORS
+        CORS(app, origins=os.getenv("ALLOWED_HOSTS", "*").split(","))
+    # Only installed when enabled, so the other requests pay nothing for it
+    if PROFILE_TOKEN or PROFILE_SAMPLE_RATE > 0:
+        from lib.profiling import RequestProfiler
+        app.wsgi_app = RequestProfiler(
+            app.wsgi_app, PROFILES_DIR, token=PROFILE_TOKEN, sample_rate=PROFILE_SAMPLE_RATE, interval=PROFILE_INTERVAL_SECONDS
+        )
 
-# - Cache
-app.config['CACHE_TYPE'] = 'SimpleCache'
-app.config['CACHE_DEFAULT_TIMEOUT'] = 300
-cache = Cache(app)
+    db.init_app(app)
+    cache.init_app(app)
+    if METRICS_ENABLED:
+        from lib import metrics
+        metrics.init_app(app)
+    api = Api(
+        app,
+        title=f"{__proj_name__} REST API",
+        version=__version__,
+        prefix="/api",
+        doc="/api"
+    )
+    api.add_namespace(ns)
+    return app
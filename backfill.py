@@ -0,0 +1,69 @@
+"""Script for backfilling the full (20+ years) history of the symbols, from the AlphaVantageAPI.
+
+Run the script using `python backfill.py [--symbols IBM AAPL] [--restart] [--replay] [--as-of 2023-06-02]`:
+    - symbols: The symbols to backfill; all the valid symbols by default.
+    - restart: Backfill again the symbols whose backfill was completed before.
+    - replay, as-of: Same as of `get_raw_data.py`; replays the cached full history responses.
+
+An interrupted backfill (e.g. throttled by the API, or killed) resumes from the last
+committed date of each symbol, when the script is run again. Throttled symbols are retried
+with a backoff, up to `AVANTAGE_MAX_RETRIES` times.
+
+Raises:
+    - ApiKeyNotFoundError: If the `api_key` file is missing from `conf/api_key` path
+"""
+import argparse
+import json
+import requests
+import time
+from datetime import date
+from typing import List, Optional
+from lib.avantage_api import AlphaVantageAPI
+from lib.response_cache import ResponseCache
+from lib.exceptions import ApiThrottledError
+from app import db
+from model import FinancialData
+from financial import backfill, ingestion, warmup
+from lib.generation import generations
+from get_raw_data import application, get_api_key
+from conf.settings import AVANTAGE_MAX_RETRIES
+
+
+def execute(
+    symbols: Optional[List[str]] = None, restart: bool = False, replay: bool = False, as_of: Optional[date] = None
+) -> ingestion.IngestionReport:
+    client = AlphaVantageAPI(api_key="" if replay else get_api_key(), cache=ResponseCache(), replay=replay, as_of=as_of)
+    report = ingestion.IngestionReport()
+
+    with application.app_context():
+        for symbol in symbols or sorted(FinancialData.Symbols.as_set(codes_only=True)):
+            if restart:
+                backfill.reset(db.core.session, symbol)
+            for attempt in range(AVANTAGE_MAX_RETRIES + 1):
+                try:
+                    if not backfill.run(client, symbol, report):
+                        print(f"{symbol}: Already backfilled (use --restart to backfill again).")
+                    break
+                # Throttled, or the connection was lost (possibly in the middle of the stream)
+                except (ApiThrottledError, requests.Timeout, requests.ConnectionError, requests.exceptions.ChunkedEncodingError, json.JSONDecodeError) as e:
+                    if attempt == AVANTAGE_MAX_RETRIES:
+                        raise
+                    wait = client._backoff(attempt)
+                    print(f"{symbol}: {e}; resuming in {wait:.1f}s.")
+                    time.sleep(wait)
+        changed = report.changed_symbols()
+        if changed:
+            with generations.pending(changed):
+                warmup.prewarm()
+            generations.bump(changed)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", nargs="+", choices=sorted(FinancialData.Symbols.as_set(codes_only=True)))
+    parser.add_argument("--restart", action="store_true")
+    parser.add_argument("--replay", action="store_true")
+    parser.add_argument("--as-of", type=date.fromisoformat)
+    args = parser.parse_args()
+    print(execute(args.symbols, args.restart, args.replay, args.as_of))
@@ -0,0 +1,33 @@
+"""Gunicorn configuration of the production server (refer to wsgi.py).
+
+Graceful restarts:
+    - `kill -HUP <master>`: Starts new workers, then stops the old ones once they have finished
+        their in-flight requests (within `graceful_timeout`). The preloaded application is kept.
+    - `kill -USR2 <master>`, then `kill -QUIT <old master>`: Starts a new master with the new
+        code, on the same listening socket; so no connection is refused during a deploy.
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from conf.settings import APP_PORT, WEB_WORKERS, WEB_THREADS, WEB_TIMEOUT_SECONDS, WEB_MAX_REQUESTS
+
+bind = f"0.0.0.0:{APP_PORT}"
+workers = WEB_WORKERS
+threads = WEB_THREADS
+worker_class = "gthread"
+# Load the application in the master, before forking (refer to wsgi.py)
+preload_app = True
+timeout = WEB_TIMEOUT_SECONDS
+graceful_timeout = WEB_TIMEOUT_SECONDS
+keepalive = 5
+# Recycle workers periodically, staggered so they never restart all at once
+max_requests = WEB_MAX_REQUESTS
+max_requests_jitter = WEB_MAX_REQUESTS // 10
+accesslog = "-"
+
+
+def post_fork(server, worker):
+    from app import db
+    db.dispose()
@@ -12,6 +12,7 @@ FIXTURES_DIR = os.getenv("FIXTURES_PATH", "data/fixtures")
 TEST_FIXTURES_DIR = os.getenv("TEST_FIXTURES_PATH", "tests/fixtures")
 DB_DIR = os.getenv("DB_PATH", "data/streaming")
 TEMP_DIR = os.getenv("TEMP_PATH", "temp")
+CACHE_DIR = os.getenv("CACHE_PATH", "data/cache/shared")
 
 # - Database Configuration:
 DB_HOST = os.getenv("DB_HOST")
@@ -22,4 +23,116 @@ DB_NAME = os.getenv("DB_NAME")
 
 # - App Configuration:
 MAX_BULK_OPERATIONS = 50
+# Bulk upserts start at `MAX_BULK_OPERATIONS` rows per commit, and are then resized within
+# these bounds to keep each commit around the target latency.
+BULK_BATCH_BOUNDS = (MAX_BULK_OPERATIONS, 5000)
+BULK_COMMIT_TARGET_SECONDS = float(os.getenv("BULK_COMMIT_TARGET_SECONDS", "0.25"))
 DEFAULT_DATE_FMT = "%Y-%m-%d"
+
+# - Rollups (see `financial/rollups.py`):
+# Answer `/statistics` from the `financial_data_rollup` buckets (see `manage_rollups.py`).
+STATISTICS_FROM_ROLLUPS = os.getenv("STATISTICS_FROM_ROLLUPS", "True") == "True"
+
+# - Date Coverage Index (see `financial/coverage.py`):
+# Rebuilt after this long, even without a new data generation; for the writes made elsewhere.
+COVERAGE_MAX_AGE_SECONDS = float(os.getenv("COVERAGE_MAX_AGE_SECONDS", "300"))
+
+# - Cache Configuration:
+CACHE_L1_MAX_BYTES = int(os.getenv("CACHE_L1_MAX_BYTES", str(32 * 1024 * 1024)))
+CACHE_L1_TIMEOUT = int(os.getenv("CACHE_L1_TIMEOUT", "30"))
+# If set, the shared (L2) cache is this Redis compatible server, instead of files under `CACHE_DIR`.
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+
+# - Data Generations (see `lib/generation.py`):
+# Per-symbol data generation counters, bumped by each ingestion that changes rows.
+GENERATION_PATH = os.path.join(DB_DIR, "generations.json")
+
+# - Cache Pre-warming (see `financial/warmup.py`):
+WARMUP_SHAPES_DIR = os.getenv("WARMUP_SHAPES_PATH", "data/cache/warmup")
+WARMUP_FLUSH_SECONDS = float(os.getenv("WARMUP_FLUSH_SECONDS", "60"))
+WARMUP_SHAPES_MAX_AGE_SECONDS = float(os.getenv("WARMUP_SHAPES_MAX_AGE_SECONDS", str(24 * 3600)))
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", "20"))
+WARMUP_BUDGET_SECONDS = float(os.getenv("WARMUP_BUDGET_SECONDS", "10"))
+# Warming of the production server master, before forking the workers (see `wsgi.py`)
+STARTUP_WARMUP_BUDGET_SECONDS = float(os.getenv("STARTUP_WARMUP_BUDGET_SECONDS", "2"))
+
+# - Single-flight (see `lib/singleflight.py`):
+# Also coalesce identical concurrent calls across the processes of the host (with file locks).
+SINGLEFLIGHT_CROSS_PROCESS = os.getenv("SINGLEFLIGHT_CROSS_PROCESS", "False") == "True"
+SINGLEFLIGHT_LOCK_DIR = os.getenv("SINGLEFLIGHT_LOCK_PATH", "data/cache/locks")
+SINGLEFLIGHT_LOCK_STRIPES = 64
+SINGLEFLIGHT_WAIT_SECONDS = float(os.getenv("SINGLEFLIGHT_WAIT_SECONDS", "10"))
+
+# - Production Server (see `conf/gunicorn.conf.py`):
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", str(2 * (os.cpu_count() or 1) + 1)))
+WEB_THREADS = int(os.getenv("WEB_THREADS", "4"))
+WEB_TIMEOUT_SECONDS = int(os.getenv("WEB_TIMEOUT_SECONDS", "30"))
+WEB_MAX_REQUESTS = int(os.getenv("WEB_MAX_REQUESTS", "10000"))
+
+# - AlphaVantage API (see `lib/avantage_api.py`):
+AVANTAGE_BASE_URL = os.getenv("AVANTAGE_BASE_URL", "https://www.alphavantage.co/query")
+# The quota of the API key; the free tier allows 5 calls per minute.
+AVANTAGE_CALLS_PER_MINUTE = float(os.getenv("AVANTAGE_CALLS_PER_MINUTE", "5"))
+AVANTAGE_MAX_WORKERS = int(os.getenv("AVANTAGE_MAX_WORKERS", "4"))
+# (connect, read) timeouts of each request
+AVANTAGE_TIMEOUT_SECONDS = (float(os.getenv("AVANTAGE_CONNECT_TIMEOUT", "5")), float(os.getenv("AVANTAGE_READ_TIMEOUT", "30")))
+AVANTAGE_MAX_RETRIES = int(os.getenv("AVANTAGE_MAX_RETRIES", "4"))
+AVANTAGE_BACKOFF_SECONDS = float(os.getenv("AVANTAGE_BACKOFF_SECONDS", "2"))
+
+# - Incremental Ingestion (see `financial/ingestion.py`):
+# Content hashes of the ingested rows are kept for this many days before the high-water mark.
+INGESTION_HASH_WINDOW_DAYS = int(os.getenv("INGESTION_HASH_WINDOW_DAYS", "45"))
+
+# - Full History Backfill (see `backfill.py`):
+# Rows per bulk upsert call; each is then committed in `BULK_BATCH_BOUNDS` sized batches.
+BACKFILL_CHUNK_ROWS = int(os.getenv("BACKFILL_CHUNK_ROWS", "1000"))
+BACKFILL_STREAM_CHUNK_BYTES = 64 * 1024
+
+# - Raw Response Cache (see `lib/response_cache.py`):
+RESPONSE_CACHE_DIR = os.getenv("RESPONSE_CACHE_PATH", "data/cache/responses")
+# A cached response is reused (instead of downloaded again) for this long; replays ignore it.
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", str(6 * 60 * 60)))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# - Bulk Export (see `financial/export_financial_data.py`):
+# Rows fetched from the server-side cursor, and encoded, at a time.
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+
+# - Batch Statistics (see `financial/get_batch_statistics.py`):
+# Items per `/statistics/batch` request; each is one or two branches of its `UNION ALL` query
+# (SQLite allows 500).
+BATCH_STATISTICS_MAX_ITEMS = int(os.getenv("BATCH_STATISTICS_MAX_ITEMS", "100"))
+
+# - Rolling Statistics (see `financial/get_rolling_statistics.py`):
+# Largest window (in trading days) of `/statistics/rolling`.
+ROLLING_MAX_WINDOW = int(os.getenv("ROLLING_MAX_WINDOW", "250"))
+
+# - Read Engine (see `financial/series_store.py`):
+# Where the services read the records from: "db", or "memory" (NumPy arrays of each symbol,
+# reloaded after ingestions).
+READ_ENGINE = os.getenv("READ_ENGINE", "db")
+
+# - Logging (see `lib/logging.py`):
+# Write the log file from a background thread, instead of the calling (request) one.
+LOG_QUEUE = os.getenv("LOG_QUEUE", "True") == "True"
+# Share of the INFO records kept, per logger (and its children); e.g. "list_financial_data=0.01".
+LOG_SAMPLE_RATES = {
+    name.strip(): float(rate) for name, rate in (item.split("=") for item in os.getenv("LOG_SAMPLE_RATES", "").split(",") if item)
+}
+# Logged arguments and results: the first items of longer collections, and the first characters of longer texts.
+LOG_MAX_ITEMS = int(os.getenv("LOG_MAX_ITEMS", "3"))
+LOG_MAX_CHARS = int(os.getenv("LOG_MAX_CHARS", "500"))
+
+# - Request Profiling (see `lib/profiling.py`):
+# Requests sending this value in their `X-Profile` header are profiled; unset, the header is ignored.
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+# Share of the requests profiled at random.
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.001"))
+PROFILES_DIR = os.getenv("PROFILES_PATH", os.path.join(LOGS_DIR, "profiles"))
+
+# - Metrics (see `lib/metrics.py`):
+# Serve `/metrics`, and time the requests, the SQL statements and the pool checkouts.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True") == "True"
+METRICS_DIR = os.getenv("METRICS_PATH", "data/cache/metrics")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
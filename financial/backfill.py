@@ -0,0 +1,96 @@
+"""Full history backfill of the `financial_data` records.
+
+The full series of a symbol is streamed (see `AlphaVantageAPI.stream_full_data`), and
+written in batches of `BACKFILL_CHUNK_ROWS` days (`DailyTimeSeriesBatch` column arrays, with no
+ORM instance per row); so the memory use stays flat, whatever the length of the history.
+
+The progress is kept in the `backfill_checkpoint` table: the range of the committed dates.
+It is advanced within the same transaction as each written batch (`advance` is a
+`bulk_upsert` hook), so an interrupted backfill resumes from the last committed date.
+
+Functions:
+    - run: Backfills a symbol; or resumes its interrupted backfill.
+    - reset: Forgets the progress of a symbol, so its next backfill starts over.
+"""
+from app import db
+from model import FinancialData, BackfillCheckpoint
+from financial import ingestion, rollups
+from financial.rollups import as_symbol_code
+from lib.utils import as_date
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional
+from sqlalchemy.orm import Session
+from conf.settings import BACKFILL_CHUNK_ROWS
+
+
+def get_checkpoint(session: Session, symbol: Any) -> Optional[BackfillCheckpoint]:
+    return session.get(BackfillCheckpoint, FinancialData.Symbols[as_symbol_code(symbol)])
+
+
+def _extend(session: Session, code: str, days: Iterable[date]) -> BackfillCheckpoint:
+    """Extends the committed range of the symbol with the `days`."""
+    days = list(days)
+    checkpoint = get_checkpoint(session, code)
+    if checkpoint is None:
+        checkpoint = BackfillCheckpoint(symbol=FinancialData.Symbols[code], newest_date=max(days), oldest_date=min(days), completed=False)
+        session.add(checkpoint)
+    else:
+        checkpoint.newest_date = max(days + [checkpoint.newest_date])
+        checkpoint.oldest_date = min(days + [checkpoint.oldest_date])
+    checkpoint.updated_at = datetime.now()
+    return checkpoint
+
+
+def advance(session: Session, rows: List[Dict[str, Any]]) -> None:
+    """`bulk_upsert` hook; extends the checkpoints with the dates of the written `rows`.
+
+    The series is written newest first, so every date between a written row and the
+    previous checkpoint is already committed (or was unchanged).
+    """
+    by_symbol: Dict[str, List[date]] = {}
+    for row in rows:
+        by_symbol.setdefault(as_symbol_code(row["symbol"]), []).append(as_date(row["date"]))
+    for code, days in by_symbol.items():
+        _extend(session, code, days)
+
+
+def reset(session: Session, symbol: Any) -> None:
+    checkpoint = get_checkpoint(session, symbol)
+    if checkpoint is not None:
+        session.delete(checkpoint)
+        session.commit()
+
+
+def run(client: Any, symbol: Any, report: ingestion.IngestionReport, chunk_rows: int = BACKFILL_CHUNK_ROWS) -> bool:
+    """Backfills the full history of the `symbol`; skipping the dates committed by a previous run.
+
+    Requires an application context.
+
+    Returns:
+        bool: False if the backfill of the symbol was already completed (see `reset`).
+    """
+    session = db.core.session
+    code = as_symbol_code(symbol)
+    checkpoint = get_checkpoint(session, code)
+    if checkpoint is not None and checkpoint.completed:
+        return False
+    committed = (checkpoint.oldest_date, checkpoint.newest_date) if checkpoint is not None else None
+    for batch in client.stream_full_data(code, chunk_rows):
+        if committed is not None:
+            oldest, newest = committed
+            batch = batch.take(i for i, day in enumerate(batch.dates) if not oldest <= day <= newest)
+            if not batch:
+                continue
+        db.bulk_upsert_rows(
+            cls=FinancialData,
+            rows=ingestion.plan_batch(session, batch, report).rows(),
+            after_batch=[rollups.refresh_rows, ingestion.record_rows, advance]
+        )
+        # The whole batch is committed now; including its unchanged (unwritten) rows
+        _extend(session, code, batch.dates)
+        session.commit()
+    checkpoint = get_checkpoint(session, code)
+    if checkpoint is not None:
+        checkpoint.completed = True
+        session.commit()
+    return True
@@ -0,0 +1,95 @@
+"""In-process index of the trading dates stored per symbol.
+
+The index holds, per symbol, the sorted day numbers (`date.toordinal()`) of the
+`financial_data` records. Counting the records of a (symbol, date range) is then two
+binary searches, so the services only need the database for fetching the actual rows.
+
+The index is built on first use (or at startup, see `__main__.py`), and is rebuilt when:
+    - the data generation changed (i.e. after an ingestion, possibly from another process), or
+    - it is older than `COVERAGE_MAX_AGE_SECONDS` (a safety net for writes made elsewhere).
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from typing import Dict, Iterable, Optional, Tuple
+from model import FinancialData
+from lib.utils import as_date
+from lib.generation import DataGeneration, generations as default_generations
+from conf.settings import COVERAGE_MAX_AGE_SECONDS
+import time
+
+
+class DateCoverageIndex:
+    """Per-symbol sorted array of the dates present in the `financial_data` table.
+
+    Example:
+        coverage.count("IBM", start_date, end_date)   # => number of IBM records in range
+        coverage.count()                              # => number of records in the table
+    """
+    def __init__(self, generations: DataGeneration = default_generations, max_age: float = COVERAGE_MAX_AGE_SECONDS):
+        self.generations = generations
+        self.max_age = max_age
+        self._dates: Dict[str, array] = {}
+        self._built_at: Optional[float] = None
+        self._generation: Optional[int] = None
+
+    def is_stale(self) -> bool:
+        return (
+            self._built_at is None or
+            time.monotonic() - self._built_at > self.max_age or
+            self.generations.get() != self._generation
+        )
+
+    def load(self, records: Iterable[Tuple[str, date]]) -> None:
+        """Replaces the index with the given (symbol, date) records."""
+        dates: Dict[str, array] = {}
+        for symbol, day in records:
+            dates.setdefault(symbol if isinstance(symbol, str) else symbol.name, array("l")).append(day.toordinal())
+        for symbol, days in dates.items():
+            dates[symbol] = array("l", sorted(days))
+        # Swapped as a whole, so concurrent readers never see a partially built index
+        self._dates = dates
+        self._built_at = time.monotonic()
+
+    def build(self) -> None:
+        """(Re)builds the index from the database. Requires an application context."""
+        generation = self.generations.get()
+        self.load(FinancialData.query.with_entities(FinancialData.symbol, FinancialData.date).yield_per(5000))
+        self._generation = generation
+
+    def refresh(self) -> None:
+        if self.is_stale():
+            self.build()
+
+    def count(
+        self,
+        symbol: Optional[str] = None,
+        start_date: Optional[date | datetime | str] = None,
+        end_date: Optional[date | datetime | str] = None
+    ) -> int:
+        """Returns the number of records of the `symbol` (or all symbols) within the range."""
+        self.refresh()
+        symbols = [symbol if isinstance(symbol, str) else symbol.name] if symbol else list(self._dates.keys())
+        lo = as_date(start_date).toordinal() if start_date else None
+        hi = as_date(end_date).toordinal() if end_date else None
+        total = 0
+        for code in symbols:
+            days = self._dates.get(code)
+            if not days:
+                continue
+            total += (bisect_right(days, hi) if hi is not None else len(days)) - (bisect_left(days, lo) if lo is not None else 0)
+        return max(total, 0)
+
+    def lookback(self, symbol: str, start_date: date | datetime | str, records: int) -> date:
+        """Returns the date of the `records`-th record of the `symbol` before `start_date` (or of its
+        first record); i.e. where a range should start to also hold the `records` preceding ones."""
+        self.refresh()
+        start_date = as_date(start_date)
+        days = self._dates.get(symbol if isinstance(symbol, str) else symbol.name)
+        if not days:
+            return start_date
+        index = bisect_left(days, start_date.toordinal())
+        return min(date.fromordinal(days[min(max(index - records, 0), len(days) - 1)]), start_date)
+
+
+coverage = DateCoverageIndex()
@@ -0,0 +1,208 @@
+"""Bulk export of the financial data records, as NDJSON, CSV, or binary column arrays.
+
+The records are read through a server-side cursor (`yield_per` + `stream_results`; e.g. an
+unbuffered `SSCursor` on MySQL), and encoded `EXPORT_CHUNK_ROWS` rows at a time; so the memory
+use does not depend on the size of the result. Only the exported columns are selected, without
+building ORM instances.
+
+The binary formats hold each chunk as one typed array per column (`COLUMN_TYPES`), which the
+client maps without parsing or copying (e.g. `numpy.frombuffer`):
+    - symbol: uint8, the index of the symbol in `SYMBOLS`
+    - date: int32, days since 1970-01-01
+    - open_price, close_price: float64
+    - volume: uint32
+
+Formats:
+    - columns: Always available; little-endian, every array aligned to 8 bytes:
+        header := b"FDCOLS01" | uint32 schema length | schema (JSON, space padded)
+        batch := uint32 rows | uint32 0 | the arrays, in the schema order, each zero padded
+        end := a batch of 0 rows
+      The schema is `{"columns": [{"name", "type" (numpy dtype string)[, "dictionary"]}]}`;
+      `iter_column_batches` reads it back.
+    - arrow: An Arrow IPC stream (one record batch per chunk, `symbol` dictionary encoded, `date`
+      as date32); only offered when `pyarrow` is installed, and imported on the first use.
+
+Functions:
+    - main: Yields the chunks of an export.
+    - iter_column_batches: Decodes a `columns` export.
+"""
+from app import db
+from model import FinancialData, FinancialDataSerializer
+from lib.logging import Loggable
+from array import array
+from datetime import date, datetime
+from importlib.util import find_spec
+from sqlalchemy import select
+from sqlalchemy.engine import Row
+from typing import AnyStr, Callable, Dict, Iterable, Iterator, List, Optional
+from conf.settings import EXPORT_CHUNK_ROWS
+import csv
+import io
+import json
+import struct
+import sys
+
+COLUMNS = ["symbol", "date", "open_price", "close_price", "volume"]
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv", "columns": "application/vnd.financial-data.columns"}
+if find_spec("pyarrow") is not None:
+    MEDIA_TYPES["arrow"] = "application/vnd.apache.arrow.stream"
+
+SYMBOLS = list(FinancialData.Symbols)
+# (`array` typecode, numpy dtype string) of each column
+COLUMN_TYPES = {"symbol": ("B", "<u1"), "date": ("i", "<i4"), "open_price": ("d", "<f8"), "close_price": ("d", "<f8"), "volume": ("I", "<u4")}
+COLUMNS_MAGIC = b"FDCOLS01"
+EPOCH = date(1970, 1, 1).toordinal()
+_SYMBOL_CODES = {symbol: code for code, symbol in enumerate(SYMBOLS)}
+_BATCH_HEADER = struct.Struct("<II")
+
+
+def _ndjson(chunks: Iterable[List[Row]]) -> Iterator[str]:
+    """One JSON object per line; the same ones as in the `data` of `/financial_data`."""
+    encode = FinancialDataSerializer.compile_row(COLUMNS)
+    for rows in chunks:
+        yield "".join([encode(row) + "\n" for row in rows])
+
+
+def _csv(chunks: Iterable[List[Row]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(COLUMNS)
+    for rows in chunks:
+        writer.writerows(
+            (row.symbol.name, row.date.isoformat(), "%.1f" % row.open_price, "%.1f" % row.close_price, row.volume)
+            for row in rows
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _arrays(rows: List[Row]) -> Dict[str, array]:
+    """The columns of `rows`, as little-endian typed arrays."""
+    symbols, dates, open_prices, close_prices, volumes = zip(*rows)
+    arrays = {
+        "symbol": array("B", map(_SYMBOL_CODES.__getitem__, symbols)),
+        "date": array("i", [day - EPOCH for day in map(date.toordinal, dates)]),
+        "open_price": array("d", open_prices),
+        "close_price": array("d", close_prices),
+        "volume": array("I", volumes)
+    }
+    if sys.byteorder != "little":
+        for values in arrays.values():
+            values.byteswap()
+    return arrays
+
+
+def _padding(size: int) -> bytes:
+    return b"\0" * (-size % 8)
+
+
+def _columns(chunks: Iterable[List[Row]]) -> Iterator[bytes]:
+    schema = json.dumps({"columns": [
+        {"name": name, "type": dtype, **({"dictionary": [symbol.name for symbol in SYMBOLS]} if name == "symbol" else {})}
+        for name, (_, dtype) in COLUMN_TYPES.items()
+    ]}).encode()
+    schema += b" " * (-(len(COLUMNS_MAGIC) + 4 + len(schema)) % 8)
+    yield COLUMNS_MAGIC + struct.pack("<I", len(schema)) + schema
+    for rows in chunks:
+        parts = [_BATCH_HEADER.pack(len(rows), 0)]
+        for values in _arrays(rows).values():
+            data = values.tobytes()
+            parts += [data, _padding(len(data))]
+        yield b"".join(parts)
+    yield _BATCH_HEADER.pack(0, 0)
+
+
+def _arrow(chunks: Iterable[List[Row]]) -> Iterator[bytes]:
+    import pyarrow as pa
+
+    types = {"symbol": pa.uint8(), "date": pa.date32(), "open_price": pa.float64(), "close_price": pa.float64(), "volume": pa.uint32()}
+    schema = pa.schema({**types, "symbol": pa.dictionary(pa.uint8(), pa.string())})
+    dictionary = pa.array([symbol.name for symbol in SYMBOLS])
+    sink = io.BytesIO()
+
+    def flush() -> bytes:
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for rows in chunks:
+            # The typed arrays are wrapped, not copied
+            arrays = {
+                name: pa.Array.from_buffers(types[name], len(rows), [None, pa.py_buffer(values)])
+                for name, values in _arrays(rows).items()
+            }
+            arrays["symbol"] = pa.DictionaryArray.from_arrays(arrays["symbol"], dictionary)
+            writer.write_batch(pa.RecordBatch.from_arrays(list(arrays.values()), schema=schema))
+            yield flush()
+    yield flush()
+
+
+ENCODERS: Dict[str, Callable[[Iterable[List[Row]]], Iterator[AnyStr]]] = {"ndjson": _ndjson, "csv": _csv, "columns": _columns, "arrow": _arrow}
+
+
+def iter_column_batches(data: bytes) -> Iterator[Dict[str, memoryview]]:
+    """Yields the batches of a `columns` export, as views of `data` (per column name).
+
+    Example:
+        for batch in iter_column_batches(resp.content):
+            open_prices = numpy.frombuffer(batch["open_price"], dtype="<f8")
+
+    Raises:
+        ValueError: If `data` is not a `columns` export.
+    """
+    view = memoryview(data)
+    if bytes(view[:len(COLUMNS_MAGIC)]) != COLUMNS_MAGIC:
+        raise ValueError("Not a columns export")
+    offset = len(COLUMNS_MAGIC) + 4
+    offset += struct.unpack_from("<I", view, len(COLUMNS_MAGIC))[0]
+    columns = json.loads(bytes(view[len(COLUMNS_MAGIC) + 4:offset]))["columns"]
+    while True:
+        rows, _ = _BATCH_HEADER.unpack_from(view, offset)
+        offset += _BATCH_HEADER.size
+        if not rows:
+            return
+        batch = {}
+        for column in columns:
+            typecode, _ = COLUMN_TYPES[column["name"]]
+            size = rows * array(typecode).itemsize
+            batch[column["name"]] = view[offset:offset + size].cast(typecode)
+            offset += size + len(_padding(size))
+        yield batch
+
+
+@Loggable("export_financial_data")
+def main(
+    format: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    symbol: Optional[str] = None,
+    chunk_rows: int = EXPORT_CHUNK_ROWS
+) -> Iterator[AnyStr]:
+    """Yields the financial data records saved in DB, ordered by (`symbol`, `date`), encoded in `format`.
+
+    The query runs when the first chunk is asked for, and the cursor is closed when the
+    generator is (e.g. by the server, when the client stopped reading).
+
+    Args:
+        format (str): One of `MEDIA_TYPES`.
+        start_date (Optional[datetime], optional): Defaults to None.
+        end_date (Optional[datetime], optional): Defaults to None.
+        symbol (Optional[str], optional): Defaults to None. If None, all symbols will be targeted.
+    """
+    query = select(*(getattr(FinancialData, column) for column in COLUMNS))
+    if symbol:
+        query = query.where(FinancialData.symbol == symbol)
+    if start_date:
+        query = query.where(FinancialData.date >= start_date)
+    if end_date:
+        query = query.where(FinancialData.date <= end_date)
+    query = query.order_by(FinancialData.symbol, FinancialData.date).execution_options(
+        yield_per=chunk_rows, stream_results=True
+    )
+    with db.core.session.execute(query) as result:
+        yield from ENCODERS[format](result.partitions())
@@ -0,0 +1,126 @@
+"""Statistics of many (symbol, date range) items at once.
+
+Each item is looked up in the memoize cache of `get_statistics.main` first; under its own
+key, so the batch and the single item endpoints share the cached results. All the missing
+items are then answered by a single `UNION ALL` query, with the branches of each item (the
+`AVG`s of its range; or the sums of its edge days and of its full rollup buckets, as
+`get_statistics.main` would split it) tagged with the index of the item. The results are
+cached per item.
+
+Functions:
+    - main: Returns the statistics of each item.
+"""
+from app import cache, db
+from financial import get_statistics, rollups
+from financial.coverage import coverage
+from financial.series_store import store
+from model import FinancialData, FinancialDataRollup
+from lib.logging import Loggable
+from lib.metrics import CacheMetrics
+from lib.utils import as_date
+from conf.settings import STATISTICS_FROM_ROLLUPS, READ_ENGINE
+from datetime import date
+from sqlalchemy import and_, func, literal, or_, select, union_all
+from sqlalchemy.sql import Select
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger("get_batch_statistics")
+
+
+def _raw(index: int, aggregate: Callable, ranges: List[Tuple[date, date]], symbol: str) -> Select:
+    return select(
+        literal(index).label("item"),
+        aggregate(FinancialData.open_price),
+        aggregate(FinancialData.close_price),
+        aggregate(FinancialData.volume),
+        func.count(FinancialData.id)
+    ).where(FinancialData.symbol == symbol, or_(*[FinancialData.date.between(start, end) for start, end in ranges]))
+
+
+def _rollups(index: int, months: List[date], years: List[date], symbol: str) -> Select:
+    periods = [
+        and_(FinancialDataRollup.granularity == granularity, FinancialDataRollup.period_start.in_(starts))
+        for granularity, starts in ((rollups.MONTH, months), (rollups.YEAR, years)) if starts
+    ]
+    return select(
+        literal(index).label("item"),
+        func.sum(FinancialDataRollup.sum_open_price),
+        func.sum(FinancialDataRollup.sum_close_price),
+        func.sum(FinancialDataRollup.sum_volume),
+        func.sum(FinancialDataRollup.count)
+    ).where(FinancialDataRollup.symbol == symbol, or_(*periods))
+
+
+def compute(items: List[Dict[str, Any]]) -> List[Dict[str, float]]:
+    """Computes the statistics of the `items` (as `get_statistics.main` does), with at most one query
+    (none with `READ_ENGINE=memory`)."""
+    results: List[Optional[Dict[str, float]]] = [None] * len(items)
+    selects, averaged = [], set()
+    for index, item in enumerate(items):
+        start_date, end_date, symbol = as_date(item["start_date"]), as_date(item["end_date"]), item["symbol"]
+        if READ_ENGINE == "memory":
+            results[index] = store.average(symbol, start_date, end_date)
+            continue
+        if not coverage.count(symbol, start_date, end_date):
+            results[index] = {}
+            continue
+        edges, months, years = rollups.split_range(start_date, end_date)
+        if not STATISTICS_FROM_ROLLUPS or not (months or years):
+            selects.append(_raw(index, func.avg, [(start_date, end_date)], symbol))
+            averaged.add(index)
+            continue
+        if edges:
+            selects.append(_raw(index, func.sum, edges, symbol))
+        selects.append(_rollups(index, months, years, symbol))
+    totals: Dict[int, List[Tuple]] = {}
+    if selects:
+        for row in db.core.session.execute(union_all(*selects)):
+            totals.setdefault(row[0], []).append(tuple(row[1:]))
+    for index, parts in totals.items():
+        if index in averaged:
+            open_price, close_price, volume, count = parts[0]
+            results[index] = {
+                "average_daily_open_price": float(open_price),
+                "average_daily_close_price": float(close_price),
+                "average_daily_volume": float(volume)
+            } if count else {}
+        else:
+            results[index] = get_statistics.average(parts)
+    return results
+
+
+@Loggable("get_batch_statistics")
+def main(items: List[Dict[str, Any]]) -> List[Dict[str, float]]:
+    """Returns the average daily statistics of each item, in order.
+
+    Args:
+        items (List[Dict[str, Any]]): The `start_date`, `end_date` and `symbol` arguments of
+            `get_statistics.main`; given as the `/statistics` endpoint would give them, so the
+            memoize keys are the same.
+
+    Returns:
+        List[Dict[str, float]]: The result of `get_statistics.main` for each item; i.e. an empty
+            dictionary for the items with no records in their range.
+    """
+    memoized = get_statistics.main
+    keys = [memoized.make_cache_key(memoized.uncached, **item) for item in items]
+    try:
+        # Counted as lookups of `get_statistics`, whose results they are
+        with CacheMetrics("get_statistics"):
+            cached = cache.get_many(*keys)
+    except Exception:
+        logger.exception("Exception possibly due to cache backend.")
+        cached = [None] * len(keys)
+    # Identical items are computed once
+    misses: Dict[str, int] = {}
+    for index, (key, value) in enumerate(zip(keys, cached)):
+        if value is None:
+            misses.setdefault(key, index)
+    computed = dict(zip(misses, compute([items[index] for index in misses.values()])))
+    for key, value in computed.items():
+        try:
+            cache.set(key, value, timeout=memoized.cache_timeout)
+        except Exception:
+            logger.exception("Exception possibly due to cache backend.")
+    return [computed[key] if key in computed else value for key, value in zip(keys, cached)]
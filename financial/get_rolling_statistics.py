@@ -0,0 +1,136 @@
+"""Rolling (moving window) statistics of a symbol.
+
+The records of the range, and the `window` ones preceding it (found by the date coverage
+index), are read in a single ordered query; or sliced from `store`, with `READ_ENGINE=memory`.
+Every window is then computed at once from cumulative sums (the sum of a window is the
+difference of two prefix sums), so the cost is linear in the number of records, whatever
+the window.
+
+NumPy is imported on the first call; it is not needed by the rest of the API.
+
+Functions:
+    - main: Returns the rolling statistics of each trading day of the range.
+"""
+from app import cache, db
+from model import FinancialData
+from lib.logging import Loggable
+from lib.generation import generations
+from lib.singleflight import SingleFlight
+from lib.metrics import CacheMetrics
+from lib.utils import as_date
+from financial.coverage import coverage
+from financial.series_store import store
+from conf.settings import READ_ENGINE
+from datetime import date, datetime
+from sqlalchemy import select
+from typing import Any, Dict, List
+
+KEYS = ["mean_open_price", "mean_close_price", "vwap", "volatility"]
+
+
+def _window_sums(values, window: int):
+    """Sums of every `window` consecutive `values`; the i-th one ends at `values[i + window - 1]`.
+
+    NaN for the windows holding a non-finite value; which is left out of the cumulative sum,
+    so it does not spread to every later window.
+    """
+    import numpy as np
+
+    finite = np.isfinite(values)
+    sums = np.zeros(len(values) + 1)
+    np.cumsum(np.where(finite, values, 0), out=sums[1:])
+    result = sums[window:] - sums[:-window]
+    if not finite.all():
+        invalid = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum(~finite, out=invalid[1:])
+        result[invalid[window:] - invalid[:-window] > 0] = np.nan
+    return result
+
+
+def rolling(open_prices, close_prices, volumes, window: int) -> Dict[str, Any]:
+    """Returns the rolling statistics of the day-ordered columns, as arrays aligned with them;
+    NaN where the window is not full yet.
+
+        - mean_open_price, mean_close_price: The means over the last `window` days.
+        - vwap: The volume weighted average (close) price over the last `window` days.
+        - volatility: The sample standard deviation of the last `window` daily (close to close)
+            returns; which needs `window + 1` days.
+    """
+    import numpy as np
+
+    size = len(close_prices)
+    result = {key: np.full(size, np.nan) for key in KEYS}
+    if size >= window:
+        result["mean_open_price"][window - 1:] = _window_sums(open_prices, window) / window
+        result["mean_close_price"][window - 1:] = _window_sums(close_prices, window) / window
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result["vwap"][window - 1:] = _window_sums(close_prices * volumes, window) / _window_sums(volumes, window)
+    if size > window:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns = close_prices[1:] / close_prices[:-1] - 1
+        # Centered, so that the sums of squares do not cancel out
+        returns = returns - np.nanmean(returns) if np.isfinite(returns).any() else returns
+        sums, squares = _window_sums(returns, window), _window_sums(returns * returns, window)
+        variance = (squares - sums * sums / window) / (window - 1)
+        result["volatility"][window:] = np.sqrt(np.maximum(variance, 0))
+    return result
+
+
+@Loggable("get_rolling_statistics")
+# Identical concurrent calls wait for the first one, instead of all missing the cache
+@SingleFlight("get_rolling_statistics", namespace=generations.namespace)
+@CacheMetrics("get_rolling_statistics")
+@cache.memoize(50, make_name=generations.namespace)
+def main(
+    start_date: datetime,
+    end_date: datetime,
+    symbol: str,
+    window: int
+) -> List[Dict[str, Any]]:
+    """Returns the rolling statistics (see `rolling`) of each record of the symbol in the range.
+
+    Args:
+        start_date (datetime): required
+        end_date (datetime): required
+        symbol (str): required
+        window (int): required. Number of trading days (records) per window; at least 2.
+
+    Returns:
+        List[Dict[str, Any]]: The `date`, and the `KEYS` of each record, ordered by date. The
+            statistics are None while the window is not full; i.e. when the data starts less
+            than `window` records before `start_date`.
+    """
+    import numpy as np
+
+    start_date, end_date = as_date(start_date), as_date(end_date)
+    if READ_ENGINE == "memory":
+        (days, open_prices, close_prices, volumes), first = store.window(symbol, start_date, end_date, window)
+        if first == len(days):
+            return []
+        dates = list(map(date.fromordinal, days.tolist()))
+    else:
+        if not coverage.count(symbol, start_date, end_date):
+            return []
+        query = select(FinancialData.date, FinancialData.open_price, FinancialData.close_price, FinancialData.volume).where(
+            FinancialData.symbol == symbol,
+            FinancialData.date.between(coverage.lookback(symbol, start_date, window), end_date)
+        ).order_by(FinancialData.date)
+        rows = db.core.session.execute(query).all()
+        if not rows:
+            return []
+        dates, open_prices, close_prices, volumes = zip(*rows)
+        first = next((index for index, day in enumerate(dates) if day >= start_date), None)
+        if first is None:
+            # The coverage index was stale; the records are all before the range
+            return []
+    result = rolling(
+        np.asarray(open_prices, dtype=float), np.asarray(close_prices, dtype=float), np.asarray(volumes, dtype=float), window
+    )
+    columns = []
+    for key in KEYS:
+        values = result[key][first:]
+        # JSON has no NaN
+        column = values.astype(object)
+        column[np.isnan(values)] = None
+        columns.append(column.tolist())
+    return [dict(zip(["date", *KEYS], values)) for values in zip(dates[first:], *columns)]
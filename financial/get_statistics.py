@@ -1,14 +1,24 @@
 from lib.logging import Loggable
 from datetime import datetime
-from typing import Dict
-from model import FinancialData
-from conf.settings import MAX_BULK_OPERATIONS
-import pandas as pd
+from typing import Dict, List, Tuple
+from model import FinancialData, FinancialDataRollup
+from sqlalchemy.sql import func, and_, or_
+from conf.settings import STATISTICS_FROM_ROLLUPS, READ_ENGINE
+from financial import rollups
+from lib.utils import as_date
+from financial.coverage import coverage
+from financial.series_store import store
+from lib.generation import generations
+from lib.singleflight import SingleFlight
+from lib.metrics import CacheMetrics
 from app import cache
 
 
 @Loggable("get_statistics")
-@cache.memoize(50)
+# Identical concurrent calls wait for the first one, instead of all missing the cache
+@SingleFlight("get_statistics", namespace=generations.namespace)
+@CacheMetrics("get_statistics")
+@cache.memoize(50, make_name=generations.namespace)
 def main(
     start_date: datetime,
     end_date: datetime,
@@ -16,6 +26,12 @@ def main(
 ) -> Dict[str, float]:
     """Returns average daily statistics data of the target symbol
 
+    The averages are computed by the database; no records are loaded into the application.
+    Empty ranges are answered by the in-process date coverage index, without a query.
+    If `STATISTICS_FROM_ROLLUPS` is set, the fully covered months/years of the range are read
+    from the `financial_data_rollup` table, and only the partial edge days from the raw table.
+    With `READ_ENGINE=memory`, the averages are answered from the prefix sums of `store`.
+
     Args:
         start_date (datetime): required
         end_date (datetime): required
@@ -23,35 +39,78 @@ def main(
 
     Returns:
         Dict[str, float]: A Dictionary containing: {
-                "start_date": fields.Date
-                "end_date": fields.Date
-                "symbol": fields.String
                 "average_daily_open_price": fields.Float
                 "average_daily_close_price": fields.Float
                 "average_daily_volume": fields.Float
             }
+            or an empty dictionary, if there are no records in the range.
     """
-    cols = ['symbol', 'open_price', 'close_price', 'volume']
-    query = FinancialData.query.filter_by(symbol=symbol).filter(FinancialData.date.between(start_date, end_date))
-    if query.count() == 0:
+    start_date, end_date = as_date(start_date), as_date(end_date)
+    if READ_ENGINE == "memory":
+        return store.average(symbol, start_date, end_date)
+    if not coverage.count(symbol, start_date, end_date):
+        return {}
+    edges, months, years = rollups.split_range(start_date, end_date)
+    if not STATISTICS_FROM_ROLLUPS or not (months or years):
+        return average_raw(start_date, end_date, symbol)
+    return average([sum_raw(edges, symbol), sum_rollups(months, years, symbol)])
+
+
+def average(totals: List[Tuple]) -> Dict[str, float]:
+    """Averages the (sum open, sum close, sum volume, count) `totals` of the parts of a range."""
+    count = sum(total[3] or 0 for total in totals)
+    if not count:
         return {}
-    # TODO: Optimize the Database Call and Pandas Dataframe Creation/Concatenation
-    # The opeartor `.with_entities(*[getattr(FinancialData, col) for col in cols])` could
-    # be used to specify which columns to retrieve from DB, but in the `pd.concat(...)` part
-    # later on, this will cause an issue, as the results will not have a `.to_dict()` attribute
-    # and will be a list of tuples instead.
-    res = query.paginate(page=1, per_page=MAX_BULK_OPERATIONS)
-    avg_df = calc_mean(res, columns=cols)
-    avg_df.rename(columns={col: f"average_daily_{col}" for col in cols[1:]}, inplace=True)
-    return dict(avg_df.iloc[0])
-
-
-def calc_mean(paginated_items, columns) -> pd.DataFrame:
-    df = pd.DataFrame(columns=columns)
-    while paginated_items.items:
-        df = pd.concat([df, pd.DataFrame(map(lambda x: x.to_dict(), paginated_items.items), columns=columns)])
-        paginated_items = paginated_items.next()
-    # End while
-    df['volume'] = df['volume'].astype(float)
-    # breakpoint()
-    return df.groupby('symbol').agg('mean', numeric_only=True)
+    return {
+        "average_daily_open_price": sum(total[0] or 0 for total in totals) / count,
+        "average_daily_close_price": sum(total[1] or 0 for total in totals) / count,
+        "average_daily_volume": float(sum(total[2] or 0 for total in totals)) / count
+    }
+
+
+def average_raw(start_date: datetime, end_date: datetime, symbol: str) -> Dict[str, float]:
+    """Single grouped `AVG(...)` query over the raw records of the range."""
+    row = FinancialData.query.with_entities(
+        func.avg(FinancialData.open_price),
+        func.avg(FinancialData.close_price),
+        func.avg(FinancialData.volume),
+        func.count(FinancialData.id)
+    ).filter_by(symbol=symbol).filter(
+        FinancialData.date.between(start_date, end_date)
+    ).group_by(FinancialData.symbol).first()
+    if not row or not row[3]:
+        return {}
+    open_price, close_price, volume, _ = row
+    return {
+        "average_daily_open_price": float(open_price),
+        "average_daily_close_price": float(close_price),
+        "average_daily_volume": float(volume)
+    }
+
+
+def sum_raw(ranges: List[Tuple[datetime, datetime]], symbol: str) -> Tuple:
+    """Returns (sum open, sum close, sum volume, count) of the raw records within `ranges`."""
+    if not ranges:
+        return (0, 0, 0, 0)
+    return FinancialData.query.with_entities(
+        func.sum(FinancialData.open_price),
+        func.sum(FinancialData.close_price),
+        func.sum(FinancialData.volume),
+        func.count(FinancialData.id)
+    ).filter_by(symbol=symbol).filter(
+        or_(*[FinancialData.date.between(start, end) for start, end in ranges])
+    ).first()
+
+
+def sum_rollups(months: List[datetime], years: List[datetime], symbol: str) -> Tuple:
+    """Returns (sum open, sum close, sum volume, count) of the given full rollup buckets."""
+    periods = [
+        and_(FinancialDataRollup.granularity == granularity, FinancialDataRollup.period_start.in_(starts))
+        for granularity, starts in ((rollups.MONTH, months), (rollups.YEAR, years)) if starts
+    ]
+    return FinancialDataRollup.query.with_entities(
+        func.sum(FinancialDataRollup.sum_open_price),
+        func.sum(FinancialDataRollup.sum_close_price),
+        func.sum(FinancialDataRollup.sum_volume),
+        func.sum(FinancialDataRollup.count)
+    ).filter(FinancialDataRollup.symbol == symbol, or_(*periods)).first()
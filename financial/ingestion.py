@@ -0,0 +1,159 @@
+"""Incremental ingestion of the `financial_data` records.
+
+Each symbol has a high-water mark (`ingestion_watermark`): its last ingested date, and the
+content hashes of (`open_price`, `close_price`, `volume`) of its recently ingested rows.
+Before writing the fetched records of a symbol, `plan` compares them against these hashes,
+and only returns the new or revised ones; so unchanged rows are never rewritten (nor their
+`updated_at` bumped), which saves the write and the replication traffic of the database.
+
+Rows without a known hash (e.g. ingested before the watermarks existed, or older than
+`INGESTION_HASH_WINDOW_DAYS`) are compared against the stored rows instead.
+
+Functions:
+    - plan: Splits the fetched records of a symbol into new, revised and unchanged ones.
+    - plan_batch: Same as `plan`, for the column arrays of a `DailyTimeSeriesBatch`.
+    - record_rows: Advances the watermarks with a batch of written rows. Meant to be used as
+        a `bulk_upsert(..., after_batch=[...])` hook, so it runs in the same transaction.
+"""
+from model import FinancialData, IngestionWatermark
+from datetime import date, datetime, timedelta
+from hashlib import sha1
+from typing import Any, Dict, Iterable, List
+from sqlalchemy.orm import Session
+from lib.utils import as_date
+from financial.rollups import as_symbol_code
+from conf.settings import INGESTION_HASH_WINDOW_DAYS
+import json
+import struct
+
+
+def _as_stored(price: Any) -> str:
+    """The bytes of the `price` at the (single precision) storage precision of the price columns."""
+    return struct.pack("<f", float(price)).hex()
+
+
+def row_hash(open_price: Any, close_price: Any, volume: Any) -> str:
+    """Content hash of a row.
+
+    Prices are hashed as stored, so the values read back from the price columns hash the
+    same as the strings sent by the API.
+    """
+    return sha1(f"{_as_stored(open_price)}|{_as_stored(close_price)}|{int(volume)}".encode()).hexdigest()[:16]
+
+
+class IngestionReport:
+    """Number of the inserted, updated and skipped (unchanged) rows, per symbol."""
+    KINDS = ("inserted", "updated", "skipped")
+
+    def __init__(self):
+        self.counts: Dict[str, Dict[str, int]] = {}
+
+    def add(self, symbol: Any, kind: str, n: int = 1) -> None:
+        counts = self.counts.setdefault(as_symbol_code(symbol), dict.fromkeys(self.KINDS, 0))
+        counts[kind] += n
+
+    def totals(self) -> Dict[str, int]:
+        return {kind: sum(counts[kind] for counts in self.counts.values()) for kind in self.KINDS}
+
+    def changed_symbols(self) -> List[str]:
+        return [symbol for symbol, counts in self.counts.items() if counts["inserted"] or counts["updated"]]
+
+    def __str__(self) -> str:
+        lines = [f"{symbol}: " + ", ".join(f"{counts[k]} {k}" for k in self.KINDS) for symbol, counts in sorted(self.counts.items())]
+        totals = self.totals()
+        lines.append("Total: " + ", ".join(f"{totals[k]} {k}" for k in self.KINDS))
+        return "\n".join(lines)
+
+
+def _load_hashes(watermark: IngestionWatermark | None) -> Dict[str, str]:
+    return json.loads(watermark.row_hashes) if watermark else {}
+
+
+def known_hashes(session: Session, symbol: Any, dates: Iterable[date]) -> Dict[str, str]:
+    """Returns the content hashes of the already ingested rows of the `symbol`, by ISO date.
+
+    The hashes computed from the table are merged into the watermark (committed along with
+    the next write), so they are only computed once.
+    """
+    code = as_symbol_code(symbol)
+    watermark = session.get(IngestionWatermark, FinancialData.Symbols[code])
+    hashes = _load_hashes(watermark)
+    # Dates after the watermark are new; the others without a hash are looked up in the table
+    missing = {
+        day for day in dates
+        if day.isoformat() not in hashes and (watermark is None or day <= watermark.last_date)
+    }
+    if missing:
+        rows = session.query(
+            FinancialData.date, FinancialData.open_price, FinancialData.close_price, FinancialData.volume
+        ).filter(
+            FinancialData.symbol == code,
+            FinancialData.date.between(min(missing), max(missing))
+        )
+        found = {day: row_hash(*values) for day, *values in rows if day in missing}
+        if found:
+            hashes.update({day.isoformat(): h for day, h in found.items()})
+            _merge(session, code, found)
+    return hashes
+
+
+def _changed(session: Session, symbol: Any, dates: List[date], values: Iterable[tuple], report: IngestionReport) -> List[int]:
+    """Returns the indices of the new or revised rows, of the (`dates`, `values`) columns."""
+    if not dates:
+        return []
+    hashes = known_hashes(session, symbol, dates)
+    res = []
+    counts = dict.fromkeys(IngestionReport.KINDS, 0)
+    for i, (day, value) in enumerate(zip(dates, values)):
+        known = hashes.get(day.isoformat())
+        if known == row_hash(*value):
+            counts["skipped"] += 1
+            continue
+        counts["inserted" if known is None else "updated"] += 1
+        res.append(i)
+    for kind, n in counts.items():
+        report.add(symbol, kind, n)
+    return res
+
+
+def plan(session: Session, symbol: Any, objects: List[FinancialData], report: IngestionReport) -> List[FinancialData]:
+    """Returns the new or revised `objects` of the `symbol`, and counts all of them in the `report`."""
+    changed = _changed(
+        session, symbol, [as_date(obj.date) for obj in objects],
+        ((obj.open_price, obj.close_price, obj.volume) for obj in objects), report
+    )
+    return [objects[i] for i in changed]
+
+
+def plan_batch(session: Session, batch: Any, report: IngestionReport) -> Any:
+    """Same as `plan`, for a `DailyTimeSeriesBatch`; returns the batch of its new or revised rows."""
+    return batch.take(_changed(
+        session, batch.symbol, batch.dates, zip(batch.open_prices, batch.close_prices, batch.volumes), report
+    ))
+
+
+def _merge(session: Session, code: str, row_hashes: Dict[date, str]) -> None:
+    """Merges the hashes of the rows into the watermark of the symbol; and advances it."""
+    symbol = FinancialData.Symbols[code]
+    watermark = session.get(IngestionWatermark, symbol)
+    hashes = _load_hashes(watermark)
+    hashes.update({day.isoformat(): h for day, h in row_hashes.items()})
+    last_date = max(list(row_hashes) + ([watermark.last_date] if watermark else []))
+    oldest = (last_date - timedelta(days=INGESTION_HASH_WINDOW_DAYS)).isoformat()
+    if watermark is None:
+        watermark = IngestionWatermark(symbol=symbol)
+        session.add(watermark)
+    watermark.last_date = last_date
+    watermark.row_hashes = json.dumps({day: h for day, h in sorted(hashes.items()) if day >= oldest})
+    watermark.updated_at = datetime.now()
+
+
+def record_rows(session: Session, rows: List[Dict[str, Any]]) -> None:
+    """`bulk_upsert` hook; merges the hashes of the written `rows` into the watermarks."""
+    by_symbol: Dict[str, Dict[date, str]] = {}
+    for row in rows:
+        by_symbol.setdefault(as_symbol_code(row["symbol"]), {})[as_date(row["date"])] = row_hash(
+            row["open_price"], row["close_price"], row["volume"]
+        )
+    for code, row_hashes in by_symbol.items():
+        _merge(session, code, row_hashes)
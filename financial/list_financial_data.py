@@ -3,19 +3,48 @@ from typing import Optional, List, Tuple
 from datetime import datetime
 from lib.logging import Loggable
 from math import ceil
-from lib.exceptions import PageOutofBoundsError
+from lib.exceptions import PageOutofBoundsError, InvalidCursorError
+from financial.coverage import coverage
+from financial.series_store import Record, store
+from lib.generation import generations
+from lib.singleflight import SingleFlight
+from lib.metrics import CacheMetrics
+from app import cache
+from sqlalchemy.sql import and_, or_
+from conf.settings import DEFAULT_DATE_FMT, READ_ENGINE
+import base64
+import binascii
+import json
+
+# MySQL orders an ENUM column by the declaration order of its members, but compares it to a
+# string as a string. The keyset predicate of `seek` and its ORDER BY (on either backend, and
+# `store`) only agree while the members are declared in alphabetical order.
+assert [symbol.name for symbol in FinancialData.Symbols] == sorted(FinancialData.Symbols.as_set(codes_only=True)), \
+    "FinancialData.Symbols must be declared in alphabetical order"
+# The columns of the `Record`s of a page; which are memoized (and pickled into the shared cache)
+# rather than the ORM instances, with their session state.
+RECORD_COLUMNS = [getattr(FinancialData, name) for name in ["id", "symbol", "date", "open_price", "close_price", "volume"]]
 
 
 @Loggable("list_financial_data")
+# Identical concurrent calls wait for the first one, instead of all missing the cache
+@SingleFlight("list_financial_data", namespace=generations.namespace)
+@CacheMetrics("list_financial_data")
+@cache.memoize(50, make_name=generations.namespace)
 def main(
     limit: int,
     page: int,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     symbol: Optional[str] = None
-) -> Tuple[int, List[FinancialData]]:
+) -> Tuple[int, List[Record]]:
     """Returns a paginated list of financial data records saved in DB.
 
+    The total and the page bounds are answered by the in-process date coverage index;
+    only the page itself is fetched from the database, as plain `Record`s (column tuples).
+    Results are memoized per data generation.
+    With `READ_ENGINE=memory`, both are answered by `store` (ordered by `symbol`, `date`).
+
     Args:
         limit (int): required
         page (int): required
@@ -27,27 +56,108 @@ def main(
         PageOutofBoundsError: If the `page` argument is more than the max page, this will be raised.
 
     Returns:
-        Tuple[int, List[FinancialData]]: A tuple containing: {
+        Tuple[int, List[Record]]: A tuple containing: {
             total: Total number of records in the Database, matching the query,
-            data: Array of FinancialData records
+            data: Array of the records (with the attributes of FinancialData)
         }
     """
-    total = 0
-    paginated = {}
+    total = (store if READ_ENGINE == "memory" else coverage).count(symbol, start_date, end_date)
+    if total == 0:
+        return total, []
+    max_ = ceil(float(total) / limit)
+    if page > max_:
+        raise PageOutofBoundsError(asked=page, max_=max_)
+    if READ_ENGINE == "memory":
+        return total, store.records(symbol, start_date, end_date, offset=(page - 1) * limit, limit=limit)
     base_query = FinancialData.query
-    if base_query.count() == 0:
-        return 0, []
     if symbol:
         base_query = base_query.filter_by(symbol=symbol)
     if start_date:
         base_query = base_query.filter(FinancialData.date >= start_date)
     if end_date:
         base_query = base_query.filter(FinancialData.date <= end_date)
-    total = base_query.count()
-    if total == 0:
-        return total, []
-    max_ = ceil(float(total) / limit)
-    if page > max_:
-        raise PageOutofBoundsError(asked=page, max_=max_)
-    paginated = base_query.paginate(page=page, per_page=limit)
-    return total, paginated.items
+    paginated = base_query.with_entities(*RECORD_COLUMNS).paginate(page=page, per_page=limit, count=False)
+    return total, [Record(*row) for row in paginated.items]
+
+
+def encode_cursor(record: FinancialData) -> str:
+    """Returns the opaque cursor pointing right after the `record`."""
+    raw = json.dumps([record.symbol.name, record.date.strftime(DEFAULT_DATE_FMT), record.id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, datetime, int]:
+    """Reverse of `encode_cursor`.
+
+    Raises:
+        InvalidCursorError: If the `cursor` is not a valid cursor.
+    """
+    try:
+        symbol, date, id_ = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        FinancialData.is_symbol_valid(symbol)
+        return symbol, datetime.strptime(date, DEFAULT_DATE_FMT).date(), int(id_)
+    except (ValueError, TypeError, binascii.Error):
+        raise InvalidCursorError(cursor)
+
+
+@Loggable("list_financial_data")
+# Not memoized; so only coalesced within the process
+@SingleFlight("seek_financial_data", namespace=generations.namespace, cross_process=False)
+def seek(
+    limit: int,
+    cursor: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    symbol: Optional[str] = None
+) -> Tuple[List[FinancialData], Optional[str]]:
+    """Returns a cursor-paginated (keyset) list of financial data records saved in DB.
+
+    Records are ordered by (`symbol`, `date`). Instead of skipping `OFFSET` rows, the next
+    page seeks past the last returned (symbol, date) on `unique_symbol_per_date_index`, and no
+    count is run; so the cost of a page does not depend on how deep it is. The symbols are
+    compared as strings; which matches the index order, as they are declared alphabetically.
+
+    Args:
+        limit (int): required
+        cursor (Optional[str], optional): The `next_cursor` of the previous page. Defaults to None (first page).
+        start_date (Optional[datetime], optional): Defaults to None.
+        end_date (Optional[datetime], optional): Defaults to None.
+        symbol (Optional[str], optional): Defaults to None. If None, all symbols will be targeted.
+
+    Raises:
+        InvalidCursorError: If the `cursor` could not be decoded.
+
+    Returns:
+        Tuple[List[FinancialData], Optional[str]]: A tuple containing: {
+            data: Array of FinancialData records,
+            next_cursor: Cursor of the next page, or None if this is the last page
+        }
+    """
+    if READ_ENGINE == "memory":
+        after = decode_cursor(cursor)[:2] if cursor else None
+        items = store.records(symbol, start_date, end_date, limit=limit + 1, after=after)
+        if len(items) <= limit:
+            return items, None
+        items = items[:limit]
+        return items, encode_cursor(items[-1])
+    base_query = FinancialData.query
+    if symbol:
+        base_query = base_query.filter_by(symbol=symbol)
+    if start_date:
+        base_query = base_query.filter(FinancialData.date >= start_date)
+    if end_date:
+        base_query = base_query.filter(FinancialData.date <= end_date)
+    if cursor:
+        last_symbol, last_date, _ = decode_cursor(cursor)
+        if symbol:
+            base_query = base_query.filter(FinancialData.date > last_date)
+        else:
+            base_query = base_query.filter(or_(
+                FinancialData.symbol > last_symbol,
+                and_(FinancialData.symbol == last_symbol, FinancialData.date > last_date)
+            ))
+    items = base_query.order_by(FinancialData.symbol, FinancialData.date).limit(limit + 1).all()
+    if len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    return items, encode_cursor(items[-1])
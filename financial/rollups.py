@@ -0,0 +1,231 @@
+"""Maintenance of the `financial_data_rollup` table.
+
+The rollup table keeps per-symbol monthly and yearly sums (and counts) of `open_price`,
+`close_price` and `volume`. A date range can then be answered from a handful of full-bucket
+rows, plus the raw records of the partial months at its edges (see `split_range`).
+
+Functions:
+    - refresh_rows: Recomputes the buckets touched by a batch of upserted rows. Meant to be
+        used as a `bulk_upsert(..., after_batch=[...])` hook, so it runs in the same transaction.
+    - rebuild: Recomputes the whole table from `financial_data`.
+    - check_consistency: Compares the table against `financial_data`.
+"""
+from app import db
+from model import FinancialData, FinancialDataRollup
+from calendar import monthrange
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Tuple, Any, Optional
+from lib.utils import as_date
+from sqlalchemy.orm import Session
+
+MONTH = FinancialDataRollup.Granularity.MONTH
+YEAR = FinancialDataRollup.Granularity.YEAR
+# A rollup sum is considered consistent with the raw table, if it differs less than this.
+SUM_TOLERANCE = 1e-6
+
+
+def as_symbol_code(symbol: Any) -> str:
+    return symbol if isinstance(symbol, str) else symbol.name
+
+
+def month_end(d: date) -> date:
+    return date(d.year, d.month, monthrange(d.year, d.month)[1])
+
+
+def bucket_start(granularity: FinancialDataRollup.Granularity, d: date) -> date:
+    return date(d.year, 1, 1) if granularity == YEAR else date(d.year, d.month, 1)
+
+
+def split_range(start_date: date, end_date: date) -> Tuple[List[Tuple[date, date]], List[date], List[date]]:
+    """Splits the inclusive range into the raw edge ranges, full months and full years.
+
+    Returns:
+        Tuple: (edges, months, years). `edges` are (start, end) ranges that do not cover a
+            whole month; `months` and `years` are the `period_start` of the fully covered buckets.
+    """
+    edges, months, years = [], [], []
+    cursor = start_date
+    while cursor <= end_date:
+        if cursor.month == 1 and cursor.day == 1 and date(cursor.year, 12, 31) <= end_date:
+            years.append(cursor)
+            cursor = date(cursor.year + 1, 1, 1)
+        elif cursor.day == 1 and month_end(cursor) <= end_date:
+            months.append(cursor)
+            cursor = month_end(cursor) + timedelta(days=1)
+        else:
+            last = min(month_end(cursor), end_date)
+            edges.append((cursor, last))
+            cursor = last + timedelta(days=1)
+    return edges, months, years
+
+
+class _Totals:
+    """Accumulates the sums and count of a bucket."""
+    __slots__ = ("sum_open_price", "sum_close_price", "sum_volume", "count")
+
+    def __init__(self):
+        self.sum_open_price = 0.0
+        self.sum_close_price = 0.0
+        self.sum_volume = 0
+        self.count = 0
+
+    def add(self, open_price: float, close_price: float, volume: int) -> None:
+        self.sum_open_price += open_price
+        self.sum_close_price += close_price
+        self.sum_volume += volume
+        self.count += 1
+
+    def as_row(self, symbol: str, granularity: FinancialDataRollup.Granularity, period_start: date, now: datetime) -> Dict[str, Any]:
+        return {
+            "symbol": symbol,
+            "granularity": granularity,
+            "period_start": period_start,
+            "sum_open_price": self.sum_open_price,
+            "sum_close_price": self.sum_close_price,
+            "sum_volume": self.sum_volume,
+            "count": self.count,
+            "updated_at": now
+        }
+
+
+def _aggregate_raw(session: Session, symbol: str, start_date: Optional[date] = None, end_date: Optional[date] = None) -> Dict[Tuple, _Totals]:
+    """Returns the monthly and yearly totals of the raw records, in one pass over them."""
+    buckets = defaultdict(_Totals)
+    query = session.query(
+        FinancialData.date, FinancialData.open_price, FinancialData.close_price, FinancialData.volume
+    ).filter(FinancialData.symbol == symbol)
+    if start_date and end_date:
+        query = query.filter(FinancialData.date.between(start_date, end_date))
+    for day, open_price, close_price, volume in query.yield_per(1000):
+        buckets[(MONTH, bucket_start(MONTH, day))].add(open_price, close_price, volume)
+        buckets[(YEAR, bucket_start(YEAR, day))].add(open_price, close_price, volume)
+    return buckets
+
+
+def _write(session: Session, symbol: str, buckets: Dict[Tuple, _Totals]) -> None:
+    if not buckets:
+        return
+    now = datetime.now()
+    keys = [key for key in FinancialDataRollup.__table__.columns.keys() if key != "id"]
+    stmt = db.upsert_statement(
+        FinancialDataRollup,
+        update_keys=[key for key in keys if key not in FinancialDataRollup.upsert_index_keys()]
+    )
+    session.execute(stmt, [totals.as_row(symbol, *key, now) for key, totals in buckets.items()])
+
+
+def _month_runs(months: Iterable[date]) -> List[Tuple[date, date]]:
+    """Groups the month starts into (first day, last day) ranges of consecutive months."""
+    runs = []
+    for month in sorted(months):
+        if runs and month == runs[-1][1] + timedelta(days=1):
+            runs[-1] = (runs[-1][0], month_end(month))
+        else:
+            runs.append((month, month_end(month)))
+    return runs
+
+
+def refresh(session: Session, symbol_dates: Dict[str, Iterable[date]]) -> None:
+    """Recomputes the month buckets that contain one of the given dates, and their years.
+
+    Only the touched months are recomputed from the raw records; their years are then summed
+    from the (at most 12) month buckets of each, so both granularities stay consistent with
+    each other, and a batch costs the size of its months rather than of its years.
+    """
+    for symbol, dates in symbol_dates.items():
+        months = {bucket_start(MONTH, as_date(d)) for d in dates}
+        if not months:
+            continue
+        symbol = as_symbol_code(symbol)
+        buckets = {}
+        for start_date, end_date in _month_runs(months):
+            buckets.update(_aggregate_raw(session, symbol, start_date, end_date))
+            session.query(FinancialDataRollup).filter(
+                FinancialDataRollup.symbol == symbol,
+                FinancialDataRollup.granularity == MONTH,
+                FinancialDataRollup.period_start.between(start_date, end_date)
+            ).delete(synchronize_session=False)
+        _write(session, symbol, {key: totals for key, totals in buckets.items() if key[0] == MONTH})
+        _refresh_years(session, symbol, {month.year for month in months})
+
+
+def _refresh_years(session: Session, symbol: str, years: Iterable[int]) -> None:
+    """Recomputes the year buckets of the `symbol` from its month buckets."""
+    years = sorted(years)
+    start_date, end_date = date(years[0], 1, 1), date(years[-1], 12, 31)
+    buckets = defaultdict(_Totals)
+    for row in session.query(FinancialDataRollup).filter(
+        FinancialDataRollup.symbol == symbol,
+        FinancialDataRollup.granularity == MONTH,
+        FinancialDataRollup.period_start.between(start_date, end_date)
+    ):
+        if row.period_start.year in years:
+            totals = buckets[(YEAR, bucket_start(YEAR, row.period_start))]
+            totals.sum_open_price += row.sum_open_price
+            totals.sum_close_price += row.sum_close_price
+            totals.sum_volume += row.sum_volume
+            totals.count += row.count
+    session.query(FinancialDataRollup).filter(
+        FinancialDataRollup.symbol == symbol,
+        FinancialDataRollup.granularity == YEAR,
+        FinancialDataRollup.period_start.in_([date(year, 1, 1) for year in years])
+    ).delete(synchronize_session=False)
+    _write(session, symbol, buckets)
+
+
+def refresh_rows(session: Session, rows: List[Dict[str, Any]]) -> None:
+    """`bulk_upsert` hook; refreshes the buckets of the upserted `rows`."""
+    symbol_dates = defaultdict(set)
+    for row in rows:
+        symbol_dates[as_symbol_code(row["symbol"])].add(as_date(row["date"]))
+    refresh(session, symbol_dates)
+
+
+def rebuild() -> int:
+    """Recomputes the whole rollup table from `financial_data`.
+
+    Returns:
+        int: Number of rollup rows written.
+    """
+    written = 0
+    with db.graceful_session_handler():
+        session = db.session
+        session.query(FinancialDataRollup).delete(synchronize_session=False)
+        for symbol in FinancialData.Symbols.as_set(codes_only=True):
+            buckets = _aggregate_raw(session, symbol)
+            _write(session, symbol, buckets)
+            written += len(buckets)
+        db.submit_transaction()
+    return written
+
+
+def check_consistency() -> List[str]:
+    """Compares the rollup table against the sums/counts of `financial_data`.
+
+    Returns:
+        List[str]: A description of every missing, unexpected or mismatching bucket. Empty
+            if the rollup table is consistent.
+    """
+    problems = []
+    with db.graceful_session_handler():
+        session = db.session
+        for symbol in sorted(FinancialData.Symbols.as_set(codes_only=True)):
+            expected = _aggregate_raw(session, symbol)
+            actual = {
+                (row.granularity, row.period_start): row
+                for row in session.query(FinancialDataRollup).filter(FinancialDataRollup.symbol == symbol)
+            }
+            for key in sorted(expected.keys() | actual.keys(), key=lambda k: (k[0].value, k[1])):
+                label = f"{symbol} {key[0].name} {key[1]}"
+                if key not in actual:
+                    problems.append(f"{label}: missing")
+                elif key not in expected:
+                    problems.append(f"{label}: unexpected")
+                else:
+                    want, got = expected[key], actual[key]
+                    if (want.count != got.count or want.sum_volume != got.sum_volume or
+                            abs(want.sum_open_price - got.sum_open_price) > SUM_TOLERANCE * max(1.0, abs(want.sum_open_price)) or
+                            abs(want.sum_close_price - got.sum_close_price) > SUM_TOLERANCE * max(1.0, abs(want.sum_close_price))):
+                        problems.append(f"{label}: mismatch")
+    return problems
@@ -0,0 +1,264 @@
+"""In-memory, columnar read engine of the financial data records (`READ_ENGINE=memory`).
+
+Each symbol is held as date-sorted NumPy arrays (ids, day numbers, open/close prices and
+volumes), plus the prefix sums of the prices and volumes. So:
+    - the records of a date range are located by two binary searches (`searchsorted`), and a
+        page of records is a slice of the arrays;
+    - the averages of a range are differences of two prefix sums, divided by the count;
+both in O(log n), without a database round trip.
+
+A symbol is loaded on first use (or by `build`, at startup), and reloaded when its data
+generation changed (i.e. after an ingestion). Only the records updated since the previous
+load are fetched; they are appended if they all come after the last loaded day (and the
+count adds up), otherwise the symbol is loaded again. Either way, a new `SymbolSeries`
+replaces the previous one as a whole, so concurrent readers never see a partial update.
+
+NumPy is imported on first use; it is not needed with `READ_ENGINE=db`.
+
+Example:
+    store.count("IBM", start_date, end_date)                # => number of records
+    store.average("IBM", start_date, end_date)              # => as `get_statistics.main`
+    store.records("IBM", start_date, end_date, 0, 5)        # => the first page
+"""
+from datetime import date, datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from sqlalchemy import func, select
+from app import db
+from model import FinancialData
+from lib.generation import DataGeneration, generations as default_generations
+from lib.utils import as_date
+import threading
+
+SYMBOLS = sorted(FinancialData.Symbols.as_set(codes_only=True))
+COLUMNS = ["id", "date", "open_price", "close_price", "volume", "updated_at"]
+
+
+class Record(NamedTuple):
+    """A financial data record, served from memory; has the attributes of `FinancialData`."""
+    id: int
+    symbol: FinancialData.Symbols
+    date: date
+    open_price: float
+    close_price: float
+    volume: int
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
+class SymbolSeries(NamedTuple):
+    generation: int
+    # The latest `updated_at` of the records; where the next (incremental) load starts
+    updated_at: Optional[datetime]
+    ids: Any
+    # `date.toordinal()` of the records, sorted
+    days: Any
+    open_prices: Any
+    close_prices: Any
+    volumes: Any
+    # Prefix sums; the sum of the records [lo, hi) is `sums[hi] - sums[lo]`
+    open_sums: Any
+    close_sums: Any
+    volume_sums: Any
+
+    @property
+    def size(self) -> int:
+        return len(self.days)
+
+    def bounds(self, start_date: Optional[date] = None, end_date: Optional[date] = None) -> Tuple[int, int]:
+        """Returns the [lo, hi) indices of the records within the (inclusive) range."""
+        lo = int(self.days.searchsorted(start_date.toordinal(), "left")) if start_date else 0
+        hi = int(self.days.searchsorted(end_date.toordinal(), "right")) if end_date else self.size
+        return lo, max(lo, hi)
+
+
+def _prefix_sums(values, dtype, start=0):
+    import numpy as np
+
+    sums = np.empty(len(values) + 1, dtype=dtype)
+    sums[0] = start
+    np.cumsum(values, out=sums[1:])
+    sums[1:] += start
+    return sums
+
+
+def _columns(rows: List[Tuple]) -> Tuple:
+    """Returns the (ids, days, open prices, close prices, volumes, latest updated_at) of the rows."""
+    import numpy as np
+
+    if not rows:
+        empty = np.empty(0)
+        return empty.astype(np.int64), empty.astype(np.int64), empty, empty, empty.astype(np.int64), None
+    ids, dates, open_prices, close_prices, volumes, updated_at = zip(*rows)
+    return (
+        np.array(ids, dtype=np.int64),
+        np.fromiter(map(date.toordinal, dates), dtype=np.int64, count=len(dates)),
+        np.array(open_prices, dtype=np.float64),
+        np.array(close_prices, dtype=np.float64),
+        np.array(volumes, dtype=np.int64),
+        max(updated_at)
+    )
+
+
+class TimeSeriesStore:
+    def __init__(self, generations: DataGeneration = default_generations):
+        self.generations = generations
+        self.loads = 0
+        self.appends = 0
+        self._series: Dict[str, SymbolSeries] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _query(symbol: str, updated_since: Optional[datetime] = None):
+        query = select(*(getattr(FinancialData, column) for column in COLUMNS)).where(FinancialData.symbol == symbol)
+        if updated_since is not None:
+            # Inclusive; records of the same instant may have been committed after the last load
+            query = query.where(FinancialData.updated_at >= updated_since)
+        return query.order_by(FinancialData.date)
+
+    def _load(self, symbol: str, generation: int) -> SymbolSeries:
+        ids, days, open_prices, close_prices, volumes, updated_at = _columns(db.core.session.execute(self._query(symbol)).all())
+        self.loads += 1
+        return SymbolSeries(
+            generation, updated_at, ids, days, open_prices, close_prices, volumes,
+            _prefix_sums(open_prices, "f8"), _prefix_sums(close_prices, "f8"), _prefix_sums(volumes, "i8")
+        )
+
+    def _append(self, symbol: str, series: SymbolSeries, generation: int) -> Optional[SymbolSeries]:
+        """Returns `series` with the records updated since it was loaded; or None, if they are not
+        all new days after its last one."""
+        import numpy as np
+
+        ids, days, open_prices, close_prices, volumes, updated_at = _columns(
+            db.core.session.execute(self._query(symbol, series.updated_at)).all()
+        )
+        # The records updated at the very instant of the last load are fetched again; they must be unchanged
+        known = np.isin(ids, series.ids)
+        if known.any():
+            order = np.argsort(series.ids)
+            at = order[np.searchsorted(series.ids, ids[known], sorter=order)]
+            if not (
+                np.array_equal(series.days[at], days[known]) and np.array_equal(series.volumes[at], volumes[known]) and
+                np.array_equal(series.open_prices[at], open_prices[known]) and np.array_equal(series.close_prices[at], close_prices[known])
+            ):
+                return None
+            ids, days, open_prices, close_prices, volumes = (values[~known] for values in (ids, days, open_prices, close_prices, volumes))
+        if len(days) and series.size and days[0] <= series.days[-1]:
+            return None
+        # Deleted records, or ones committed with an older `updated_at`
+        count = db.core.session.execute(select(func.count(FinancialData.id)).where(FinancialData.symbol == symbol)).scalar()
+        if count != series.size + len(ids):
+            return None
+        self.appends += 1
+        return SymbolSeries(
+            generation, max(filter(None, [series.updated_at, updated_at]), default=None),
+            np.concatenate([series.ids, ids]), np.concatenate([series.days, days]),
+            np.concatenate([series.open_prices, open_prices]), np.concatenate([series.close_prices, close_prices]),
+            np.concatenate([series.volumes, volumes]),
+            np.concatenate([series.open_sums, _prefix_sums(open_prices, "f8", series.open_sums[-1])[1:]]),
+            np.concatenate([series.close_sums, _prefix_sums(close_prices, "f8", series.close_sums[-1])[1:]]),
+            np.concatenate([series.volume_sums, _prefix_sums(volumes, "i8", series.volume_sums[-1])[1:]])
+        )
+
+    def series(self, symbol: str) -> SymbolSeries:
+        """Returns the (current) series of the `symbol`. Requires an application context."""
+        code = symbol if isinstance(symbol, str) else symbol.name
+        generation = self.generations.get(code)
+        series = self._series.get(code)
+        if series is not None and series.generation == generation:
+            return series
+        with self._lock:
+            series = self._series.get(code)
+            if series is None or series.generation != generation:
+                series = (series is not None and self._append(code, series, generation)) or self._load(code, generation)
+                # Swapped as a whole
+                self._series[code] = series
+        return series
+
+    def build(self) -> None:
+        """Loads every symbol. Requires an application context."""
+        for symbol in SYMBOLS:
+            self.series(symbol)
+
+    def count(
+        self,
+        symbol: Optional[str] = None,
+        start_date: Optional[date | datetime | str] = None,
+        end_date: Optional[date | datetime | str] = None
+    ) -> int:
+        """Returns the number of records of the `symbol` (or all symbols) within the range."""
+        start_date, end_date = as_date(start_date) if start_date else None, as_date(end_date) if end_date else None
+        total = 0
+        for code in [symbol] if symbol else SYMBOLS:
+            lo, hi = self.series(code).bounds(start_date, end_date)
+            total += hi - lo
+        return total
+
+    def average(self, symbol: str, start_date: date | datetime | str, end_date: date | datetime | str) -> Dict[str, float]:
+        """Returns the average daily statistics of the range; as `get_statistics.main`."""
+        series = self.series(symbol)
+        lo, hi = series.bounds(as_date(start_date), as_date(end_date))
+        count = hi - lo
+        if not count:
+            return {}
+        return {
+            "average_daily_open_price": float(series.open_sums[hi] - series.open_sums[lo]) / count,
+            "average_daily_close_price": float(series.close_sums[hi] - series.close_sums[lo]) / count,
+            "average_daily_volume": float(series.volume_sums[hi] - series.volume_sums[lo]) / count
+        }
+
+    def window(self, symbol: str, start_date: date | datetime | str, end_date: date | datetime | str, lookback: int) -> Tuple:
+        """Returns the (days, open prices, close prices, volumes) arrays of the range, and of the
+        `lookback` records before it; and the index of the first record of the range in them."""
+        series = self.series(symbol)
+        lo, hi = series.bounds(as_date(start_date), as_date(end_date))
+        first = max(lo - lookback, 0)
+        return (
+            series.days[first:hi], series.open_prices[first:hi], series.close_prices[first:hi], series.volumes[first:hi]
+        ), lo - first
+
+    def records(
+        self,
+        symbol: Optional[str] = None,
+        start_date: Optional[date | datetime | str] = None,
+        end_date: Optional[date | datetime | str] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[str, date]] = None
+    ) -> List[Record]:
+        """Returns the records of the `symbol` (or all symbols) within the range, ordered by
+        (`symbol`, `date`); skipping the first `offset` ones, or the ones up to the (symbol, date)
+        `after` (of a cursor)."""
+        start_date, end_date = as_date(start_date) if start_date else None, as_date(end_date) if end_date else None
+        records = []
+        for code in [symbol] if symbol else SYMBOLS:
+            if limit is not None and len(records) >= limit:
+                break
+            if after and code < after[0]:
+                continue
+            series = self.series(code)
+            lo, hi = series.bounds(start_date, end_date)
+            if after and code == after[0]:
+                lo = max(lo, int(series.days.searchsorted(after[1].toordinal(), "right")))
+            if offset >= hi - lo:
+                # The offset continues in the next symbol
+                offset -= max(hi - lo, 0)
+                continue
+            lo, offset = lo + offset, 0
+            if limit is not None:
+                hi = min(hi, lo + limit - len(records))
+            records += self._records(code, series, lo, hi)
+        return records
+
+    @staticmethod
+    def _records(code: str, series: SymbolSeries, lo: int, hi: int) -> List[Record]:
+        symbol = FinancialData.Symbols[code]
+        return [
+            Record(id_, symbol, date.fromordinal(day), open_price, close_price, volume)
+            for id_, day, open_price, close_price, volume in zip(
+                series.ids[lo:hi].tolist(), series.days[lo:hi].tolist(), series.open_prices[lo:hi].tolist(),
+                series.close_prices[lo:hi].tolist(), series.volumes[lo:hi].tolist()
+            )
+        ]
+
+
+store = TimeSeriesStore()
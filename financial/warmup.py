@@ -0,0 +1,160 @@
+"""Post-ingestion cache pre-warming.
+
+The API views record the shape of each request (`recorder.record`): the endpoint and its
+arguments, where dates are kept relative to the day of the request (e.g. "the last 14
+days"). Each process periodically flushes its counts to `WARMUP_SHAPES_DIR`; only its most
+requested shapes are kept (`MAX_SHAPES`), so the counts stay bounded whatever the clients send.
+
+After an ingestion, `prewarm` merges the recent counts of all the processes, adds the
+default hot shapes (the last 14 days and the first page of each symbol), and calls the memoized services for the top shapes,
+so their results are in the shared (L2) cache before the API workers see the new data
+generation (see `DataGeneration.pending`). Warming stops once `WARMUP_BUDGET_SECONDS` is spent.
+"""
+from collections import Counter
+from datetime import date, datetime, time as dtime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from model import FinancialData
+from financial.get_statistics import main as get_statistics
+from financial.list_financial_data import main as list_financial_data
+from lib.utils import as_date
+from conf.settings import WARMUP_SHAPES_DIR, WARMUP_FLUSH_SECONDS, WARMUP_SHAPES_MAX_AGE_SECONDS, WARMUP_TOP_N, WARMUP_BUDGET_SECONDS
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("warmup")
+DATE_ARGS = ("start_date", "end_date")
+# The memoized services, by the endpoint names of the recorded shapes
+SERVICES = {"statistics": get_statistics, "financial_data": list_financial_data}
+# Shapes kept per process; a margin over the `WARMUP_TOP_N` warmed ones, so the shapes that are
+# popular across the processes survive the trimming of each of them.
+MAX_SHAPES = 10 * WARMUP_TOP_N
+
+
+def _default_shapes() -> List[Dict[str, Any]]:
+    shapes = []
+    for symbol in sorted(FinancialData.Symbols.as_set(codes_only=True)):
+        shapes.append({"endpoint": "statistics", "symbol": symbol, "start_date": -14, "end_date": 0})
+        shapes.append({"endpoint": "financial_data", "symbol": symbol, "start_date": -14, "limit": 5, "page": 1})
+    shapes.append({"endpoint": "financial_data", "limit": 5, "page": 1})
+    return shapes
+
+
+class ShapeRecorder:
+    """Counts the (date-relative) shapes of the requests of this process; its `max_shapes` most
+    requested ones, after each flush (and at most twice as many in between)."""
+    def __init__(self, directory: str = WARMUP_SHAPES_DIR, flush_seconds: float = WARMUP_FLUSH_SECONDS, max_shapes: int = MAX_SHAPES):
+        self.directory = Path(directory)
+        self.flush_seconds = flush_seconds
+        self.max_shapes = max_shapes
+        self.counts: Counter = Counter()
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(endpoint: str, kwargs: Dict[str, Any], today: Optional[date] = None) -> str:
+        today = today or date.today()
+        shape = {"endpoint": endpoint}
+        for key, value in kwargs.items():
+            if value is None:
+                continue
+            shape[key] = (as_date(value) - today).days if key in DATE_ARGS else value
+        return json.dumps(shape, sort_keys=True)
+
+    def record(self, endpoint: str, kwargs: Dict[str, Any]) -> None:
+        key = self.normalize(endpoint, kwargs)
+        with self._lock:
+            self.counts[key] += 1
+            if len(self.counts) > 2 * self.max_shapes:
+                self._trim()
+            due = time.monotonic() - self._flushed_at >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def _trim(self) -> None:
+        """Keeps the `max_shapes` most requested shapes; called under `_lock`."""
+        self.counts = Counter(dict(self.counts.most_common(self.max_shapes)))
+
+    def flush(self) -> None:
+        with self._lock:
+            self._trim()
+            counts = dict(self.counts)
+            self._flushed_at = time.monotonic()
+        if not counts:
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = self.directory / f".{os.getpid()}.json"
+            tmp.write_text(json.dumps(counts))
+            os.replace(tmp, self.directory / f"{os.getpid()}.json")
+        except OSError as e:
+            logger.warning(f"Could not flush request shapes: {e}")
+
+    def top(self, n: int = WARMUP_TOP_N, max_age: float = WARMUP_SHAPES_MAX_AGE_SECONDS) -> List[Dict[str, Any]]:
+        """Returns the `n` most requested shapes of the recent processes, after the default ones."""
+        counts: Counter = Counter()
+        for path in self.directory.glob("*.json"):
+            try:
+                if time.time() - path.stat().st_mtime > max_age:
+                    path.unlink(missing_ok=True)
+                    continue
+                counts.update(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+        shapes = _default_shapes()
+        seen = {json.dumps(shape, sort_keys=True) for shape in shapes}
+        shapes += [json.loads(key) for key, _ in counts.most_common() if key not in seen]
+        return shapes[:max(n, len(seen))]
+
+
+def resolve(shape: Dict[str, Any], today: Optional[date] = None) -> Dict[str, Any]:
+    """Reverse of `ShapeRecorder.normalize`; returns the service arguments of the shape.
+
+    Dates are returned as `datetime`s (like `inputs.date` parses them), so the memoize keys
+    match the ones of the API requests.
+    """
+    today = datetime.combine(today or date.today(), dtime())
+    kwargs = {key: value for key, value in shape.items() if key != "endpoint"}
+    for key in DATE_ARGS:
+        if key in kwargs:
+            kwargs[key] = today + timedelta(days=kwargs[key])
+    return kwargs
+
+
+def prewarm(
+    services: Optional[Dict[str, Callable]] = None,
+    shapes: Optional[List[Dict[str, Any]]] = None,
+    budget: float = WARMUP_BUDGET_SECONDS
+) -> int:
+    """Calls the memoized `services` (by endpoint; defaults to `SERVICES`) for the top request shapes.
+
+    Requires an application context. Errors of a single shape (e.g. out of bounds pages)
+    are ignored.
+
+    Returns:
+        int: Number of warmed shapes.
+    """
+    services = services or SERVICES
+    deadline = time.monotonic() + budget
+    warmed = 0
+    for shape in shapes if shapes is not None else recorder.top():
+        if time.monotonic() >= deadline:
+            logger.info(f"Warm-up budget of {budget}s spent after {warmed} shapes")
+            break
+        service = services.get(shape.get("endpoint"))
+        if not service:
+            continue
+        try:
+            service(**resolve(shape))
+            warmed += 1
+        except Exception as e:
+            logger.info(f"Skipped warming {shape}: {e}")
+    return warmed
+
+
+recorder = ShapeRecorder()
+atexit.register(recorder.flush)
@@ -1,15 +1,30 @@
 """Script for calling the AlphaVantageAPI and save the results to the Database.
 
-Run the script using `python get_raw_data.py`.
+Run the script using `python get_raw_data.py [--replay] [--as-of 2023-06-02]`:
+    - replay: Ingest the responses cached by earlier runs (see `lib/response_cache.py`), without
+        any request to the API (nor an `api_key`).
+    - as-of: The day to fetch (or replay) the last 2 weeks of; today by default.
+
+The raw responses are cached on disk, so a run repeated within `RESPONSE_CACHE_TTL_SECONDS`
+(e.g. after a failure) does not download them again.
 
 Raises:
     - ApiKeyNotFoundError: If the `api_key` file is missing from `conf/api_key` path
 """
 from lib.exceptions import ApiKeyNotFoundError
 from lib.avantage_api import AlphaVantageAPI
+from lib.response_cache import ResponseCache
 from lib.logging import BasicErrorHandler
-from app import db, app as application
+from app import db, create_app
 from model import FinancialData
+from financial import ingestion, rollups, warmup
+from lib.generation import generations
+from lib import metrics
+from datetime import date
+from typing import Optional
+import argparse
+
+application = create_app()
 
 
 @BasicErrorHandler(package_name="get_raw_data", expectedErrClass=FileNotFoundError, rethrow_as=ApiKeyNotFoundError)
@@ -18,17 +33,35 @@ def get_api_key():
         return f.read()
 
 
-def execute():
-    API_KEY = get_api_key()
-    client = AlphaVantageAPI(api_key=API_KEY)
+def execute(replay: bool = False, as_of: Optional[date] = None) -> ingestion.IngestionReport:
+    API_KEY = "" if replay else get_api_key()
+    client = AlphaVantageAPI(api_key=API_KEY, cache=ResponseCache(), replay=replay, as_of=as_of)
+    report = ingestion.IngestionReport()
 
     with application.app_context():
-        for symbol in AlphaVantageAPI.VALID_SYMBOLS:
-            db.bulk_upsert(
+        # Fetched concurrently; written by this thread, as each symbol arrives
+        for symbol, batch in client.fetch_biweekly_data(AlphaVantageAPI.VALID_SYMBOLS):
+            # Only the new or revised rows are written; straight from the column arrays
+            db.bulk_upsert_rows(
                 cls=FinancialData,
-                objects=client.get_biweekly_data(symbol)
+                rows=ingestion.plan_batch(db.core.session, batch, report).rows(),
+                after_batch=[rollups.refresh_rows, ingestion.record_rows]
             )
+        changed = report.changed_symbols()
+        if changed:
+            # Fill the shared cache for the hot query shapes of the next generation, before
+            # bumping it; so the API workers start on a warm cache.
+            with generations.pending(changed):
+                warmup.prewarm()
+            # After the commits; so whoever sees the new generation, also sees the new data
+            generations.bump(changed)
+    metrics.record_ingestion(report)
+    return report
 
 
 if __name__ == '__main__':
-    execute()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replay", action="store_true")
+    parser.add_argument("--as-of", type=date.fromisoformat)
+    args = parser.parse_args()
+    print(execute(args.replay, args.as_of))
@@ -1,11 +1,25 @@
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from model import FinancialData
-from app import cache
 from .logging import Loggable
-from .exceptions import SymbolUndefinedError
-from datetime import datetime, timedelta
-from typing import Optional, List, Dict
-from conf.settings import DEFAULT_DATE_FMT
+from .exceptions import SymbolUndefinedError, ApiThrottledError, ResponseNotCachedError
+from .ratelimit import TokenBucket
+from .jsonstream import iter_object_items
+from .response_cache import ResponseCache, ResponseKey
+from array import array
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Optional, List, Dict, Iterable, Iterator, Tuple, Any, Sequence, BinaryIO
+from conf.settings import (
+    DEFAULT_DATE_FMT, AVANTAGE_BASE_URL, AVANTAGE_CALLS_PER_MINUTE, AVANTAGE_MAX_WORKERS,
+    AVANTAGE_TIMEOUT_SECONDS, AVANTAGE_MAX_RETRIES, AVANTAGE_BACKOFF_SECONDS, BACKFILL_STREAM_CHUNK_BYTES
+)
+import contextlib
+import json
+import logging
+import random
+import time
 
 
 class DailyTimeSeriesRecord:
@@ -34,28 +48,222 @@ class DailyTimeSeriesRecord:
         return self.to_model().to_dict()
 
 
+class DailyTimeSeriesBatch:
+    """A batch of DailyTimeSeriesData of a single symbol, kept as column arrays.
+
+    Unlike `DailyTimeSeriesRecord`, no dict nor `FinancialData` instance is built per day: the
+    symbol is validated once per batch, and `rows` feeds the executemany of a Core statement
+    (see `SQLAlchemyDatabase.bulk_upsert_rows`) directly.
+
+    Example:
+        batch = DailyTimeSeriesBatch.from_records("IBM", data["Time Series (Daily)"].items())
+        db.bulk_upsert_rows(cls=FinancialData, rows=batch.rows())
+    """
+    MAP_KEYS = DailyTimeSeriesRecord.MAP_KEYS
+
+    def __init__(
+        self,
+        symbol: Any,
+        dates: Sequence[date] = (),
+        open_prices: Iterable[float] = (),
+        close_prices: Iterable[float] = (),
+        volumes: Iterable[int] = (),
+        updated_at: Optional[datetime] = None
+    ):
+        FinancialData.is_symbol_valid(symbol)
+        self.symbol = symbol if isinstance(symbol, str) else symbol.name
+        self.dates = list(dates)
+        self.open_prices = array("d", open_prices)
+        self.close_prices = array("d", close_prices)
+        self.volumes = array("q", volumes)
+        self.updated_at = updated_at or datetime.now()
+
+    @classmethod
+    def from_records(cls, symbol: Any, records: Iterable[Tuple[str, Dict[str, str]]]) -> "DailyTimeSeriesBatch":
+        """Parses the (ISO date, record) items of the provider's payload."""
+        open_key, close_key, volume_key = (cls.MAP_KEYS[k] for k in ("open_price", "close_price", "volume"))
+        batch = cls(symbol)
+        for day, record in records:
+            batch.dates.append(date.fromisoformat(day))
+            batch.open_prices.append(float(record[open_key]))
+            batch.close_prices.append(float(record[close_key]))
+            batch.volumes.append(int(record[volume_key]))
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def take(self, indices: Iterable[int]) -> "DailyTimeSeriesBatch":
+        """Returns a batch of the rows at `indices`."""
+        indices = list(indices)
+        return DailyTimeSeriesBatch(
+            self.symbol,
+            [self.dates[i] for i in indices],
+            [self.open_prices[i] for i in indices],
+            [self.close_prices[i] for i in indices],
+            [self.volumes[i] for i in indices],
+            updated_at=self.updated_at
+        )
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """Returns the executemany parameters of the `financial_data` rows."""
+        symbol, updated_at = self.symbol, self.updated_at
+        return [
+            {"symbol": symbol, "date": day, "open_price": open_price, "close_price": close_price, "volume": volume, "updated_at": updated_at}
+            for day, open_price, close_price, volume in zip(self.dates, self.open_prices, self.close_prices, self.volumes)
+        ]
+
+    def to_models(self) -> List[FinancialData]:
+        return [FinancialData(**row) for row in self.rows()]
+
+
 class AlphaVantageAPI:
     """Represents the AlphaVantageAPI reachable by: https://www.alphavantage.co/documentation
 
     Currently the only funcntion that is defined (and set as default) is `TIME_SERIES_DAILY_ADJUSTED`.
     The valid symbols are currently taken dynamically from the FinancialData.Symbols Enum. This
     could be adjusted as necessary.
+
+    Requests share a pooled keep-alive session, have connect/read timeouts, and are paced by a
+    token bucket matching the calls-per-minute quota of the provider (shared by the threads of
+    `fetch_biweekly_data`). Throttled responses (HTTP 429/5xx, or the `Note`/`Information`
+    bodies of the provider) are retried with a jittered exponential backoff.
+
+    With a `cache` (see `lib.response_cache`), the raw responses are kept on disk, keyed by the
+    function, symbol, output size and the `as_of` date (today by default); and a cached response
+    is reused instead of downloaded again. With `replay`, responses are only ever read from the
+    cache (the newest one up to `as_of`), so no request is sent at all.
     """
     DEFAULT_FUNC = "TIME_SERIES_DAILY_ADJUSTED"
     VALID_SYMBOLS = FinancialData.Symbols
     DEPRECATION_LIMIT_DAYS = 14
     FUNC_DATA_KEY = {"TIME_SERIES_DAILY_ADJUSTED": "Time Series (Daily)"}
+    # Keys of the (HTTP 200) responses, sent instead of the data when the quota is exceeded
+    THROTTLE_KEYS = ("Note", "Information")
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
 
-    def __init__(self, api_key: str, func: Optional[str] = DEFAULT_FUNC):
+    def __init__(
+        self,
+        api_key: str,
+        func: Optional[str] = DEFAULT_FUNC,
+        base_url: str = AVANTAGE_BASE_URL,
+        calls_per_minute: float = AVANTAGE_CALLS_PER_MINUTE,
+        max_workers: int = AVANTAGE_MAX_WORKERS,
+        cache: Optional[ResponseCache] = None,
+        replay: bool = False,
+        as_of: Optional[date] = None
+    ):
         self.api_key = api_key
         self.func = func
+        self.base_url = base_url
+        self.max_workers = max_workers
+        self.limiter = TokenBucket(rate=calls_per_minute / 60, capacity=max(calls_per_minute, 1))
+        self.session = requests.Session()
+        self.session.mount(base_url, HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+        self.logger = logging.getLogger("AlphaVantageAPI")
+        self.cache = cache if cache is not None or not replay else ResponseCache()
+        self.replay = replay
+        self.as_of = as_of or datetime.now().date()
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Full jitter exponential backoff; unless the server sent a `Retry-After` (in seconds)."""
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return random.uniform(0, AVANTAGE_BACKOFF_SECONDS * 2 ** attempt)
+
+    def _cache_key(self, symbol_code: str, output_size: str) -> ResponseKey:
+        return ResponseKey(self.func, symbol_code, output_size, self.as_of)
+
+    def _cached(self, key: ResponseKey) -> Optional[BinaryIO]:
+        """Returns the cached body of the response of `key`, if any.
+
+        Raises:
+            ResponseNotCachedError: If replaying, and the response was never cached.
+        """
+        body = self.cache.open(key, replay=self.replay) if self.cache is not None else None
+        if body is None and self.replay:
+            raise ResponseNotCachedError(key=key)
+        return body
+
+    def _request(self, params: Dict[str, str], cache_key: Optional[ResponseKey] = None) -> Any:
+        for attempt in range(AVANTAGE_MAX_RETRIES + 1):
+            self.limiter.acquire()
+            retry_after = None
+            try:
+                resp = self.session.get(self.base_url, params=params, timeout=AVANTAGE_TIMEOUT_SECONDS)
+                if resp.status_code in self.RETRY_STATUS_CODES:
+                    reason = f"HTTP {resp.status_code}"
+                    retry_after = resp.headers.get("Retry-After")
+                else:
+                    data = resp.json()
+                    throttled = isinstance(data, dict) and next((data[k] for k in self.THROTTLE_KEYS if k in data), None)
+                    if not throttled:
+                        if self.cache is not None and cache_key is not None and resp.content:
+                            self.cache.put(cache_key, resp.content)
+                        return data
+                    reason = throttled
+            except (requests.Timeout, requests.ConnectionError) as e:
+                reason = str(e)
+            if attempt < AVANTAGE_MAX_RETRIES:
+                wait = self._backoff(attempt, retry_after)
+                self.logger.warning(f"Retrying {params.get('symbol')} in {wait:.1f}s: {reason}")
+                time.sleep(wait)
+        raise ApiThrottledError(symbol=params.get("symbol"), reason=reason)
+
+    def _params(self, symbol_code: str, output_size: str) -> Dict[str, str]:
+        return {
+            "function": self.func,
+            "datatype": "json",
+            "symbol": symbol_code,
+            "outputsize": output_size,
+            "apikey": self.api_key
+        }
 
     @Loggable("AlphaVantageAPI")
     def _get_daily_data_json(self, symbol_code: str) -> str:
-        url = f'https://www.alphavantage.co/query?function={self.func}&datatype=json&symbol={symbol_code}&outputSize=compact&apikey={self.api_key}'
-        return requests.get(url).json()
+        key = self._cache_key(symbol_code, "compact")
+        body = self._cached(key)
+        if body is not None:
+            with body:
+                return json.load(body)
+        return self._request(self._params(symbol_code, "compact"), cache_key=key)
+
+    def stream_full_data(self, symbol: str, chunk_rows: int) -> Iterator[DailyTimeSeriesBatch]:
+        """Yields the full (20+ years) history of the `symbol`, newest first, in batches of `chunk_rows` days.
+
+        The response is parsed while it is downloaded, one batch at a time; so the memory use
+        does not depend on the length of the history. Throttled responses are not retried
+        here, but raised as `ApiThrottledError` (see `financial.backfill`, which resumes).
+        With a `cache`, the response is written to it along; once it was read completely.
+        """
+        symbol_code = self._standardize_symbol(symbol)
+        key = self._cache_key(symbol_code, "full")
+        body = self._cached(key)
+        if body is not None:
+            with body:
+                yield from self._parse_stream(symbol_code, iter(lambda: body.read(BACKFILL_STREAM_CHUNK_BYTES), b""), chunk_rows)
+            return
+        self.limiter.acquire()
+        with self.session.get(
+            self.base_url, params=self._params(symbol_code, "full"), timeout=AVANTAGE_TIMEOUT_SECONDS, stream=True
+        ) as resp:
+            if resp.status_code in self.RETRY_STATUS_CODES:
+                raise ApiThrottledError(symbol=symbol_code, reason=f"HTTP {resp.status_code}")
+            resp.raise_for_status()
+            # Only a complete (and not throttled) response is cached
+            with self.cache.writer(key) if self.cache is not None else contextlib.nullcontext() as writer:
+                chunks = resp.iter_content(BACKFILL_STREAM_CHUNK_BYTES)
+                yield from self._parse_stream(symbol_code, writer.tee(chunks) if writer else chunks, chunk_rows)
+
+    def _parse_stream(self, symbol_code: str, chunks: Iterable[bytes], chunk_rows: int) -> Iterator[DailyTimeSeriesBatch]:
+        others = {}
+        items = iter_object_items(chunks, self.FUNC_DATA_KEY[self.func], on_other=others.__setitem__)
+        while batch := DailyTimeSeriesBatch.from_records(symbol_code, islice(items, chunk_rows)):
+            yield batch
+        throttled = next((others[k] for k in self.THROTTLE_KEYS if k in others), None)
+        if throttled:
+            raise ApiThrottledError(symbol=symbol_code, reason=throttled)
 
-    @cache.memoize(60)
     def _standardize_symbol(self, symbol: str) -> str:
         try:
             return self.VALID_SYMBOLS[symbol].name
@@ -66,30 +274,35 @@ class AlphaVantageAPI:
                 return symbol.name
 
     @Loggable("AlphaVantageAPI")
-    def get_biweekly_data(self, symbol: str) -> List[FinancialData]:
+    def get_biweekly_batch(self, symbol: str) -> DailyTimeSeriesBatch:
         symbol_code = self._standardize_symbol(symbol)
         data = self._get_daily_data_json(symbol_code)
-        if not data:
-            return []
-        time_series_data = data[self.FUNC_DATA_KEY[self.func]]
+        time_series_data = data[self.FUNC_DATA_KEY[self.func]] if data else None
         if not time_series_data:
-            return []
-        date_cursor = datetime.now()
-        res = []
-        parser = self._get_parser()
-        for i in range(self.DEPRECATION_LIMIT_DAYS):
-            key = date_cursor.strftime(DEFAULT_DATE_FMT)
-            try:
-                res.append(
-                    parser(record=time_series_data[key],
-                           date=date_cursor, symbol=symbol_code).to_model()
-                )
-            except KeyError:
-                pass
-            date_cursor -= timedelta(days=1)
-        return res
-
-    @cache.cached(60, key_prefix="vantage_data_parser/%s")
+            return DailyTimeSeriesBatch(symbol_code)
+        days = (
+            (self.as_of - timedelta(days=i)).strftime(DEFAULT_DATE_FMT)
+            for i in range(self.DEPRECATION_LIMIT_DAYS)
+        )
+        return DailyTimeSeriesBatch.from_records(
+            symbol_code, ((day, time_series_data[day]) for day in days if day in time_series_data)
+        )
+
+    @Loggable("AlphaVantageAPI")
+    def get_biweekly_data(self, symbol: str) -> List[FinancialData]:
+        return self.get_biweekly_batch(symbol).to_models()
+
+    def fetch_biweekly_data(self, symbols: Iterable[Any]) -> Iterator[Tuple[Any, DailyTimeSeriesBatch]]:
+        """Fetches the symbols concurrently (`max_workers` threads), within the rate limit.
+
+        Yields:
+            (symbol, batch) tuples, in the order of completion.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="AlphaVantageAPI") as executor:
+            futures = {executor.submit(self.get_biweekly_batch, symbol): symbol for symbol in symbols}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
     def _get_parser(self) -> type:
         match self.func:
             case "TIME_SERIES_DAILY_ADJUSTED":
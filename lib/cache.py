@@ -0,0 +1,186 @@
+"""Two-tier cache backend for Flask-Caching.
+
+    - L1 (`LRUByteCache`): in-process, LRU, bounded by the byte size of the (pickled) values,
+        with per-key TTL.
+    - L2: shared between all the workers of the host; `cachelib.FileSystemCache` under
+        `CACHE_DIR` by default, or `cachelib.RedisCache` if `CACHE_REDIS_URL` is set (any Redis
+        compatible server, requires the `redis` package).
+
+Reads go to L1 first, then L2 (and a L2 hit is copied into L1, for at most `CACHE_L1_TIMEOUT`
+seconds, so deletes made by other workers are seen after that). Writes go to both tiers.
+
+Enabled with `app.config['CACHE_TYPE'] = 'lib.cache.TwoTierCache'`, so `cache.memoize` and
+`cache.cached` call sites work unchanged.
+"""
+from cachelib import BaseCache as CachelibBaseCache, FileSystemCache
+from flask_caching.backends.base import BaseCache
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from .metrics import CacheMetrics
+import pickle
+import threading
+import time
+
+
+class LRUByteCache(CachelibBaseCache):
+    """In-process LRU cache, bounded by the total byte size of its pickled values.
+
+    Values are kept pickled (like `SimpleCache`), so callers never share mutable objects.
+    """
+    def __init__(self, max_bytes: int, default_timeout: int = 300):
+        super().__init__(default_timeout)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._items: OrderedDict[str, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expires_at(self, timeout: Optional[int]) -> float:
+        timeout = self._normalize_timeout(timeout)
+        return time.monotonic() + timeout if timeout > 0 else float("inf")
+
+    def _pop(self, key: str) -> None:
+        _, blob = self._items.pop(key)
+        self.size -= len(blob)
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, blob = item
+            if expires_at <= time.monotonic():
+                self._pop(key)
+                return None
+            self._items.move_to_end(key)
+        return pickle.loads(blob)
+
+    def set(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            self.delete(key)
+            return False
+        with self._lock:
+            if key in self._items:
+                self._pop(key)
+            self._items[key] = (self._expires_at(timeout), blob)
+            self.size += len(blob)
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self._items)))
+                self.evictions += 1
+        return True
+
+    def add(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        if self.has(key):
+            return False
+        return self.set(key, value, timeout)
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            if key not in self._items:
+                return False
+            self._pop(key)
+        return True
+
+    def has(self, key: str) -> bool:
+        with self._lock:
+            item = self._items.get(key)
+            return item is not None and item[0] > time.monotonic()
+
+    def clear(self) -> bool:
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+        return True
+
+
+class TwoTierCache(BaseCache):
+    """Flask-Caching backend, combining an in-process `LRUByteCache` with a shared L2 cache.
+
+    Exposes hit/miss/eviction counters through `stats()`; and reports each lookup to `CacheMetrics`,
+    for the hits and misses per memoized function.
+    """
+    def __init__(self, l1: LRUByteCache, l2: CachelibBaseCache, l1_timeout: int, default_timeout: int = 300):
+        super().__init__(default_timeout)
+        self.l1 = l1
+        self.l2 = l2
+        self.l1_timeout = l1_timeout
+        self.hits_l1 = 0
+        self.hits_l2 = 0
+        self.misses = 0
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs) -> "TwoTierCache":
+        default_timeout = kwargs.get("default_timeout", 300)
+        if config.get("CACHE_REDIS_URL"):
+            from cachelib import RedisCache
+            import redis
+            l2 = RedisCache(
+                host=redis.Redis.from_url(config["CACHE_REDIS_URL"]),
+                key_prefix=config.get("CACHE_KEY_PREFIX") or "",
+                default_timeout=default_timeout
+            )
+        else:
+            l2 = FileSystemCache(
+                config["CACHE_DIR"],
+                threshold=config.get("CACHE_THRESHOLD", 500),
+                default_timeout=default_timeout
+            )
+        l1_timeout = config.get("CACHE_L1_TIMEOUT", default_timeout)
+        return cls(
+            l1=LRUByteCache(config["CACHE_L1_MAX_BYTES"], default_timeout=l1_timeout),
+            l2=l2,
+            l1_timeout=l1_timeout,
+            default_timeout=default_timeout
+        )
+
+    def _l1_timeout(self, timeout: Optional[int]) -> int:
+        timeout = self._normalize_timeout(timeout)
+        return min(timeout, self.l1_timeout) if timeout > 0 else self.l1_timeout
+
+    def get(self, key: str) -> Any:
+        value = self.l1.get(key)
+        if value is not None:
+            self.hits_l1 += 1
+            CacheMetrics.lookup(key, "hit_l1")
+            return value
+        value = self.l2.get(key)
+        if value is not None:
+            self.hits_l2 += 1
+            CacheMetrics.lookup(key, "hit_l2")
+            self.l1.set(key, value, self.l1_timeout)
+            return value
+        self.misses += 1
+        CacheMetrics.lookup(key, "miss")
+        return None
+
+    def set(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        self.l1.set(key, value, self._l1_timeout(timeout))
+        return self.l2.set(key, value, timeout)
+
+    def add(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        if not self.l2.add(key, value, timeout):
+            return False
+        self.l1.set(key, value, self._l1_timeout(timeout))
+        return True
+
+    def delete(self, key: str) -> bool:
+        deleted = self.l1.delete(key)
+        return self.l2.delete(key) or deleted
+
+    def has(self, key: str) -> bool:
+        return self.l1.has(key) or self.l2.has(key)
+
+    def clear(self) -> bool:
+        self.l1.clear()
+        return self.l2.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits_l1": self.hits_l1,
+            "hits_l2": self.hits_l2,
+            "misses": self.misses,
+            "evictions_l1": self.l1.evictions,
+            "bytes_l1": self.l1.size,
+            "items_l1": len(self.l1._items)
+        }
@@ -1,11 +1,14 @@
-from typing import List
+from typing import List, Dict, Any, Iterator, Callable, Optional, Sequence
 from abc import ABC, abstractmethod
 from .exceptions import DatabaseEngineUndefinedError
-from conf.settings import FIXTURES_DIR, DB_HOST, DB_NAME, DB_PASSWORD, DB_USER, DB_PORT, DB_DIR, DEBUG
+from conf.settings import FIXTURES_DIR, DB_HOST, DB_NAME, DB_PASSWORD, DB_USER, DB_PORT, DB_DIR
 from pathlib import Path
 from flask_sqlalchemy import SQLAlchemy
-from conf.settings import MAX_BULK_OPERATIONS
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.sql.expression import Insert
+from conf.settings import MAX_BULK_OPERATIONS, BULK_BATCH_BOUNDS, BULK_COMMIT_TARGET_SECONDS, METRICS_ENABLED
 import contextlib
+import time
 
 
 def get_schema_file():
@@ -34,25 +37,91 @@ class BaseDatabase(ABC):
     def end_transaction(self): pass
 
 
+class AdaptiveBatchSize:
+    """Picks the number of rows sent per bulk transaction, based on measured commit latency.
+
+    Starts at `initial` rows. After every commit, the observed latency per row is used to
+    aim the next batch at `target_seconds`; the step is capped to doubling/halving so a single
+    slow commit does not collapse the batch size. The result always stays within `bounds`.
+
+    Example:
+        sizer = AdaptiveBatchSize(initial=50, bounds=(50, 5000), target_seconds=0.2)
+        with sizer.measure(rows=len(batch)):
+            session.commit()
+    """
+    def __init__(self, initial: int, bounds: tuple, target_seconds: float):
+        self.min_size, self.max_size = bounds
+        self.target_seconds = target_seconds
+        self.size = self._clamp(initial)
+
+    def _clamp(self, size: float) -> int:
+        return int(max(self.min_size, min(self.max_size, size)))
+
+    def observe(self, rows: int, seconds: float) -> None:
+        if rows <= 0:
+            return
+        if seconds <= 0:
+            self.size = self._clamp(self.size * 2)
+            return
+        ideal = rows * self.target_seconds / seconds
+        self.size = self._clamp(min(self.size * 2, max(self.size / 2, ideal)))
+
+    @contextlib.contextmanager
+    def measure(self, rows: int) -> Iterator[None]:
+        started = time.perf_counter()
+        yield
+        self.observe(rows, time.perf_counter() - started)
+
+
 class SQLAlchemyDatabase(BaseDatabase):
     """Parent class for all engines defined under SQLAlchemy module.
 
     SQLAlchemy is the only defined kind of Database router for this project at
     the moment.
-    It comes with a constant `MAX_BULK_OPERATIONS` restricting the number of
-    changes to be committed to the database per one transaction. This is to
-    accommodate large queries, and increase robustness, and reduce load on
-    DB Writers.
+    Bulk upserts are sent as native, multi-row `INSERT ... ON CONFLICT/DUPLICATE KEY UPDATE`
+    statements (see `upsert_statement`), keyed on the model's unique constraint. The number
+    of rows per transaction starts at `MAX_BULK_OPERATIONS` and is then tuned by
+    `AdaptiveBatchSize` from the measured commit latency. This is to accommodate large
+    queries, and increase robustness, and reduce load on DB Writers.
     """
     MAX_BULK_OPERATIONS = MAX_BULK_OPERATIONS
     session = None
+    app = None
+
+    def __init__(self):
+        self.batch_size = AdaptiveBatchSize(
+            initial=self.MAX_BULK_OPERATIONS,
+            bounds=BULK_BATCH_BOUNDS,
+            target_seconds=BULK_COMMIT_TARGET_SECONDS
+        )
+
+    def init_app(self, app: object) -> None:
+        """Binds the database to the (Flask) `app`."""
+        app.config['SQLALCHEMY_DATABASE_URI'] = self.connection_uri()
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        if METRICS_ENABLED:
+            from .metrics import MeteredQueuePool
+            # Times the waits for a pooled connection (see `lib/metrics.py`)
+            app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {}).setdefault('poolclass', MeteredQueuePool)
+        self.core.init_app(app)
+        self.app = app
+
+    @abstractmethod
+    def connection_uri(self) -> str: pass
 
     def initialize(self):
-        self.core.init_app(self.app)
+        """Creates the missing tables. Requires an application context."""
         self.core.create_all()
 
+    def dispose(self) -> None:
+        """Drops the pooled connections, without closing them; to be called in forked workers,
+        so they never share the connections opened by their parent process."""
+        with self.app.app_context():
+            for engine in self.core.engines.values():
+                engine.dispose(close=False)
+
     def prepare_transaction(self):
-        self.session = self.core.create_scoped_session()
+        self.session = self.core.session
 
     def end_transaction(self) -> None:
         self.session.close()
@@ -76,58 +145,100 @@ class SQLAlchemyDatabase(BaseDatabase):
         if auto_created:
             self.end_transaction()
 
-    def bulk_upsert(self, cls: type, objects: List[object]) -> None:
+    @abstractmethod
+    def upsert_statement(self, cls: type, update_keys: List[str]) -> Insert:
+        """Returns the dialect specific `INSERT ... <on conflict> UPDATE` statement of `cls`."""
+
+    @staticmethod
+    def _as_row(obj: object, keys: List[str]) -> Dict[str, Any]:
+        return {key: getattr(obj, key) for key in keys}
+
+    def bulk_upsert(self, cls: type, objects: List[object], after_batch: Sequence[Callable] = ()) -> int:
+        """Inserts the `objects`, or updates the existing rows sharing the same unique key.
+
+        Rows are sent as executemany batches of a single upsert statement, so there is
+        no SELECT per row (as `session.merge` would do) and no ORM identity map tracking.
+
+        Args:
+            after_batch: Callables of `(session, rows)`, run after each batch is written and
+                before it is committed; i.e. within the same transaction as the batch.
+
+        Returns:
+            int: Number of rows reported as affected by the database.
+        """
+        _, keys = cls.as_sql_table()
+        return self.bulk_upsert_rows(cls, [self._as_row(obj, keys) for obj in objects], after_batch=after_batch)
+
+    def bulk_upsert_rows(self, cls: type, rows: List[Dict[str, Any]], after_batch: Sequence[Callable] = ()) -> int:
+        """Same as `bulk_upsert`, for rows already given as the column values (e.g. `DailyTimeSeriesBatch.rows`),
+        so that no ORM instance is built at all."""
+        _, keys = cls.as_sql_table()
+        stmt = self.upsert_statement(cls, update_keys=[key for key in keys if key not in cls.upsert_index_keys()])
+        affected = 0
         with self.graceful_session_handler():
-            for i, obj in enumerate(objects):
-                self.session.merge(obj)
-                if i > 0 and i % self.MAX_BULK_OPERATIONS == 0:
+            start = 0
+            while True:
+                batch = rows[start:start + self.batch_size.size]
+                if batch:
+                    affected += max(self.session.execute(stmt, batch).rowcount, 0)
+                    for hook in after_batch:
+                        hook(self.session, batch)
+                with self.batch_size.measure(rows=len(batch)):
                     self.submit_transaction()
-            self.submit_transaction()
+                start += len(batch)
+                if start >= len(rows):
+                    break
+        return affected
 
 
 class SQLite(SQLAlchemyDatabase):
-    def __init__(self, app: object, path: str = DB_DIR):
-        app.config['SQLALCHEMY_DATABASE_URI'] = SQLite.conncetion_uri(
-            path=path
-        )
-        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-        self.core = SQLAlchemy(app)
-        self.app = app
+    def __init__(self, app: Optional[object] = None, path: str = DB_DIR):
+        super().__init__()
+        self.path = path
+        self.core = SQLAlchemy()
+        if app is not None:
+            self.init_app(app)
+
+    def connection_uri(self) -> str:
+        return SQLite.conncetion_uri(path=self.path)
 
     @staticmethod
     def conncetion_uri(path):
         return f"sqlite:///{Path(path, 'sqlite.db')}"
 
-    def bulk_upsert(self, cls: type, objects: List[object]):
-        """Bulk upsert operation. This feature is not supported by SQLite.
-
-        Using (Flask-SQLAlchemy==3.0.2), the model's UniqueConstraint does
-        not properly trigger the right upsert operation on SQLite side. Hence
-        in case this operation is performed in NO DEBUG mode, (e.g. in prod
-        env) it will raise an error.
-
-        Raises:
-            NotImplementedError: (Read Above)
-        """
-        if not DEBUG:
-            raise NotImplementedError("UniqueConstraint Does Not Work on SQLite")
-        super().bulk_upsert(cls, objects)
+    def upsert_statement(self, cls: type, update_keys: List[str]) -> Insert:
+        """`INSERT ... ON CONFLICT(<unique keys>) DO UPDATE SET ...` (SQLite >= 3.24)."""
+        stmt = sqlite.insert(cls.__table__)
+        return stmt.on_conflict_do_update(
+            index_elements=cls.upsert_index_keys(),
+            set_={key: stmt.excluded[key] for key in update_keys}
+        )
 
 
 class MySQL(SQLAlchemyDatabase):
-    def __init__(self, app: object):
-        app.config['SQLALCHEMY_DATABASE_URI'] = MySQL.conncetion_uri(
+    def __init__(self, app: Optional[object] = None):
+        super().__init__()
+        self.core = SQLAlchemy()
+        if app is not None:
+            self.init_app(app)
+
+    def connection_uri(self) -> str:
+        return MySQL.conncetion_uri(
             username=DB_USER, password=DB_PASSWORD,
             host=DB_HOST, port=DB_PORT, database_name=DB_NAME
         )
-        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-        self.core = SQLAlchemy(app)
-        self.app = app
 
     @staticmethod
     def conncetion_uri(username: str, password: str, host: str, port: int | str, database_name: str) -> str:
         return f"mysql://{username}:{password}@{host}:{port}/{database_name}"
 
+    def upsert_statement(self, cls: type, update_keys: List[str]) -> Insert:
+        """`INSERT ... ON DUPLICATE KEY UPDATE ...`, resolved by the model's unique index."""
+        stmt = mysql.insert(cls.__table__)
+        return stmt.on_duplicate_key_update(
+            {key: stmt.inserted[key] for key in update_keys}
+        )
+
 
 class DatabaseRouter:
     """A Factory class. Return the proper Database Class, based on the requested engine.
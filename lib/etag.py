@@ -0,0 +1,71 @@
+"""Conditional GET support for the API Resources.
+
+The `ETag` of a response is derived from the data generation of the requested symbol (or of
+the whole dataset) and the query arguments, as parsed by the `RequestParser` of the view (with
+its defaults); so it only changes when an ingestion changes the data that could be in the
+response, and a request sending a default argument shares the tag of the one omitting it. A request whose `If-None-Match` matches, is
+answered with `304 Not Modified` before any database or serializer work.
+"""
+from flask import request, Response
+from flask_restx.reqparse import RequestParser
+from functools import wraps
+from hashlib import sha1
+from typing import Optional
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import quote_etag
+from .generation import generations
+
+
+class ConditionalGet:
+    """Decorator of `Resource.get` methods; adds the `ETag` header and handles `If-None-Match`.
+
+    Must be placed above `api.marshal_with` (or `FastMarshal`), so the `304` response skips the
+    marshalling (`Resource.dispatch_request` returns response objects as is), and the `ETag`
+    header is added to the marshalled response.
+
+    Example:
+        @ConditionalGet("StatisticsView", scope_arg="symbol", parser=REQUEST)
+        @api.marshal_with(RESPONSE)
+        def get(self): ...
+
+    Args:
+        parser (Optional[RequestParser]): The parser of the arguments of the view. Defaults to
+            None; the raw query arguments are then used.
+    """
+    def __init__(self, name: str, scope_arg: Optional[str] = "symbol", parser: Optional[RequestParser] = None):
+        self.name = name
+        self.scope_arg = scope_arg
+        self.parser = parser
+
+    def etag(self) -> Optional[str]:
+        """Returns the `ETag` of the request; None if its arguments are invalid."""
+        if self.parser is None:
+            scope = request.args.get(self.scope_arg) if self.scope_arg else None
+            items = request.args.items(multi=True)
+        else:
+            try:
+                arguments = self.parser.parse_args()
+            except HTTPException:
+                # Answered (with the error message) by the view
+                return None
+            scope = arguments.get(self.scope_arg) if self.scope_arg else None
+            items = ((k, v) for k, v in arguments.items() if v is not None)
+        args = "&".join(f"{k}={v}" for k, v in sorted(items))
+        return sha1(f"{self.name}|{generations.get(scope or None)}|{args}".encode()).hexdigest()
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            etag = self.etag()
+            if etag is None:
+                return func(*args, **kwargs)
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+            resp = func(*args, **kwargs)
+            if isinstance(resp, Response):
+                resp.headers["ETag"] = quote_etag(etag)
+                return resp
+            return resp, 200, {"ETag": quote_etag(etag)}
+        return wrapper
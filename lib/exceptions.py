@@ -4,6 +4,9 @@ DatabaseEngineUndefinedError: If DB_ENGINE is not defined in DatabaseRouter clas
 ApiKeyNotFoundError: If `conf/api_key` is not found.
 SymbolUndefinedError: If the given symbol, is not defined.
 PageOutofBoundsError: If requested page in a paginated result, is larger than max page.
+InvalidCursorError: If the cursor of a cursor-paginated request, could not be decoded.
+ApiThrottledError: If an external API kept throttling (or failing) a request, after all the retries.
+ResponseNotCachedError: If a request is replayed, but its response was never cached.
 """
 from .utils import load_err_messages
 
@@ -28,3 +31,18 @@ class SymbolUndefinedError(ValueError):
 class PageOutofBoundsError(IndexError):
     def __init__(self, asked: int, max_: int):
         super().__init__(f"{err_msg['api']['page_oob']}: {asked} out of {max_}")
+
+
+class InvalidCursorError(ValueError):
+    def __init__(self, cursor: str):
+        super().__init__(f"{err_msg['api']['invalid_cursor']}: {cursor}")
+
+
+class ApiThrottledError(ConnectionError):
+    def __init__(self, symbol: str, reason: str):
+        super().__init__(f"{err_msg['app']['api_throttled']} ({symbol}): {reason}")
+
+
+class ResponseNotCachedError(LookupError):
+    def __init__(self, key: object):
+        super().__init__(f"{err_msg['app']['response_not_cached']}: {key}")
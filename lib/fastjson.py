@@ -0,0 +1,77 @@
+"""Fast path for the JSON responses holding a large list of objects.
+
+`api.marshal_with` marshals every row into a dict, and the `output_json` representation of
+flask-restx then encodes them again. `FastMarshal` instead encodes the rows with a serializer
+compiled once for the fields of the model (e.g. `FinancialDataSerializer.compile`), marshals
+only the (small) rest of the response, and writes the body straight into the `Response`.
+
+The body is byte identical to the one of `marshal_with` + `output_json`; when that could not
+be guaranteed (the debug mode indents, `RESTX_JSON` settings, or a `X-Fields` mask), the
+response goes through the regular marshalling.
+"""
+from flask import Response, current_app, request
+from flask_restx import Model, marshal
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from werkzeug.wrappers import Response as BaseResponse
+import json
+
+
+class FastMarshal:
+    """Decorator of `Resource.get` methods; placed right above their `api.marshal_with(model)`,
+    which is then bypassed, and only documents the response.
+
+    The decorated method returns the response as a dict, whose `list_key` member is the list
+    of objects (rather than their serialized dicts).
+
+    Example:
+        @FastMarshal(RESPONSE, "data", encode=FinancialDataSerializer.compile(keys), serialize=...)
+        @api.marshal_with(RESPONSE)
+        def get(self):
+            return {"data": records, "pagination": {...}}
+
+    Args:
+        encode: Encodes the objects as a JSON list; as `json.dumps` would the marshalled list.
+        serialize: Turns the objects into dicts, for the regular marshalling.
+    """
+    def __init__(
+        self,
+        model: Model,
+        list_key: str,
+        encode: Callable[[Iterable[Any]], str],
+        serialize: Callable[[List[Any]], List[Dict[str, Any]]]
+    ):
+        self.model = model
+        self.list_key = list_key
+        self.encode = encode
+        self.serialize = serialize
+
+    @staticmethod
+    def mask() -> Optional[str]:
+        return request.headers.get(current_app.config["RESTX_MASK_HEADER"])
+
+    def supported(self) -> bool:
+        return not (current_app.debug or current_app.config.get("RESTX_JSON") or self.mask())
+
+    def dumps(self, resp: Dict[str, Any]) -> str:
+        rows = self.encode(resp.pop(self.list_key))
+        # The list is null in the marshalled rest; it is replaced by the encoded rows
+        rest = marshal(resp, self.model)
+        return "{" + ", ".join(
+            f"{json.dumps(key)}: {rows if key == self.list_key else json.dumps(value)}" for key, value in rest.items()
+        ) + "}\n"
+
+    def __call__(self, func):
+        # The method under `marshal_with`
+        unmarshalled = func.__wrapped__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            resp = unmarshalled(*args, **kwargs)
+            if isinstance(resp, BaseResponse):
+                return resp
+            if not self.supported():
+                resp[self.list_key] = self.serialize(resp[self.list_key])
+                return marshal(resp, self.model, mask=self.mask())
+            return Response(self.dumps(resp), mimetype="application/json")
+        return wrapper
@@ -0,0 +1,105 @@
+"""Per-symbol data generation counters.
+
+Every ingestion that changes the rows of a symbol bumps the generation of that symbol. The
+counters are kept in a small JSON file (`GENERATION_PATH`), so all the processes of the host
+(API workers and the ingestion scripts) see the same values without touching the database.
+Reads only cost a `stat` call, unless the file was replaced since the last read.
+
+The generations are used as:
+    - the validator of the `ETag`s of the API responses (see `lib.etag`),
+    - a component of the memoized cache keys (see `namespace`), so stale entries are never
+        served after an ingestion,
+    - the staleness marker of the in-process indices (see `financial.coverage`).
+"""
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Any
+from conf.settings import GENERATION_PATH
+import fcntl
+import json
+import os
+import tempfile
+
+
+class DataGeneration:
+    """Monotonically increasing generation counter per symbol, persisted in a JSON file.
+
+    Example:
+        generations.bump(["IBM"])
+        generations.get("IBM")  # => 1
+        generations.get()       # => Sum of the generations of all symbols
+    """
+    def __init__(self, path: str = GENERATION_PATH):
+        self.path = Path(path)
+        self._lock_path = Path(f"{path}.lock")
+        self._signature: Optional[Tuple] = None
+        self._data: Dict[str, int] = {}
+        self._pending: Dict[str, int] = {}
+
+    def _load(self) -> Dict[str, int]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return {}
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if signature != self._signature:
+            with open(self.path, "r") as f:
+                self._data = json.load(f)
+            self._signature = signature
+        return self._data
+
+    @staticmethod
+    def _code(symbol: Any) -> str:
+        return symbol if isinstance(symbol, str) else symbol.name
+
+    def get(self, symbol: Optional[Any] = None) -> int:
+        """Returns the generation of the `symbol`; or of the whole dataset if it is None."""
+        data = self._load()
+        if symbol is None:
+            return sum(data.values()) + sum(self._pending.values())
+        code = self._code(symbol)
+        return data.get(code, 0) + self._pending.get(code, 0)
+
+    def bump(self, symbols: Iterable[Any]) -> Dict[str, int]:
+        """Increments the generation of each of the `symbols`. Safe across processes."""
+        symbols = {self._code(symbol) for symbol in symbols}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self._lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                data = json.loads(self.path.read_text()) if self.path.exists() else {}
+                for symbol in symbols:
+                    data[symbol] = data.get(symbol, 0) + 1
+                # Replaced atomically, so readers never see a partially written file
+                fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}")
+                with os.fdopen(fd, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return data
+
+    @contextmanager
+    def pending(self, symbols: Iterable[Any]) -> Iterator[None]:
+        """Within the block, this process reads the generations as if the `symbols` were bumped.
+
+        Used to fill the caches of the next generation (see `financial.warmup`), while the
+        other processes still read the current one.
+        """
+        codes = {self._code(symbol) for symbol in symbols}
+        for code in codes:
+            self._pending[code] = self._pending.get(code, 0) + 1
+        try:
+            yield
+        finally:
+            for code in codes:
+                self._pending[code] -= 1
+                if not self._pending[code]:
+                    del self._pending[code]
+
+    def namespace(self, fname: str) -> str:
+        """`make_name` of `cache.memoize`; scopes the memoized entries to the current generation."""
+        return f"{fname}@{self.get()}"
+
+
+generations = DataGeneration()
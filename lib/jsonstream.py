@@ -0,0 +1,115 @@
+"""Incremental parsing of large JSON documents.
+
+`iter_object_items` yields the members of one (large) object of a JSON document, while the
+document is being downloaded. Only the current member is decoded at a time, and the consumed
+text is dropped, so the memory use does not depend on the size of the document.
+
+Example:
+    resp = session.get(url, stream=True)
+    for day, record in iter_object_items(resp.iter_content(65536), "Time Series (Daily)"):
+        ...
+"""
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+import codecs
+import json
+
+WHITESPACE = " \t\n\r"
+
+
+class _Buffer:
+    """Text buffer over a stream of (utf-8) chunks."""
+    def __init__(self, chunks: Iterable[bytes | str]):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        """Appends the next chunk (dropping the consumed text). Returns False at the end of the stream."""
+        if self.eof:
+            return False
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self.eof = True
+            chunk = b""
+        chunk = self._decoder.decode(chunk, final=self.eof) if isinstance(chunk, bytes) else chunk
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Returns the next non-whitespace character (without consuming it); or "" at the end."""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self.text, self.pos)
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decodes the next JSON value.
+
+        A value is only accepted if it is followed by more text (or the stream ended); so
+        e.g. a number split between two chunks is never decoded partially.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self.text, self.pos)
+                if end < len(self.text) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+
+def _members(buffer: _Buffer) -> Iterator[Tuple[str, _Buffer]]:
+    """Iterates the members of the object at the position of the `buffer`; the caller consumes each value."""
+    buffer.expect("{")
+    if buffer.peek() == "}":
+        buffer.pos += 1
+        return
+    while True:
+        key = buffer.value()
+        buffer.expect(":")
+        yield key, buffer
+        if buffer.peek() == ",":
+            buffer.pos += 1
+            continue
+        buffer.expect("}")
+        return
+
+
+def iter_object_items(
+    chunks: Iterable[bytes | str],
+    key: str,
+    on_other: Optional[Callable[[str, Any], None]] = None
+) -> Iterator[Tuple[str, Any]]:
+    """Yields the (key, value) members of the `key` object, of the top level JSON object.
+
+    Args:
+        chunks: The text (or utf-8 bytes) of the document, in chunks of any size.
+        key: The top level key of the object to iterate.
+        on_other: Called with the (key, value) of each other top level member.
+    """
+    buffer = _Buffer(chunks)
+    for top_key, _ in _members(buffer):
+        if top_key == key:
+            for item_key, _ in _members(buffer):
+                yield item_key, buffer.value()
+        else:
+            value = buffer.value()
+            if on_other:
+                on_other(top_key, value)
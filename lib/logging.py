@@ -1,11 +1,181 @@
-from typing import Optional
+"""Logging decorators, and the setup of the application log.
+
+The records are cheap for the calling (request) thread:
+    - The arguments and the result of a call are formatted lazily (`Summary`); only when a
+        record is actually written, and truncated: a collection longer than `LOG_MAX_ITEMS` is
+        summarized by its length and first items, and any text by its first `LOG_MAX_CHARS`.
+    - The records of each logger can be sampled (`SamplingFilter`); e.g. 1% of the calls of a
+        hot service, while its warnings and errors are always kept.
+    - The file is written by a background thread (`QueuedLogging`); the request thread only
+        puts the (unformatted) record in a queue, and the messages are formatted by that thread.
+        So the logged arguments are rendered as they are when the record is written.
+The records of `Loggable` also carry the `function`, `elapsed_ms` and `outcome` ("returned" or
+"raised") attributes, for structured handlers.
+"""
+from typing import Dict, Optional
+from functools import wraps
+from itertools import islice
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+import atexit
 import logging
+import os
+import queue
+import random
+import time
 from flask_restx.errors import abort
 from werkzeug.exceptions import HTTPException
+from conf.settings import LOG_MAX_CHARS, LOG_MAX_ITEMS
+
+FORMAT = "(%(asctime)s)[%(levelname)s] %(name)s: %(message)s"
+DATE_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+
+
+class Summary:
+    """Truncated text of a value, built when (and if) the log record is formatted.
+
+    Example:
+        str(Summary(list(range(1000))))         # => "list[1000](0, 1, 2, ...)"
+    """
+    __slots__ = ("value", "as_repr")
+
+    def __init__(self, value, as_repr: bool = False):
+        self.value = value
+        self.as_repr = as_repr
+
+    @staticmethod
+    def _shorten(text: str) -> str:
+        if len(text) <= LOG_MAX_CHARS:
+            return text
+        return f"{text[:LOG_MAX_CHARS]}... (+{len(text) - LOG_MAX_CHARS} chars)"
+
+    def __str__(self) -> str:
+        value = self.value
+        if isinstance(value, (list, tuple)):
+            # Also the items; e.g. the (count, records) result of a service
+            shown = ", ".join([str(Summary(item, as_repr=True)) for item in islice(value, LOG_MAX_ITEMS)])
+            if len(value) > LOG_MAX_ITEMS:
+                return f"{type(value).__name__}[{len(value)}]({shown}, ...)"
+            text = f"[{shown}]" if isinstance(value, list) else f"({shown}{',' if len(value) == 1 else ''})"
+        elif isinstance(value, (set, frozenset, dict)) and len(value) > LOG_MAX_ITEMS:
+            shown = ", ".join(
+                f"{Summary(item[0], as_repr=True)}: {Summary(item[1], as_repr=True)}" if isinstance(value, dict) else str(Summary(item, as_repr=True))
+                for item in islice(value.items() if isinstance(value, dict) else value, LOG_MAX_ITEMS)
+            )
+            return f"{type(value).__name__}[{len(value)}]({shown}, ...)"
+        else:
+            text = repr(value) if self.as_repr else str(value)
+        return self._shorten(text)
+
+    __repr__ = __str__
+
+
+class _Call:
+    """The `name(args, kwargs)` text of a call; lazily formatted."""
+    __slots__ = ("name", "args", "kwargs")
+
+    def __init__(self, name: str, args: tuple, kwargs: dict):
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self) -> str:
+        return f"{self.name}(" + ", ".join([
+            *(str(Summary(arg, as_repr=True)) for arg in self.args),
+            *(f"{key}={Summary(value, as_repr=True)}" for key, value in self.kwargs.items())
+        ]) + ")"
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps the given share of the records (below WARNING) of each logger, and of its children.
+
+    Example:
+        SamplingFilter({"list_financial_data": 0.01, "singleflight": 0.1})
+    """
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._rates: Dict[str, float] = {}
+
+    def rate(self, name: str) -> float:
+        rate = self._rates.get(name)
+        if rate is None:
+            parts = name.split(".")
+            rate = next(
+                (self.rates[prefix] for prefix in (".".join(parts[:i]) for i in range(len(parts), 0, -1)) if prefix in self.rates),
+                1.0
+            )
+            self._rates[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+class LazyQueueHandler(QueueHandler):
+    """`QueueHandler` that queues the records as they are; unlike the stdlib one, which formats
+    their message (`msg % args`) in the calling thread. So the arguments (e.g. `Summary`) are
+    only rendered by the listener, in its thread."""
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class QueuedLogging:
+    """Writes the records of the root logger to a file from a background thread.
+
+    The handlers of the root logger are replaced by a `LazyQueueHandler` (with the sampling
+    filter), and the file handler, which formats the records, is run by a `QueueListener`. The
+    listener is restarted in the forked processes (e.g. the workers of the production server),
+    and stopped, after writing the queued records, at exit.
+
+    Args:
+        filename (Path): The log file.
+        sample_rates (Dict[str, float]): See `SamplingFilter`.
+        queued (bool): If False, the records are written by the calling thread.
+    """
+    def __init__(self, filename: Path, sample_rates: Dict[str, float], queued: bool = True, level: int = logging.INFO):
+        self.file_handler = logging.FileHandler(filename, encoding="utf-8")
+        self.file_handler.setFormatter(logging.Formatter(FORMAT, DATE_FORMAT))
+        self.listener: Optional[QueueListener] = None
+        self.running = False
+        if queued:
+            self.handler = LazyQueueHandler(queue.SimpleQueue())
+            self.listener = QueueListener(self.handler.queue, self.file_handler)
+        else:
+            self.handler = self.file_handler
+        self.handler.addFilter(SamplingFilter(sample_rates))
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(level)
+        if self.listener:
+            self.listener.start()
+            self.running = True
+            os.register_at_fork(after_in_child=self._restart)
+            atexit.register(self.stop)
+
+    def _restart(self) -> None:
+        if not self.running:
+            return
+        # The thread of the listener does not survive the fork; the records queued before it are the parent's
+        self.handler.queue = queue.SimpleQueue()
+        self.listener = QueueListener(self.handler.queue, self.file_handler)
+        self.listener.start()
+
+    def stop(self) -> None:
+        if self.running:
+            self.running = False
+            self.listener.stop()
 
 
 class Loggable:
-    """Logging decorator. Logs the input and output of functions.
+    """Logging decorator. Logs the input and output of functions (see `Summary`).
+
+    Stacked decorators of the same logger (e.g. the `APIErrorHandler`s of a view) log each call once.
 
     Example:
         @Loggable("main")
@@ -16,16 +186,34 @@ class Loggable:
         self.logger = logging.getLogger(class_name)
 
     def __call__(self, *args):
+        func = args[0]
+        if getattr(func, "_logged_by", None) == self.logger.name:
+            return func
+
+        # Keeps the attributes of the function; e.g. `make_cache_key` of `cache.memoize`
+        @wraps(func)
         def wrapper(*_args, **_kwargs):
+            started = time.perf_counter()
             try:
-                val = args[0](*_args, **_kwargs)
-                self.logger.info(f".{args[0].__name__}({_args, *_kwargs.items()}) => {val}")
-                return val
-            except BaseException as e:
-                self.logger.info(f".{args[0].__name__}({_args, *_kwargs.items()})")
-                raise e
+                val = func(*_args, **_kwargs)
+            except BaseException:
+                self._log(func, _args, _kwargs, started, "raised")
+                raise
+            self._log(func, _args, _kwargs, started, "returned", val)
+            return val
+        wrapper._logged_by = self.logger.name
         return wrapper
 
+    def _log(self, func, args: tuple, kwargs: dict, started: float, outcome: str, *val) -> None:
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        extra = {"function": func.__name__, "elapsed_ms": (time.perf_counter() - started) * 1000, "outcome": outcome}
+        call = _Call(f".{func.__name__}", args, kwargs)
+        if val:
+            self.logger.info("%s => %s", call, Summary(val[0]), extra=extra)
+        else:
+            self.logger.info("%s", call, extra=extra)
+
 
 class BasicErrorHandler(Loggable):
     """Logging and error handling decorator.
@@ -60,6 +248,7 @@ class BasicErrorHandler(Loggable):
                         raise e
                     else:
                         raise self.rethrow_as
+        wrapper._logged_by = self.logger.name
         return wrapper
 
 
@@ -101,4 +290,5 @@ class APIErrorHandler(Loggable):
                     # These statements will always be executed; they act as error message decorator
                     e2.data = {"info": {"error": e2.data["message"]}}
                     raise e2
+        wrapper._logged_by = self.logger.name
         return wrapper
@@ -0,0 +1,519 @@
+"""Prometheus metrics of the application, aggregated across the processes of the host.
+
+Each process counts in memory; an observation is a dictionary update under a short, local
+lock (no I/O, no inter-process synchronization). Every `METRICS_FLUSH_SECONDS`, a daemon
+thread of the process (started on its first observation; never with `METRICS_ENABLED=False`),
+and its exit, writes its values to `METRICS_DIR/<pid>-<nonce>.json`; the nonce is drawn at the
+start of the process, so a process reusing the pid of an exited one never overwrites its
+counters. `/metrics` then sums the values of the scraping process with the files of the other
+ones (the other API workers, and the `get_raw_data.py` runs):
+    - counters and histograms: of every process. The files of the exited processes are folded
+        into `METRICS_DIR/aggregate.json` (and deleted) by the scrapes, so a scrape only reads
+        the files of the running processes, however often the workers are recycled.
+    - gauges: of the running processes only, i.e. of the files written within the last
+        `METRICS_STALE_FLUSHES` flushes (but `ingestion_last_run_timestamp_seconds`, the latest
+        of every process).
+The values inherited by a forked process (e.g. from the preloading master) are reset in it.
+
+The stats of the other components (`SingleFlight.groups`, the `TwoTierCache` of `app.cache`,
+the in-memory `store`) are read by collectors, when the values are flushed or scraped.
+
+Metrics:
+    - http_request_duration_seconds (histogram): by `resource` (e.g. "StatisticsView"),
+        `method` and `status`.
+    - db_statement_duration_seconds (histogram): by `operation` (e.g. "SELECT"); its
+        `_count` is the number of statements.
+    - db_pool_checkout_wait_seconds (histogram): the wait for a pooled connection.
+    - cache_lookups_total (counter): by memoized `function` and `result` ("hit_l1", "hit_l2",
+        "miss"); see `CacheMetrics`.
+    - ingested_rows_total (counter): by `symbol` and `kind` ("inserted", "updated", "skipped").
+    - ingestion_runs_total (counter), ingestion_last_run_timestamp_seconds (gauge); written by
+        `record_ingestion`.
+    - singleflight_*, cache_*, series_store_* (collected).
+"""
+from bisect import bisect_left
+from functools import wraps
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from uuid import uuid4
+from conf.settings import METRICS_DIR, METRICS_ENABLED, METRICS_FLUSH_SECONDS
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+# A process whose file was not written for this many flushes has exited
+METRICS_STALE_FLUSHES = 3
+# The file holding the counters and histograms of the exited processes
+AGGREGATE = "aggregate"
+logger = logging.getLogger("metrics")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format(name: str, labels: Iterable[Tuple[str, str]], value: float) -> str:
+    text = ",".join(f'{key}="{_escape(label)}"' for key, label in labels)
+    return f"{name}{{{text}}} {value!r}" if text else f"{name} {value!r}"
+
+
+def _running(name: str) -> bool:
+    """Whether the process of a `<pid>-<nonce>` file name is running."""
+    try:
+        pid = int(name.split("-", 1)[0])
+    except ValueError:
+        return False
+    # This pid was then the one of an exited process
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metric:
+    """A metric of `registry`; its samples are kept by the registry, by their labels.
+
+    Args:
+        merge (str): How the values of the processes are merged; "sum", or "max".
+        live_only (bool): Only merge the values of the running processes.
+    """
+    def __init__(self, name: str, kind: str, help: str, buckets: Tuple[float, ...] = (), merge: str = "sum", live_only: bool = False):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.buckets = buckets
+        self.merge = merge
+        self.live_only = live_only
+        registry.metrics[name] = self
+
+
+class Counter(Metric):
+    def __init__(self, name: str, help: str):
+        super().__init__(name, "counter", help)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        registry.add(self.name, _labels(labels), amount)
+
+
+class Gauge(Metric):
+    """Summed over the running processes by default."""
+    def __init__(self, name: str, help: str, merge: str = "sum", live_only: bool = True):
+        super().__init__(name, "gauge", help, merge=merge, live_only=live_only)
+
+    def set(self, value: float, **labels) -> None:
+        registry.set(self.name, _labels(labels), value)
+
+
+class Histogram(Metric):
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, "histogram", help, buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        registry.observe(self.name, _labels(labels), bisect_left(self.buckets, value), value, len(self.buckets))
+
+
+class Registry:
+    """The metrics of this process (see the module docstring)."""
+    def __init__(self, directory: str = METRICS_DIR, flush_seconds: float = METRICS_FLUSH_SECONDS, enabled: bool = METRICS_ENABLED):
+        self.directory = Path(directory)
+        self.flush_seconds = flush_seconds
+        self.enabled = enabled
+        self.metrics: Dict[str, Metric] = {}
+        # Callables returning the (name, labels, value) of collected counters and gauges; by name
+        self.collectors: Dict[str, Callable[[], Iterable[Tuple[str, Dict[str, object], float]]]] = {}
+        self._reset()
+        self._start()
+        os.register_at_fork(after_in_child=self._forked)
+        atexit.register(self.flush)
+
+    def _reset(self) -> None:
+        self.values: Dict[Tuple[str, Labels], float] = {}
+        # Per bucket (the last one is +Inf) counts, and the sum of the observations
+        self.histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def _start(self) -> None:
+        self.name = f"{os.getpid()}-{uuid4().hex[:8]}"
+        self._flush_lock = threading.Lock()
+        self._flushing = False
+
+    def _start_flushing(self) -> None:
+        """Starts the flushing thread; called (under `_lock`) by the first observation."""
+        self._flushing = True
+        threading.Thread(target=self._run, name="metrics-flush", daemon=True).start()
+
+    def _forked(self) -> None:
+        # The values are the parent's, and its flushing thread did not survive the fork
+        self._reset()
+        self._start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def add(self, name: str, labels: Labels, amount: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.values[name, labels] = self.values.get((name, labels), 0) + amount
+            if not self._flushing:
+                self._start_flushing()
+
+    def set(self, name: str, labels: Labels, value: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.values[name, labels] = value
+            if not self._flushing:
+                self._start_flushing()
+
+    def observe(self, name: str, labels: Labels, bucket: int, value: float, buckets: int) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if not self._flushing:
+                self._start_flushing()
+            counts = self.histograms.get((name, labels))
+            if counts is None:
+                counts = self.histograms[name, labels] = [0] * (buckets + 2)
+            counts[bucket] += 1
+            counts[-1] += value
+
+    def snapshot(self) -> Dict[str, list]:
+        """The values of this process, collected ones included; as written to its file."""
+        with self._lock:
+            values = [[name, labels, value] for (name, labels), value in self.values.items()]
+            histograms = [[name, labels, list(counts)] for (name, labels), counts in self.histograms.items()]
+        for collector in list(self.collectors.values()):
+            try:
+                values += [[name, _labels(labels), value] for name, labels, value in collector()]
+            except Exception:
+                logger.exception("Metrics collector failed.")
+        return {"values": values, "histograms": histograms}
+
+    def flush(self) -> None:
+        """Writes the values of this process to its file. Called by the flushing thread, and at exit."""
+        if not self.enabled:
+            return
+        snapshot = self.snapshot()
+        if not (snapshot["values"] or snapshot["histograms"]):
+            return
+        with self._flush_lock:
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                tmp = self.directory / f".{self.name}.json"
+                tmp.write_text(json.dumps(snapshot))
+                os.replace(tmp, self.directory / f"{self.name}.json")
+            except OSError as e:
+                logger.warning(f"Could not flush metrics: {e}")
+
+    def _merge(self, values: Dict, histograms: Dict, snapshot: Dict[str, list], alive: bool) -> None:
+        """Adds the values and histograms of a snapshot to the merged ones."""
+        for name, labels, value in snapshot["values"]:
+            metric = self.metrics.get(name)
+            if metric is None or (metric.live_only and not alive):
+                continue
+            key = (name, tuple(map(tuple, labels)))
+            values[key] = max(values.get(key, value), value) if metric.merge == "max" else values.get(key, 0) + value
+        for name, labels, counts in snapshot["histograms"]:
+            metric = self.metrics.get(name)
+            if metric is None or len(counts) != len(metric.buckets) + 2:
+                continue
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [0] * len(counts))
+            for i, count in enumerate(counts):
+                merged[i] += count
+
+    def _fold(self, aggregate: Dict[str, list], paths: List[Path]) -> Dict[str, list]:
+        """Adds the files of exited processes to the aggregate, writes it, and deletes them.
+
+        The aggregate lists the names it holds (`folded`); so a file that could not be deleted
+        is not counted twice.
+        """
+        values: Dict[Tuple[str, Labels], float] = {}
+        histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        self._merge(values, histograms, aggregate, alive=False)
+        folded = [name for name in aggregate.get("folded", []) if (self.directory / f"{name}.json").exists()]
+        for path in paths:
+            try:
+                self._merge(values, histograms, json.loads(path.read_text()), alive=False)
+            except (OSError, ValueError):
+                continue
+            folded.append(path.stem)
+        aggregate = {
+            "values": [[name, labels, value] for (name, labels), value in values.items()],
+            "histograms": [[name, labels, counts] for (name, labels), counts in histograms.items()],
+            "folded": folded
+        }
+        tmp = self.directory / f".{AGGREGATE}.json"
+        tmp.write_text(json.dumps(aggregate))
+        os.replace(tmp, self.directory / f"{AGGREGATE}.json")
+        for path in paths:
+            path.unlink(missing_ok=True)
+        return aggregate
+
+    def _snapshots(self) -> Iterable[Tuple[bool, Dict[str, list]]]:
+        """Yields (alive, snapshot) of this process, of the other running processes, and the
+        aggregate of the exited ones (into which their files are folded first).
+
+        Requires the lock of the directory (see `collect`).
+        """
+        yield True, self.snapshot()
+        try:
+            aggregate = json.loads((self.directory / f"{AGGREGATE}.json").read_text())
+        except (OSError, ValueError):
+            aggregate = {"values": [], "histograms": [], "folded": []}
+        folded = set(aggregate.get("folded", []))
+        exited = []
+        for path in self.directory.glob("*.json"):
+            # This process, the files being written, and the aggregate
+            if path.stem in (self.name, AGGREGATE) or path.name.startswith("."):
+                continue
+            if path.stem in folded:
+                path.unlink(missing_ok=True)
+                continue
+            if not _running(path.stem):
+                exited.append(path)
+                continue
+            try:
+                age = time.time() - path.stat().st_mtime
+                yield age <= METRICS_STALE_FLUSHES * self.flush_seconds, json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+        if exited:
+            try:
+                aggregate = self._fold(aggregate, exited)
+            except OSError as e:
+                logger.warning(f"Could not fold the metrics of the exited processes: {e}")
+                # Read from their files, until a later scrape folds them
+                for path in exited:
+                    try:
+                        yield False, json.loads(path.read_text())
+                    except (OSError, ValueError):
+                        continue
+        yield False, aggregate
+
+    def collect(self) -> Tuple[Dict[Tuple[str, Labels], float], Dict[Tuple[str, Labels], List[float]]]:
+        """Returns the values and the histograms of all the processes, summed."""
+        values: Dict[Tuple[str, Labels], float] = {}
+        histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            lock = open(self.directory / f".{AGGREGATE}.lock", "a")
+        except OSError as e:
+            logger.warning(f"Could not read the metrics of the other processes: {e}")
+            self._merge(values, histograms, self.snapshot(), alive=True)
+            return values, histograms
+        # The scrapes of the workers would otherwise fold the same files concurrently
+        with lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                for alive, snapshot in self._snapshots():
+                    self._merge(values, histograms, snapshot, alive)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return values, histograms
+
+    def exposition(self) -> str:
+        """The metrics of all the processes, in the Prometheus text format."""
+        values, histograms = self.collect()
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines += [f"# HELP {name} {metric.help}", f"# TYPE {name} {metric.kind}"]
+            if metric.kind != "histogram":
+                lines += [_format(name, labels, value) for (key, labels), value in sorted(values.items()) if key == name]
+                continue
+            for (key, labels), counts in sorted(histograms.items()):
+                if key != name:
+                    continue
+                total = 0
+                for bound, count in zip([*metric.buckets, float("inf")], counts):
+                    total += count
+                    lines.append(_format(f"{name}_bucket", [*labels, ("le", "+Inf" if bound == float("inf") else repr(bound))], total))
+                lines += [_format(f"{name}_sum", labels, counts[-1]), _format(f"{name}_count", labels, total)]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Latency of the API requests, by Resource.")
+SQL_SECONDS = Histogram("db_statement_duration_seconds", "Duration of the SQL statements.", SQL_BUCKETS)
+POOL_WAIT_SECONDS = Histogram("db_pool_checkout_wait_seconds", "Wait for a pooled database connection.", SQL_BUCKETS)
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Cache lookups of the memoized functions, by result.")
+INGESTED_ROWS = Counter("ingested_rows_total", "Rows of the ingestions, by symbol and kind.")
+INGESTION_RUNS = Counter("ingestion_runs_total", "Runs of get_raw_data.py.")
+INGESTION_LAST_RUN = Gauge("ingestion_last_run_timestamp_seconds", "End of the last ingestion run.", merge="max", live_only=False)
+
+
+class CacheMetrics:
+    """Counts the lookups of the results of a memoized function, in `cache_lookups_total`.
+
+    Placed right above `cache.memoize`; `TwoTierCache.get` reports its lookups to the function
+    being called by the thread (see `lookup`). Also a context manager, for the lookups made
+    outside of the memoized function (e.g. `cache.get_many` of its keys).
+
+    Example:
+        @CacheMetrics("get_statistics")
+        @cache.memoize(50)
+        def main(start_date, end_date, symbol): ...
+    """
+    _local = threading.local()
+
+    def __init__(self, function: str):
+        self.function = function
+
+    @classmethod
+    def lookup(cls, key: str, result: str) -> None:
+        function = getattr(cls._local, "function", None)
+        # Not the version keys of `cache.memoize`
+        if function is not None and not key.endswith("_memver"):
+            CACHE_LOOKUPS.inc(function=function, result=result)
+
+    def __enter__(self) -> "CacheMetrics":
+        self._local.__dict__.setdefault("stack", []).append(getattr(self._local, "function", None))
+        self._local.function = self.function
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._local.function = self._local.stack.pop()
+
+    def __call__(self, func: Callable) -> Callable:
+        # The attributes of `cache.memoize` (e.g. `make_cache_key`) are kept
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return wrapper
+
+
+class MeteredQueuePool(QueuePool):
+    """`QueuePool` timing the checkouts (the wait for a free connection, or a new one) in
+    `db_pool_checkout_wait_seconds`. Kept by `engine.dispose()`, which recreates the pool of the same class."""
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = conn.info.get("metrics_started")
+    if started:
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        SQL_SECONDS.observe(time.perf_counter() - started.pop(), operation=operation if operation.isalpha() else "OTHER")
+
+
+def _handle_error(context) -> None:
+    started = context.connection.info.get("metrics_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def instrument_engines() -> None:
+    """Times the SQL statements of every engine. Idempotent."""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+
+
+def record_ingestion(report) -> None:
+    """Counts the rows of an `IngestionReport`, and writes them out (the ingestion is a short run)."""
+    for symbol, counts in report.counts.items():
+        for kind, n in counts.items():
+            if n:
+                INGESTED_ROWS.inc(n, symbol=symbol, kind=kind)
+    INGESTION_RUNS.inc()
+    INGESTION_LAST_RUN.set(time.time())
+    registry.flush()
+
+
+def _collected(prefix: str, stats: Dict[str, float], kinds: Dict[str, str], **labels) -> List[Tuple[str, Dict[str, object], float]]:
+    return [(f"{prefix}_{key}{'_total' if kinds[key] == 'counter' else ''}", labels, value) for key, value in stats.items() if key in kinds]
+
+
+SINGLEFLIGHT_KINDS = {"calls": "counter", "coalesced": "counter", "cross_process_waits": "counter", "in_flight": "gauge"}
+CACHE_KINDS = {"hits_l1": "counter", "hits_l2": "counter", "misses": "counter", "evictions_l1": "counter", "bytes_l1": "gauge", "items_l1": "gauge"}
+STORE_KINDS = {"loads": "counter", "appends": "counter"}
+for _prefix, _kinds, _help in (
+    ("singleflight", SINGLEFLIGHT_KINDS, "SingleFlight.stats() of the flight groups, by group."),
+    ("cache", CACHE_KINDS, "TwoTierCache.stats() of app.cache."),
+    ("series_store", STORE_KINDS, "Symbol loads and incremental appends of the in-memory store.")
+):
+    for _key, _kind in _kinds.items():
+        (Counter if _kind == "counter" else Gauge)(f"{_prefix}_{_key}{'_total' if _kind == 'counter' else ''}", _help)
+
+
+def register_collectors(app) -> None:
+    """Collects the stats of the single-flight groups, of the cache of `app`, and of the in-memory store."""
+    from lib.singleflight import SingleFlight
+    from financial.series_store import store
+
+    def singleflight() -> list:
+        return [sample for name, group in SingleFlight.groups.items() for sample in _collected("singleflight", group.stats(), SINGLEFLIGHT_KINDS, group=name)]
+
+    def cache() -> list:
+        backends = [backend for backend in app.extensions.get("cache", {}).values() if hasattr(backend, "stats")]
+        return [sample for backend in backends for sample in _collected("cache", backend.stats(), CACHE_KINDS)]
+
+    def series_store() -> list:
+        return _collected("series_store", {"loads": store.loads, "appends": store.appends}, STORE_KINDS)
+
+    registry.collectors.update(singleflight=singleflight, cache=cache, series_store=series_store)
+
+
+def init_app(app) -> None:
+    """Times the requests of `app` (by Resource), and adds the `/metrics` endpoint."""
+    from flask import Response, g, request
+
+    @app.before_request
+    def start_timer() -> None:
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            view = app.view_functions.get(request.endpoint)
+            resource = getattr(view, "view_class", None)
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                resource=resource.__name__ if resource else (request.endpoint or "unmatched"),
+                method=request.method,
+                status=response.status_code
+            )
+        return response
+
+    def metrics() -> Response:
+        return Response(registry.exposition(), content_type=CONTENT_TYPE)
+
+    app.add_url_rule("/metrics", "metrics", metrics)
+    instrument_engines()
+    register_collectors(app)
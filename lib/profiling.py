@@ -0,0 +1,146 @@
+"""On-demand profiling of single requests.
+
+`RequestProfiler` wraps the WSGI application, and profiles the requests that send the
+`PROFILE_TOKEN` in their `X-Profile` header, or a random `PROFILE_SAMPLE_RATE` share of them.
+It is only installed when one of these is set (see `app.create_app`), so it costs nothing
+otherwise.
+
+Each profiled request writes, to `PROFILES_DIR`:
+    - `<id>.prof`: The `cProfile` statistics of the request thread (`python -m pstats`, snakeviz).
+    - `<id>.collapsed`: The stacks of the request thread, sampled every `PROFILE_INTERVAL_SECONDS`
+        by a background thread, from the application down; one `frame;frame;... count` line per
+        distinct stack, as read by `flamegraph.pl` and speedscope.
+The `<id>` (`<time>-<pid>-<method>-<path>`) is sent back in the `X-Profile-Id` header.
+
+A process profiles one request at a time; the requests arriving meanwhile are served as usual.
+A streamed response body is only profiled up to the return of the view.
+"""
+from collections import Counter
+from datetime import datetime
+from hmac import compare_digest
+from pathlib import Path
+from types import FrameType
+from typing import Any, Callable, Iterable, Optional
+import cProfile
+import logging
+import os
+import random
+import re
+import sys
+import threading
+
+HEADER = "X-Profile"
+ID_HEADER = "X-Profile-Id"
+
+
+class StackSampler:
+    """Counts the stacks of a thread, sampled every `interval` seconds, below the `root` frame.
+
+    Example:
+        with StackSampler(threading.get_ident(), sys._getframe()) as sampler:
+            work()
+        sampler.collapsed()                     # => "app.main;app.work 12\\n..."
+    """
+    def __init__(self, thread_id: int, root: Optional[FrameType] = None, interval: float = 0.001):
+        self.thread_id = thread_id
+        self.root = root
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    @staticmethod
+    def _name(frame: FrameType) -> str:
+        code = frame.f_code
+        # `co_qualname` (with the class of the methods) is only available from Python 3.11
+        return f"{frame.f_globals.get('__name__', '?')}.{getattr(code, 'co_qualname', code.co_name)}"
+
+    def sample(self) -> None:
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None and frame is not self.root:
+            stack.append(self._name(frame))
+            frame = frame.f_back
+        if stack:
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfiler:
+    """WSGI middleware; profiles the requests opted in by the `X-Profile` header, or sampled.
+
+    Args:
+        app (Callable): The WSGI application (e.g. `flask_app.wsgi_app`).
+        profiles_dir (str): Where the profiles are written.
+        token (Optional[str]): The value of the `X-Profile` header that opts a request in.
+        sample_rate (float): Share of the requests profiled at random.
+        interval (float): Seconds between two samples of the stack.
+    """
+    def __init__(self, app: Callable, profiles_dir: str, token: Optional[str] = None, sample_rate: float = 0, interval: float = 0.001):
+        self.app = app
+        self.profiles_dir = Path(profiles_dir)
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.logger = logging.getLogger("RequestProfiler")
+        # `cProfile` allows one active profiler per process (from Python 3.12)
+        self._lock = threading.Lock()
+
+    def wanted(self, environ: dict) -> bool:
+        header = environ.get("HTTP_" + HEADER.upper().replace("-", "_"))
+        if self.token and header is not None:
+            return compare_digest(header.encode(), self.token.encode())
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def profile_id(self, environ: dict) -> str:
+        path = re.sub(r"[^A-Za-z0-9]+", "_", environ.get("PATH_INFO", "")).strip("_") or "root"
+        return f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{os.getpid()}-{environ.get('REQUEST_METHOD', 'GET')}-{path[:64]}"
+
+    def __call__(self, environ: dict, start_response: Callable) -> Iterable[Any]:
+        if not self.wanted(environ) or not self._lock.acquire(blocking=False):
+            return self.app(environ, start_response)
+        try:
+            return self._profiled(environ, start_response)
+        finally:
+            self._lock.release()
+
+    def _profiled(self, environ: dict, start_response: Callable) -> Iterable[Any]:
+        profile_id = self.profile_id(environ)
+
+        def start_profiled_response(status, headers, exc_info=None):
+            return start_response(status, [*headers, (ID_HEADER, profile_id)], exc_info)
+
+        profiler = cProfile.Profile()
+        sampler = StackSampler(threading.get_ident(), sys._getframe(), self.interval)
+        try:
+            with sampler:
+                profiler.enable()
+                try:
+                    return self.app(environ, start_profiled_response)
+                finally:
+                    profiler.disable()
+        finally:
+            try:
+                self.save(profile_id, profiler, sampler)
+            except OSError:
+                self.logger.exception("Could not save the profile %s.", profile_id)
+
+    def save(self, profile_id: str, profiler: cProfile.Profile, sampler: StackSampler) -> None:
+        self.profiles_dir.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(self.profiles_dir / f"{profile_id}.prof")
+        (self.profiles_dir / f"{profile_id}.collapsed").write_text(sampler.collapsed())
+        self.logger.info("Profiled %s (%d stack samples).", profile_id, sum(sampler.stacks.values()))
@@ -0,0 +1,44 @@
+"""Rate limiting of the calls to external APIs."""
+from typing import Callable
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket: allows bursts of `capacity` calls, refilled at `rate` per second.
+
+    Example:
+        # The quota of the provider: 5 calls per minute
+        limiter = TokenBucket(rate=5 / 60, capacity=5)
+        limiter.acquire()   # Blocks until a call is allowed
+    """
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self) -> float:
+        """Takes a token if there is one, and returns 0; otherwise returns the seconds to wait."""
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self) -> None:
+        """Blocks until a token is taken."""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            self._sleep(wait)
@@ -0,0 +1,194 @@
+"""On-disk cache of the raw responses of external APIs.
+
+Layout, under `directory`:
+    - objects/<ab>/<sha256>.json.gz: The gzipped bodies, addressed by the sha256 of their
+        (uncompressed) content; so identical responses are stored once.
+    - refs/<function>/<symbol>/<output size>/<date>: The sha256 of the response of the request,
+        made on that (as-of) date.
+
+A reference is fresh for `ttl_seconds` after it was written; in replay mode, the freshness is
+ignored, and the newest reference up to the requested date is used. The total size of the
+objects is kept under `max_bytes`, by dropping the oldest references (and the objects they
+were the last ones to point to).
+
+Example:
+    cache = ResponseCache()
+    key = ResponseKey("TIME_SERIES_DAILY_ADJUSTED", "IBM", "compact", date.today())
+    body = cache.read(key)
+    if body is None:
+        body = requests.get(...).content
+        cache.put(key, body)
+"""
+from conf.settings import RESPONSE_CACHE_DIR, RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_BYTES
+from datetime import date
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, NamedTuple, Optional
+import contextlib
+import gzip
+import hashlib
+import os
+import tempfile
+import time
+
+ORPHAN_GRACE_SECONDS = 60
+
+
+class ResponseKey(NamedTuple):
+    function: str
+    symbol: str
+    output_size: str
+    as_of: date
+
+
+class ResponseCache:
+    def __init__(self, directory: str = RESPONSE_CACHE_DIR, ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.objects = self.directory / "objects"
+        self.refs = self.directory / "refs"
+
+    def _ref_path(self, key: ResponseKey) -> Path:
+        return self.refs / key.function / key.symbol / key.output_size / key.as_of.isoformat()
+
+    def _object_path(self, digest: str) -> Path:
+        return self.objects / digest[:2] / f"{digest}.json.gz"
+
+    def _find_ref(self, key: ResponseKey, replay: bool) -> Optional[Path]:
+        path = self._ref_path(key)
+        if replay:
+            # The newest response made up to the as-of date
+            if not path.parent.is_dir():
+                return None
+            days = sorted(p.name for p in path.parent.iterdir() if p.name <= path.name and not p.name.startswith("."))
+            return path.parent / days[-1] if days else None
+        try:
+            if time.time() - path.stat().st_mtime < self.ttl_seconds:
+                return path
+        except FileNotFoundError:
+            pass
+        return None
+
+    def open(self, key: ResponseKey, replay: bool = False) -> Optional[BinaryIO]:
+        """Returns the (decompressed) body of the response of `key`; or None, if it is not cached (or stale)."""
+        ref = self._find_ref(key, replay)
+        if ref is None:
+            return None
+        try:
+            return gzip.open(self._object_path(ref.read_text().strip()), "rb")
+        except FileNotFoundError:
+            # Evicted by another process meanwhile
+            return None
+
+    def read(self, key: ResponseKey, replay: bool = False) -> Optional[bytes]:
+        body = self.open(key, replay)
+        if body is None:
+            return None
+        with body:
+            return body.read()
+
+    def put(self, key: ResponseKey, content: bytes) -> None:
+        with self.writer(key) as writer:
+            writer.write(content)
+
+    @contextlib.contextmanager
+    def writer(self, key: ResponseKey) -> Iterator["_Writer"]:
+        """Writes a response while it is downloaded; it is only stored if the block completes
+        (without an exception), and `_Writer.discard` was not called."""
+        writer = _Writer(self)
+        try:
+            yield writer
+        except BaseException:
+            writer.discard()
+            raise
+        writer.commit(key)
+
+    def _link(self, key: ResponseKey, digest: str) -> None:
+        ref = self._ref_path(key)
+        ref.parent.mkdir(parents=True, exist_ok=True)
+        _atomic_write(ref, digest.encode())
+
+    def evict(self) -> int:
+        """Drops the oldest references until the objects fit in `max_bytes`.
+
+        Returns:
+            int: Number of the deleted objects.
+        """
+        refs = sorted(
+            ((p.stat().st_mtime, p, p.read_text().strip()) for p in self.refs.glob("*/*/*/*") if not p.name.startswith(".")),
+            key=lambda ref: ref[0]
+        ) if self.refs.is_dir() else []
+        users = {}
+        for _, _, digest in refs:
+            users[digest] = users.get(digest, 0) + 1
+        stats = {p.name[:-len(".json.gz")]: p.stat() for p in self.objects.glob("*/*.json.gz")}
+        sizes = {digest: stat.st_size for digest, stat in stats.items()}
+        deleted = 0
+        # Objects without any reference (e.g. of a crashed process) first; unless they were just
+        # written, and their reference is about to be
+        orphaned_before = time.time() - ORPHAN_GRACE_SECONDS
+        for digest in [d for d in sizes if d not in users and stats[d].st_mtime < orphaned_before]:
+            self._object_path(digest).unlink(missing_ok=True)
+            del sizes[digest]
+            deleted += 1
+        total = sum(sizes.values())
+        for _, path, digest in refs:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            users[digest] -= 1
+            if not users[digest] and digest in sizes:
+                self._object_path(digest).unlink(missing_ok=True)
+                total -= sizes.pop(digest)
+                deleted += 1
+        return deleted
+
+
+class _Writer:
+    """Compresses a response into a temporary file, while hashing its content."""
+    def __init__(self, cache: ResponseCache):
+        self.cache = cache
+        cache.objects.mkdir(parents=True, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=cache.objects, prefix=".", suffix=".tmp")
+        self._file = os.fdopen(fd, "wb")
+        self._gzip = gzip.GzipFile(fileobj=self._file, mode="wb", compresslevel=6, mtime=0)
+        self._hash = hashlib.sha256()
+        self.discarded = False
+
+    def write(self, chunk: bytes) -> None:
+        self._hash.update(chunk)
+        self._gzip.write(chunk)
+
+    def tee(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Yields the `chunks`, writing them along."""
+        for chunk in chunks:
+            self.write(chunk)
+            yield chunk
+
+    def _close(self) -> None:
+        if not self._file.closed:
+            self._gzip.close()
+            self._file.close()
+
+    def discard(self) -> None:
+        self.discarded = True
+        self._close()
+        Path(self.path).unlink(missing_ok=True)
+
+    def commit(self, key: ResponseKey) -> None:
+        if self.discarded:
+            return
+        self._close()
+        digest = self._hash.hexdigest()
+        target = self.cache._object_path(digest)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self.path, target)
+        self.cache._link(key, digest)
+        self.cache.evict()
+
+
+def _atomic_write(path: Path, content: bytes) -> None:
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".", suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    os.replace(tmp, path)
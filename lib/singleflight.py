@@ -0,0 +1,148 @@
+"""Single-flight coalescing of identical concurrent calls.
+
+When many requests ask for the same result at once, they all miss the cache and compute it
+independently (thundering herd). `SingleFlight` lets only the first call (the leader) run the
+function; the identical calls that arrive while it is in flight wait for it, and share its
+result (or its exception).
+
+Across the workers of a host (`cross_process=True`), the leaders of each process also take a
+file lock (one of `SINGLEFLIGHT_LOCK_STRIPES` lock files, by the hash of the call), so the
+other workers wait for the first one, and then find its result in the shared (L2) cache.
+This is why the decorator is placed above `cache.memoize`.
+"""
+from functools import wraps
+from hashlib import sha1
+from inspect import Signature, signature
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+from conf.settings import SINGLEFLIGHT_CROSS_PROCESS, SINGLEFLIGHT_LOCK_DIR, SINGLEFLIGHT_LOCK_STRIPES, SINGLEFLIGHT_WAIT_SECONDS
+import fcntl
+import logging
+import threading
+import time
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Decorator; coalesces the concurrent calls with identical (normalized) arguments.
+
+    Args:
+        name (str): Name of the flight group; also the key of `SingleFlight.groups`.
+        namespace (Optional[Callable[[str], str]]): Scopes the keys, e.g. `generations.namespace`,
+            so calls made for different data generations are never coalesced.
+        cross_process (bool): Also coalesce with the other processes of the host.
+
+    Example:
+        @Loggable("get_statistics")
+        @SingleFlight("get_statistics", namespace=generations.namespace)
+        @cache.memoize(50)
+        def main(start_date, end_date, symbol): ...
+    """
+    groups: Dict[str, "SingleFlight"] = {}
+
+    def __init__(
+        self,
+        name: str,
+        namespace: Optional[Callable[[str], str]] = None,
+        cross_process: bool = SINGLEFLIGHT_CROSS_PROCESS,
+        lock_dir: str = SINGLEFLIGHT_LOCK_DIR,
+        wait_seconds: float = SINGLEFLIGHT_WAIT_SECONDS
+    ):
+        self.name = name
+        self.namespace = namespace
+        self.cross_process = cross_process
+        self.lock_dir = Path(lock_dir)
+        self.wait_seconds = wait_seconds
+        self.logger = logging.getLogger(f"singleflight.{name}")
+        self.calls = 0
+        self.coalesced = 0
+        self.cross_process_waits = 0
+        self._in_flight: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        SingleFlight.groups[name] = self
+
+    def key(self, sig: Signature, args: tuple, kwargs: dict) -> str:
+        bound = sig.bind(*args, **kwargs)
+        bound.apply_defaults()
+        name = self.namespace(self.name) if self.namespace else self.name
+        return f"{name}|{sorted(bound.arguments.items())!r}"
+
+    def __call__(self, func: Callable) -> Callable:
+        sig = signature(func)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = self.key(sig, args, kwargs)
+            with self._lock:
+                self.calls += 1
+                call = self._in_flight.get(key)
+                leader = call is None
+                if leader:
+                    call = self._in_flight[key] = _Call()
+                else:
+                    self.coalesced += 1
+            if not leader:
+                if not call.done.wait(self.wait_seconds):
+                    self.logger.warning(f"Timed out waiting for {key}; computing it independently")
+                    return func(*args, **kwargs)
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            try:
+                call.result = self._run_exclusive(key, func, args, kwargs) if self.cross_process else func(*args, **kwargs)
+                return call.result
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._in_flight[key]
+                call.done.set()
+        return wrapper
+
+    def _run_exclusive(self, key: str, func: Callable, args: tuple, kwargs: dict) -> Any:
+        """Runs `func` holding the (striped) host-wide lock of the `key`.
+
+        If the lock can not be taken within `wait_seconds`, runs it anyway.
+        """
+        stripe = int(sha1(key.encode()).hexdigest(), 16) % SINGLEFLIGHT_LOCK_STRIPES
+        try:
+            self.lock_dir.mkdir(parents=True, exist_ok=True)
+            lock = open(self.lock_dir / f"{stripe}.lock", "a")
+        except OSError as e:
+            self.logger.warning(f"Could not open the lock file: {e}")
+            return func(*args, **kwargs)
+        with lock:
+            deadline = time.monotonic() + self.wait_seconds
+            locked = waited = False
+            while not locked:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    locked = True
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        break
+                    waited = True
+                    time.sleep(0.005)
+            if waited:
+                with self._lock:
+                    self.cross_process_waits += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if locked:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "cross_process_waits": self.cross_process_waits,
+            "in_flight": len(self._in_flight)
+        }
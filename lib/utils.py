@@ -1,16 +1,32 @@
-from conf.settings import FIXTURES_DIR, TEST_FIXTURES_DIR
+from conf.settings import FIXTURES_DIR, TEST_FIXTURES_DIR, DEFAULT_DATE_FMT
 import json
+from datetime import date, datetime
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict
 
 
+# The fixtures are parsed once per process, and shared by their callers; so they must not be mutated.
+@lru_cache(maxsize=None)
 def load_err_messages() -> Dict[str, str]:
-    return json.load(open(Path(FIXTURES_DIR, "error_msg.json"), "r"))
+    with open(Path(FIXTURES_DIR, "error_msg.json"), "r") as f:
+        return json.load(f)
 
 
+@lru_cache(maxsize=None)
 def load_help_messages() -> Dict[str, str]:
-    return json.load(open(Path(FIXTURES_DIR, "help.json"), "r"))
+    with open(Path(FIXTURES_DIR, "help.json"), "r") as f:
+        return json.load(f)
 
 
 def load_test_fixture(name: str) -> Dict[str, str]:
     return open(Path(TEST_FIXTURES_DIR, f"{name}"), "r")
+
+
+def as_date(value: date | datetime | str) -> date:
+    """Normalizes a `date`, `datetime` or `DEFAULT_DATE_FMT` string, to a `date`."""
+    if isinstance(value, str):
+        return datetime.strptime(value, DEFAULT_DATE_FMT).date()
+    if isinstance(value, datetime):
+        return value.date()
+    return value
@@ -0,0 +1,36 @@
+"""Script for maintaining the `financial_data_rollup` table.
+
+Run the script using `python manage_rollups.py <command>`:
+    - rebuild: Recomputes the whole rollup table from `financial_data`.
+    - check: Compares the rollup table against `financial_data`. Exits with status 1 on inconsistency.
+"""
+import argparse
+import sys
+from app import create_app, db
+from financial import rollups
+
+
+def rebuild() -> int:
+    with create_app().app_context():
+        db.initialize()
+        print(f"Rebuilt {rollups.rebuild()} rollup rows.")
+    return 0
+
+
+def check() -> int:
+    with create_app().app_context():
+        db.initialize()
+        problems = rollups.check_consistency()
+    for problem in problems:
+        print(problem)
+    print(f"{len(problems)} inconsistent rollup rows.")
+    return 1 if problems else 0
+
+
+COMMANDS = {"rebuild": rebuild, "check": check}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=COMMANDS.keys())
+    sys.exit(COMMANDS[parser.parse_args().command]())
@@ -2,18 +2,29 @@
 The FinancialData model represents the stock market data, founded on: https://www.alphavantage.co/documentation
 
 The defined symbols are: IBM, AAPL
+
+The FinancialDataRollup model keeps per-symbol monthly and yearly sums/counts of the
+FinancialData records, maintained by `financial.rollups`.
+
+The IngestionWatermark model keeps the per-symbol ingestion high-water mark, and the content
+hashes of the recently ingested rows, maintained by `financial.ingestion`.
+
+The BackfillCheckpoint model keeps the progress of the full history backfill of a symbol,
+maintained by `financial.backfill`.
 """
 
-from app import db, cache
+from app import db
 from sqlalchemy.sql import func
 from sqlalchemy.orm import validates
 from sqlalchemy.dialects.mysql import INTEGER
 from sqlalchemy.schema import UniqueConstraint
 import enum
 from sqlalchemy import Enum
-from typing import Set, List, Dict, Any, Optional
+from typing import Set, List, Dict, Any, Optional, Callable, Iterable, Sequence
 from conf.settings import DEFAULT_DATE_FMT
 from lib.exceptions import SymbolUndefinedError
+import json
+import math
 
 db_core = db.core
 
@@ -37,7 +48,6 @@ class FinancialData(db_core.Model):
         IBM = 'IBM'
 
         @classmethod
-        @cache.memoize(50)
         def as_set(cls, codes_only: bool = False) -> Set:
             res = set(cls)
             if codes_only:
@@ -68,6 +78,12 @@ class FinancialData(db_core.Model):
         keys = list(keys)
         return f"`{cls.__tablename__}` ({', '.join(keys)})", keys
 
+    @classmethod
+    def upsert_index_keys(cls) -> List[str]:
+        """Columns of `unique_symbol_per_date_index`; used as the conflict target of upserts."""
+        constraint = next(c for c in cls.__table__.constraints if c.name == 'unique_symbol_per_date_index')
+        return [column.name for column in constraint.columns]
+
     def __eq__(self, other: object):
         return (self.id == other.id is not None) or (
             self.id == other.id and
@@ -98,7 +114,86 @@ class FinancialData(db_core.Model):
         return res
 
 
+class FinancialDataRollup(db_core.Model):
+    """Represents the pre-aggregated sums and count of `financial_data` per symbol and period.
+
+    Table: `financial_data_rollup`
+    PK: id (BigInt, AutoInc)
+    Index:
+        - PK
+        - Unique Constraint on (`symbol`, `granularity`, `period_start`)
+    """
+    __tablename__ = 'financial_data_rollup'
+    __table_args__ = (UniqueConstraint('symbol', 'granularity', 'period_start', name='unique_symbol_per_period_index'),)
+
+    class Granularity(enum.Enum):
+        MONTH = 'M'
+        YEAR = 'Y'
+
+    id = db_core.Column(INTEGER(unsigned=True), primary_key=True)
+    symbol = db_core.Column(Enum(FinancialData.Symbols, create_constraint=True), nullable=False)
+    granularity = db_core.Column(Enum(Granularity, create_constraint=True), nullable=False)
+    period_start = db_core.Column(db_core.Date(), nullable=False)
+    sum_open_price = db_core.Column(db_core.Float(precision=53), nullable=False)
+    sum_close_price = db_core.Column(db_core.Float(precision=53), nullable=False)
+    sum_volume = db_core.Column(db_core.BigInteger(), nullable=False)
+    count = db_core.Column(INTEGER(unsigned=True), nullable=False)
+    updated_at = db_core.Column(db_core.DateTime(timezone=True), nullable=False)
+
+    def __repr__(self):
+        return f'<FinancialDataRollup {self.symbol} {self.granularity} {self.period_start}>'
+
+    @classmethod
+    def upsert_index_keys(cls) -> List[str]:
+        """Columns of `unique_symbol_per_period_index`; used as the conflict target of upserts."""
+        constraint = next(c for c in cls.__table__.constraints if c.name == 'unique_symbol_per_period_index')
+        return [column.name for column in constraint.columns]
+
+
+class IngestionWatermark(db_core.Model):
+    """Represents the ingestion high-water mark of a symbol.
+
+    Table: `ingestion_watermark`
+    PK: symbol
+    `row_hashes` is a JSON object of {date: content hash} of the rows ingested within the last
+    `INGESTION_HASH_WINDOW_DAYS` days up to `last_date`.
+    """
+    __tablename__ = 'ingestion_watermark'
+
+    symbol = db_core.Column(Enum(FinancialData.Symbols, create_constraint=True), primary_key=True)
+    last_date = db_core.Column(db_core.Date(), nullable=False)
+    row_hashes = db_core.Column(db_core.Text(), nullable=False)
+    updated_at = db_core.Column(db_core.DateTime(timezone=True), nullable=False)
+
+    def __repr__(self):
+        return f'<IngestionWatermark {self.symbol} {self.last_date}>'
+
+
+class BackfillCheckpoint(db_core.Model):
+    """Represents the progress of the full history backfill of a symbol.
+
+    Table: `backfill_checkpoint`
+    PK: symbol
+    The committed rows of the backfill are within [`oldest_date`, `newest_date`]; the series is
+    sent newest first, so an interrupted backfill resumes before `oldest_date`.
+    """
+    __tablename__ = 'backfill_checkpoint'
+
+    symbol = db_core.Column(Enum(FinancialData.Symbols, create_constraint=True), primary_key=True)
+    newest_date = db_core.Column(db_core.Date(), nullable=False)
+    oldest_date = db_core.Column(db_core.Date(), nullable=False)
+    completed = db_core.Column(db_core.Boolean(), nullable=False, default=False)
+    updated_at = db_core.Column(db_core.DateTime(timezone=True), nullable=False)
+
+    def __repr__(self):
+        return f'<BackfillCheckpoint {self.symbol} {self.oldest_date}..{self.newest_date}>'
+
+
 class FinancialDataSerializer:
+    # Distinct dates whose JSON strings are kept by `compile`d encoders
+    DATE_CACHE_SIZE = 1 << 14
+    _date_cache: Dict[Any, str] = {}
+
     @classmethod
     def serialize(cls, objs: List[FinancialData], exclude: List[str] = []) -> List[Dict[str, Any]]:
         return list(map(lambda x: cls.transform(x, exclude), objs))
@@ -118,3 +213,56 @@ class FinancialDataSerializer:
         for attr in exclude:
             del res[attr]
         return res
+
+    @classmethod
+    def _encode_date(cls, d: Any) -> str:
+        res = cls._date_cache.get(d)
+        if res is None:
+            if len(cls._date_cache) >= cls.DATE_CACHE_SIZE:
+                cls._date_cache.clear()
+            res = cls._date_cache[d] = json.dumps(d.strftime(DEFAULT_DATE_FMT))
+        return res
+
+    @staticmethod
+    def _encode_price(value: float) -> str:
+        """`json.dumps(float("%.1f" % value))`; i.e. the `transform`ed price, marshalled by `fields.Float`."""
+        res = "%.1f" % value
+        # Up to 15 significant digits, the (shortest) repr of the float is the string itself
+        if -1e14 < value < 1e14:
+            return res
+        return json.dumps(float(res)) if math.isfinite(value) else json.dumps(value)
+
+    @classmethod
+    def compile_row(cls, keys: Sequence[str]) -> Callable[[FinancialData], str]:
+        """Returns an encoder of an object (or a row of its columns) as a JSON object, of its
+        `keys` (in that order).
+
+        The output is the same as `json.dumps` of the `transform`ed object, marshalled by the
+        `fields.String` (`symbol`), `fields.Date` (`date`), `fields.Float` (prices) and
+        `fields.Integer` (`volume`) of the API model. The encoders of the fields are resolved
+        once, and the other fields are never built.
+        """
+        symbols = {symbol: json.dumps(symbol.name) for symbol in FinancialData.Symbols}
+        symbols.update({symbol.name: encoded for symbol, encoded in symbols.items()})
+        encoders = {
+            "symbol": lambda o: symbols[o.symbol],
+            "date": lambda o: cls._encode_date(o.date),
+            "open_price": lambda o: cls._encode_price(o.open_price),
+            "close_price": lambda o: cls._encode_price(o.close_price),
+            "volume": lambda o: "null" if o.volume is None else str(int(o.volume))
+        }
+        fields = [encoders[key] for key in keys]
+        template = "{" + ", ".join(json.dumps(key) + ": %s" for key in keys) + "}"
+
+        def encode(o: FinancialData) -> str:
+            return template % tuple([field(o) for field in fields])
+        return encode
+
+    @classmethod
+    def compile(cls, keys: Sequence[str]) -> Callable[[Iterable[FinancialData]], str]:
+        """Returns an encoder of the objects as a JSON list; see `compile_row`."""
+        encode_row = cls.compile_row(keys)
+
+        def encode(objs: Iterable[FinancialData]) -> str:
+            return "[" + ", ".join([encode_row(o) for o in objs]) + "]"
+        return encode
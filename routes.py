@@ -4,22 +4,30 @@ This is the routing file. This is where the API namspace is defined, along with
 
 from flask_restx import Namespace, Resource, fields, reqparse, inputs
 from lib.logging import BasicErrorHandler, APIErrorHandler
+from lib.etag import ConditionalGet
+from lib.fastjson import FastMarshal
 from lib.utils import load_err_messages, load_help_messages
-from lib.exceptions import PageOutofBoundsError, SymbolUndefinedError
+from lib.exceptions import PageOutofBoundsError, SymbolUndefinedError, InvalidCursorError
 from flask_restx.errors import HTTPException
+from flask import Response, request, stream_with_context
 from datetime import datetime
 from model import FinancialData, FinancialDataSerializer
-from financial.list_financial_data import main as list_financial_data
+from financial.list_financial_data import main as list_financial_data, seek as seek_financial_data
 from financial.get_statistics import main as get_statistics
+from financial.get_batch_statistics import main as get_batch_statistics
+from financial.get_rolling_statistics import main as get_rolling_statistics
+from financial import export_financial_data
+from financial.warmup import recorder as request_shapes
 from math import ceil
 from flask_restx.errors import ValidationError
 from random import randint as rint, random as rfloat
-from conf.settings import DEFAULT_DATE_FMT
-from typing import List, Dict
+from conf.settings import DEFAULT_DATE_FMT, BATCH_STATISTICS_MAX_ITEMS, ROLLING_MAX_WINDOW
+from typing import List, Dict, Optional
 
 
 help_messages = load_help_messages()["api"]
 err_messages = load_err_messages()
+SYMBOL_CODES = sorted(FinancialData.Symbols.as_set(codes_only=True))
 api = Namespace("financial_api", help_messages["desc"], path="/")
 
 INFO_BASE_RESPONSE = api.model('ExtraInformation', {
@@ -34,7 +42,9 @@ PAGINATION_BASE_RESPONSE = api.model('Pagination', {
     'count': fields.Integer(required=True),
     'page': fields.Integer(required=True),
     'limit': fields.Integer(required=True),
-    'pages': fields.Integer(required=True)
+    'pages': fields.Integer(required=True),
+    # Only set in cursor mode; `count`, `page` and `pages` are null in that mode.
+    'next_cursor': fields.String(description=help_messages["fields"]["next_cursor"])
 })
 
 
@@ -42,28 +52,44 @@ class EmptyContentException(HTTPException):
     code = 404
 
 
+def serialize_financial_data(data: List[FinancialData]) -> List[Dict]:
+    return FinancialDataSerializer.serialize(data, exclude=["id", "created_at", "updated_at"])
+
+
+def serialize_statistics(data: Dict) -> Dict:
+    return {
+        "average_daily_open_price": float("%.1f" % data['average_daily_open_price']),
+        "average_daily_close_price": float("%.1f" % data['average_daily_close_price']),
+        "average_daily_volume": float("%.1f" % data['average_daily_volume'])
+    }
+
+
 @api.route('/financial_data', methods=['GET'])
 class FinancialDataView(Resource):
+    DATA = api.model("Model::FinancialDataSummary", {
+        "symbol": fields.String(example=SYMBOL_CODES[0]),
+        "date": fields.Date(example=datetime.now().strftime(DEFAULT_DATE_FMT)),
+        "open_price": fields.Float(example=(rfloat() * 100) // 1),
+        "close_price": fields.Float(example=(rfloat() * 100) // 1),
+        "volume": fields.Integer(example=rint(1, 100))
+    }, as_list=True)
     RESPONSE = api.inherit('Response::ListFinancialData', INFO_BASE_RESPONSE, {
-        'data': fields.Nested(
-            api.model("Model::FinancialDataSummary", {
-                "symbol": fields.String(example=FinancialData.Symbols.as_set(codes_only=True).pop()),
-                "date": fields.Date(example=datetime.now().strftime(DEFAULT_DATE_FMT)),
-                "open_price": fields.Float(example=(rfloat() * 100) // 1),
-                "close_price": fields.Float(example=(rfloat() * 100) // 1),
-                "volume": fields.Integer(example=rint(1, 100))
-            }, as_list=True),
-            allow_null=True),
+        'data': fields.Nested(DATA, allow_null=True),
         'pagination': fields.Nested(PAGINATION_BASE_RESPONSE, allow_null=True)
     })
 
     REQUEST = reqparse.RequestParser()
     REQUEST.add_argument('start_date', type=inputs.date, location='args', help=help_messages["fields"]["date"], store_missing=False)
     REQUEST.add_argument('end_date', type=inputs.date, location='args', help=help_messages["fields"]["date"], store_missing=False)
-    REQUEST.add_argument('symbol', choices=list(FinancialData.Symbols.as_set(codes_only=True)), type=str, location='args', store_missing=False)
+    REQUEST.add_argument('symbol', choices=SYMBOL_CODES, type=str, location='args', store_missing=False)
     REQUEST.add_argument('limit', type=inputs.int_range(1, 10000), location='args', default=5)
     REQUEST.add_argument('page', type=inputs.int_range(1, 10000), location='args', default=1)
+    REQUEST.add_argument('cursor', type=str, location='args', help=help_messages["fields"]["cursor"], store_missing=False)
 
+    # Answer `If-None-Match` with 304 if the data did not change since; otherwise add the `ETag`
+    @ConditionalGet('FinancialDataView', scope_arg='symbol', parser=REQUEST)
+    # The rows are encoded by a precompiled serializer; `api.marshal_with` only documents the response
+    @FastMarshal(RESPONSE, "data", encode=FinancialDataSerializer.compile(list(DATA)), serialize=serialize_financial_data)
     @api.marshal_with(RESPONSE, description=help_messages["ok_resp"])
     @api.expect(REQUEST, validate=False)
     # Catch any error that is not handled so far, and return 500 error, with a preset message.
@@ -71,18 +97,20 @@ class FinancialDataView(Resource):
     # Catch ValidationErrors and return 400 status code, and pass the message of the original exception to client-side.
     @APIErrorHandler('FinancialDataView', ValidationError, 400)
     @APIErrorHandler('FinancialDataView', PageOutofBoundsError, 400)
+    @APIErrorHandler('FinancialDataView', InvalidCursorError, 400)
     # Handle Empty Content Result
     @APIErrorHandler('FinancialDataView', EmptyContentException, 404, err_messages["api"]["E404_no_content"])
     def get(self):
-        def serialize(data: List[FinancialData]) -> Dict:
-            return FinancialDataSerializer.serialize(data, exclude=["id", "created_at", "updated_at"])
         kwargs = self.REQUEST.parse_args()
         self._validate_get_inputs(kwargs)
+        if "cursor" in kwargs:
+            return self._get_by_cursor(kwargs)
+        request_shapes.record("financial_data", kwargs)
         total, arr = list_financial_data(**kwargs)
         if total == 0:
             raise EmptyContentException
         return {
-            "data": serialize(arr),
+            "data": arr,
             "pagination": {
                 "count": total,
                 "page": kwargs["page"],
@@ -91,6 +119,20 @@ class FinancialDataView(Resource):
             }
         }
 
+    def _get_by_cursor(self, kwargs) -> Dict:
+        """Cursor (keyset) mode: opted into by sending `cursor` (empty for the first page)."""
+        kwargs.pop("page")
+        arr, next_cursor = seek_financial_data(**kwargs)
+        if not arr:
+            raise EmptyContentException
+        return {
+            "data": arr,
+            "pagination": {
+                "limit": kwargs["limit"],
+                "next_cursor": next_cursor
+            }
+        }
+
     @BasicErrorHandler('FinancialDataGetValidator', expectedErrClass=ValidationError, rethrow_as=ValidationError)
     def _validate_get_inputs(self, kwargs):
         try:
@@ -106,26 +148,58 @@ class FinancialDataView(Resource):
             pass
 
 
+@api.route('/financial_data/export', methods=['GET'])
+class ExportFinancialDataView(FinancialDataView):
+    """Streams all the records matching the filters of `/financial_data`, without pagination."""
+    REQUEST = FinancialDataView.REQUEST.copy().remove_argument('limit').remove_argument('page').remove_argument('cursor')
+    REQUEST.add_argument('format', choices=list(export_financial_data.MEDIA_TYPES), type=str, location='args',
+                         help=help_messages["fields"]["export_format"], store_missing=False)
+
+    @api.response(200, help_messages["export_resp"])
+    @api.produces(list(export_financial_data.MEDIA_TYPES.values()))
+    @api.expect(REQUEST, validate=False)
+    # Catch any error that is not handled so far, and return 500 error, with a preset message.
+    @APIErrorHandler('ExportFinancialDataView', BaseException, 500, err_messages["api"]["E500"])
+    # Catch ValidationErrors and return 400 status code, and pass the message of the original exception to client-side.
+    @APIErrorHandler('ExportFinancialDataView', ValidationError, 400)
+    def get(self):
+        kwargs = self.REQUEST.parse_args()
+        self._validate_get_inputs(kwargs)
+        format = kwargs.pop("format", None) or self._negotiate_format()
+        # Chunked; rows are read from the database as the client reads the response
+        return Response(
+            stream_with_context(export_financial_data.main(format=format, **kwargs)),
+            mimetype=export_financial_data.MEDIA_TYPES[format],
+            headers={"Content-Disposition": f'attachment; filename="financial_data.{format}"', "Vary": "Accept"}
+        )
+
+    @staticmethod
+    def _negotiate_format() -> str:
+        formats = {media_type: format for format, media_type in export_financial_data.MEDIA_TYPES.items()}
+        return formats[request.accept_mimetypes.best_match(list(formats), default=next(iter(formats)))]
+
+
 @api.route('/statistics', methods=['GET'])
 class StatisticsView(Resource):
+    DATA = api.model("Model::StatisticsDataSummary", {
+        "start_date": fields.Date(example=datetime.now().strftime(DEFAULT_DATE_FMT)),
+        "end_date": fields.Date(example=datetime.now().strftime(DEFAULT_DATE_FMT)),
+        "symbol": fields.String(example=SYMBOL_CODES[0]),
+        "average_daily_open_price": fields.Float(example=(rfloat() * 100) // 1),
+        "average_daily_close_price": fields.Float(example=(rfloat() * 100) // 1),
+        "average_daily_volume": fields.Float(example=(rfloat() * 100) // 1)
+    })
     RESPONSE = api.inherit('Response::GetStatistics', INFO_BASE_RESPONSE, {
-        'data': fields.Nested(
-            api.model("Model::StatisticsDataSummary", {
-                "start_date": fields.Date(example=datetime.now().strftime(DEFAULT_DATE_FMT)),
-                "end_date": fields.Date(example=datetime.now().strftime(DEFAULT_DATE_FMT)),
-                "symbol": fields.String(example=FinancialData.Symbols.as_set(codes_only=True).pop()),
-                "average_daily_open_price": fields.Float(example=(rfloat() * 100) // 1),
-                "average_daily_close_price": fields.Float(example=(rfloat() * 100) // 1),
-                "average_daily_volume": fields.Float(example=(rfloat() * 100) // 1)
-            }),
-            allow_null=True)
+        'data': fields.Nested(DATA, allow_null=True)
     })
 
     REQUEST = reqparse.RequestParser()
     REQUEST.add_argument('start_date', type=inputs.date, location='args', help=help_messages["fields"]["date"], required=True)
     REQUEST.add_argument('end_date', type=inputs.date, location='args', help=help_messages["fields"]["date"], required=True)
-    REQUEST.add_argument('symbol', choices=list(FinancialData.Symbols.as_set(codes_only=True)), type=str, location='args', required=True)
+    REQUEST.add_argument('symbol', choices=SYMBOL_CODES, type=str, location='args', required=True)
 
+    # Answer `If-None-Match` with 304 if the data did not change since; otherwise add the `ETag`
+    @ConditionalGet('StatisticsView', scope_arg='symbol', parser=REQUEST)
     @api.marshal_with(RESPONSE, description=help_messages["ok_resp"])
     @api.expect(REQUEST, validate=False)
     # Catch any error that is not handled so far, and return 500 error, with a preset message.
@@ -135,18 +209,13 @@ class StatisticsView(Resource):
     # Handle Empty Content Result
     @APIErrorHandler('StatisticsView', EmptyContentException, 404, err_messages["api"]["E404_no_content"])
     def get(self):
-        def serialize(data: Dict) -> Dict:
-            return {
-                "average_daily_open_price": float("%.1f" % data['average_daily_open_price']),
-                "average_daily_close_price": float("%.1f" % data['average_daily_close_price']),
-                "average_daily_volume": float("%.1f" % data['average_daily_volume'])
-            }
         kwargs = self.REQUEST.parse_args()
         self._validate_get_inputs(kwargs)
+        request_shapes.record("statistics", kwargs)
         data = get_statistics(**kwargs)
         if not data:
             raise EmptyContentException
-        data = serialize(data)
+        data = serialize_statistics(data)
         data.update(**kwargs)
         return {
             "data": data
@@ -165,3 +234,111 @@ class StatisticsView(Resource):
                 raise ValidationError(err_messages["api"]["end<start"])
         except KeyError:
             pass
+
+
+@api.route('/statistics/rolling', methods=['GET'])
+class RollingStatisticsView(StatisticsView):
+    """The rolling statistics of each trading day of the range, for one `window` size."""
+    POINT = api.model("Model::RollingStatisticsPoint", {
+        "date": fields.Date(example=datetime.now().strftime(DEFAULT_DATE_FMT)),
+        "mean_open_price": fields.Float(example=(rfloat() * 100) // 1),
+        "mean_close_price": fields.Float(example=(rfloat() * 100) // 1),
+        "vwap": fields.Float(example=(rfloat() * 100) // 1, description=help_messages["fields"]["vwap"]),
+        "volatility": fields.Float(example=rfloat() / 10, description=help_messages["fields"]["volatility"])
+    })
+    RESPONSE = api.inherit('Response::GetRollingStatistics', INFO_BASE_RESPONSE, {
+        'data': fields.Nested(
+            api.model("Model::RollingStatistics", {
+                "start_date": fields.Date(example=datetime.now().strftime(DEFAULT_DATE_FMT)),
+                "end_date": fields.Date(example=datetime.now().strftime(DEFAULT_DATE_FMT)),
+                "symbol": fields.String(example=SYMBOL_CODES[0]),
+                "window": fields.Integer(example=20),
+                "series": fields.List(fields.Nested(POINT))
+            }),
+            allow_null=True)
+    })
+
+    REQUEST = StatisticsView.REQUEST.copy()
+    REQUEST.add_argument('window', type=inputs.int_range(2, ROLLING_MAX_WINDOW), location='args', default=20,
+                         help=help_messages["fields"]["window"])
+
+    # Answer `If-None-Match` with 304 if the data did not change since; otherwise add the `ETag`
+    @ConditionalGet('RollingStatisticsView', scope_arg='symbol', parser=REQUEST)
+    @api.marshal_with(RESPONSE, description=help_messages["ok_resp"])
+    @api.expect(REQUEST, validate=False)
+    # Catch any error that is not handled so far, and return 500 error, with a preset message.
+    @APIErrorHandler('RollingStatisticsView', BaseException, 500, err_messages["api"]["E500"])
+    # Catch ValidationErrors and return 400 status code, and pass the message of the original exception to client-side.
+    @APIErrorHandler('RollingStatisticsView', ValidationError, 400)
+    # Handle Empty Content Result
+    @APIErrorHandler('RollingStatisticsView', EmptyContentException, 404, err_messages["api"]["E404_no_content"])
+    def get(self):
+        kwargs = self.REQUEST.parse_args()
+        self._validate_get_inputs(kwargs)
+        series = get_rolling_statistics(**kwargs)
+        if not series:
+            raise EmptyContentException
+        return {
+            "data": {**kwargs, "series": series}
+        }
+
+
+@api.route('/statistics/batch', methods=['POST'])
+class BatchStatisticsView(Resource):
+    """The `/statistics` of many (symbol, date range) items; answered with a single query (for the
+    items that are not cached yet). An empty range is not an error of the request, but has the
+    `404` status (and the message) of `/statistics` in its item."""
+    ITEM = api.inherit("Model::BatchStatisticsItem", StatisticsView.DATA, {
+        "status": fields.Integer(example=200, description=help_messages["fields"]["batch_status"]),
+        "error": fields.String(example=None)
+    })
+    RESPONSE = api.inherit('Response::BatchStatistics', INFO_BASE_RESPONSE, {
+        'data': fields.List(fields.Nested(ITEM))
+    })
+
+    REQUEST = api.model("Request::BatchStatistics", {
+        "items": fields.List(fields.Nested(api.model("Model::StatisticsQuery", {
+            "start_date": fields.Date(required=True, description=help_messages["fields"]["date"]),
+            "end_date": fields.Date(required=True, description=help_messages["fields"]["date"]),
+            "symbol": fields.String(required=True, enum=SYMBOL_CODES)
+        })), required=True, min_items=1, max_items=BATCH_STATISTICS_MAX_ITEMS)
+    })
+
+    @api.marshal_with(RESPONSE, description=help_messages["ok_resp"])
+    @api.expect(REQUEST, validate=False)
+    # Catch any error that is not handled so far, and return 500 error, with a preset message.
+    @APIErrorHandler('BatchStatisticsView', BaseException, 500, err_messages["api"]["E500"])
+    # Catch ValidationErrors and return 400 status code, and pass the message of the original exception to client-side.
+    @APIErrorHandler('BatchStatisticsView', ValidationError, 400)
+    def post(self):
+        items = self._parse_items(request.get_json(silent=True))
+        for item in items:
+            request_shapes.record("statistics", item)
+        data = []
+        for item, statistics in zip(items, get_batch_statistics(items)):
+            if statistics:
+                data.append({**item, **serialize_statistics(statistics), "status": 200})
+            else:
+                data.append({**item, "status": 404, "error": err_messages["api"]["E404_no_content"]})
+        return {
+            "data": data
+        }
+
+    @staticmethod
+    def _parse_items(body: Optional[Dict]) -> List[Dict]:
+        """Returns the arguments of `get_statistics` of each item; parsed as `StatisticsView.REQUEST` would."""
+        items = body.get("items") if isinstance(body, dict) else None
+        if not isinstance(items, list) or not 1 <= len(items) <= BATCH_STATISTICS_MAX_ITEMS:
+            raise ValidationError(err_messages["api"]["batch_items"] % BATCH_STATISTICS_MAX_ITEMS)
+        parsed = []
+        for index, item in enumerate(items):
+            try:
+                kwargs = {"start_date": inputs.date(item["start_date"]), "end_date": inputs.date(item["end_date"]), "symbol": item["symbol"]}
+            except (KeyError, TypeError, ValueError):
+                raise ValidationError(f"items[{index}]: {err_messages['api']['batch_item']}")
+            if kwargs["symbol"] not in SYMBOL_CODES:
+                raise ValidationError(f"items[{index}]: {err_messages['api']['symb_undefined']}")
+            if kwargs["end_date"] < kwargs["start_date"]:
+                raise ValidationError(f"items[{index}]: {err_messages['api']['end<start']}")
+            parsed.append(kwargs)
+        return parsed
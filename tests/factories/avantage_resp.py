@@ -1,7 +1,7 @@
 from .base import BaseFactory
 from lib.utils import load_test_fixture
 from json import load as jsload
-from lib.avantage_api import AlphaVantageAPI, DailyTimeSeriesRecord as OriginalModel
+from lib.avantage_api import AlphaVantageAPI, DailyTimeSeriesRecord as OriginalModel, DailyTimeSeriesBatch as OriginalBatch
 
 
 class DailyTimeSeriesRecords(BaseFactory):
@@ -19,3 +19,15 @@ class DailyTimeSeriesRecord(BaseFactory):
             date=cls.fake.date_between(),
             symbol=cls.fake.enum(AlphaVantageAPI.VALID_SYMBOLS)
         )
+
+
+class DailyTimeSeriesBatch(BaseFactory):
+    @classmethod
+    def mock(cls, size: int = 3):
+        return OriginalBatch(
+            cls.fake.enum(AlphaVantageAPI.VALID_SYMBOLS),
+            [cls.fake.date_between() for _ in range(size)],
+            [cls.fake.pyfloat(positive=True) for _ in range(size)],
+            [cls.fake.pyfloat(positive=True) for _ in range(size)],
+            [cls.fake.pyint() for _ in range(size)]
+        )
@@ -0,0 +1,106 @@
+import json
+from collections import namedtuple
+from datetime import date
+import mock
+import pytest
+from mock import MagicMock
+from app import create_app, db
+from financial import export_financial_data
+from sqlalchemy.dialects import mysql
+from tests.factories.financial_data import FinancialData as FDFactory
+
+application = create_app()
+
+
+# As the `Row`s of the selected columns
+Record = namedtuple("Record", export_financial_data.COLUMNS)
+
+
+def rows(n: int):
+    return [Record(*(getattr(record, column) for column in Record._fields)) for record in (FDFactory.mock() for _ in range(n))]
+
+
+class TestExportFinancialDataService:
+    @pytest.fixture(autouse=True)
+    def app_context(self):
+        with application.app_context():
+            yield
+
+    @pytest.fixture
+    def execute(self):
+        result = MagicMock()
+        result.__enter__.return_value = result
+        with mock.patch.object(db.core.session, "execute", return_value=result) as execute:
+            yield execute
+
+    def test_query(self, execute):
+        execute.return_value.partitions.return_value = iter([])
+        list(export_financial_data.main(format="ndjson", symbol="IBM", start_date="2023-01-01", chunk_rows=500))
+        query = execute.call_args[0][0]
+        assert query.get_execution_options() == {"yield_per": 500, "stream_results": True}
+        sql = str(query.compile(dialect=mysql.dialect()))
+        assert "ORDER BY financial_data.symbol, financial_data.date" in sql
+        assert "financial_data.id" not in sql
+
+    def test_ndjson(self, execute):
+        chunks = [rows(3), rows(2)]
+        execute.return_value.partitions.return_value = iter(chunks)
+        res = list(export_financial_data.main(format="ndjson"))
+        assert len(res) == 2
+        lines = [json.loads(line) for line in "".join(res).splitlines()]
+        assert lines[0] == {
+            "symbol": chunks[0][0].symbol.name, "date": chunks[0][0].date.isoformat(),
+            "open_price": float("%.1f" % chunks[0][0].open_price), "close_price": float("%.1f" % chunks[0][0].close_price),
+            "volume": chunks[0][0].volume
+        }
+        assert len(lines) == 5
+
+    def test_csv(self, execute):
+        chunk = rows(2)
+        execute.return_value.partitions.return_value = iter([chunk])
+        res = "".join(export_financial_data.main(format="csv")).splitlines()
+        assert res[0] == "symbol,date,open_price,close_price,volume"
+        assert res[1] == f"{chunk[0].symbol.name},{chunk[0].date.isoformat()},{'%.1f' % chunk[0].open_price},{'%.1f' % chunk[0].close_price},{chunk[0].volume}"
+        assert len(res) == 3
+
+    def test_stopped_early(self, execute):
+        execute.return_value.partitions.return_value = iter([rows(2), rows(2)])
+        chunks = export_financial_data.main(format="ndjson")
+        next(chunks)
+        chunks.close()
+        # The cursor is closed along with the generator
+        execute.return_value.__exit__.assert_called_once()
+
+    def test_columns(self, execute):
+        chunks = [rows(3), rows(2)]
+        execute.return_value.partitions.return_value = iter(chunks)
+        data = b"".join(export_financial_data.main(format="columns"))
+        batches = list(export_financial_data.iter_column_batches(data))
+        assert [len(batch["date"]) for batch in batches] == [3, 2]
+        row, batch = chunks[0][1], batches[0]
+        assert export_financial_data.SYMBOLS[batch["symbol"][1]] == row.symbol
+        assert batch["date"][1] == (row.date - date(1970, 1, 1)).days
+        assert (batch["open_price"][1], batch["close_price"][1], batch["volume"][1]) == (row.open_price, row.close_price, row.volume)
+        # The arrays are padded to 8 bytes
+        assert len(data) % 8 == 0
+
+    def test_columns_empty(self, execute):
+        execute.return_value.partitions.return_value = iter([])
+        data = b"".join(export_financial_data.main(format="columns"))
+        assert len(data) % 8 == 0
+        assert list(export_financial_data.iter_column_batches(data)) == []
+        with pytest.raises(ValueError):
+            list(export_financial_data.iter_column_batches(b"{}"))
+
+    def test_arrow(self, execute):
+        pa = pytest.importorskip("pyarrow")
+        chunks = [rows(3), rows(2)]
+        execute.return_value.partitions.return_value = iter(chunks)
+        table = pa.ipc.open_stream(b"".join(export_financial_data.main(format="arrow"))).read_all()
+        assert table.column_names == export_financial_data.COLUMNS
+        assert table.num_rows == 5
+        row = chunks[1][0]
+        assert table.slice(3, 1).to_pylist() == [{
+            "symbol": row.symbol.name, "date": row.date, "open_price": row.open_price,
+            "close_price": row.close_price, "volume": row.volume
+        }]
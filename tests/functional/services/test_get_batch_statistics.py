@@ -0,0 +1,69 @@
+import mock
+import pytest
+from datetime import datetime
+from financial import get_batch_statistics
+from financial.get_statistics import main as get_statistics
+from flask_sqlalchemy import BaseQuery
+from app import create_app, cache, db
+from financial.coverage import coverage
+
+application = create_app()
+
+
+def item(symbol: str = "IBM", start_date: datetime = datetime(2023, 6, 2), end_date: datetime = datetime(2023, 6, 20)):
+    return {"start_date": start_date, "end_date": end_date, "symbol": symbol}
+
+
+class TestGetBatchStatisticsService:
+    @pytest.fixture(autouse=True)
+    def app_context(self):
+        with application.app_context():
+            cache.clear()
+            with mock.patch.object(coverage, "count", return_value=1):
+                yield
+
+    @pytest.fixture
+    def execute(self):
+        with mock.patch.object(db.core.session, "execute") as execute:
+            yield execute
+
+    def test_single_query(self, execute):
+        execute.return_value = [(0, 2.0, 4.0, 12.0, 3), (1, 6.0, 14.0, 36, 3), (1, 14.0, 26.0, 64, 2), (2, None, None, None, 0)]
+        items = [item(), item("AAPL", datetime(2020, 1, 15), datetime(2022, 3, 10)), item("AAPL")]
+        assert get_batch_statistics.main(items) == [
+            {"average_daily_open_price": 2.0, "average_daily_close_price": 4.0, "average_daily_volume": 12.0},
+            {"average_daily_open_price": 4.0, "average_daily_close_price": 8.0, "average_daily_volume": 20.0},
+            {}
+        ]
+        execute.assert_called_once()
+        sql = str(execute.call_args[0][0])
+        # The range of the first and last items, and the edges and rollup buckets of the second one
+        assert sql.count("UNION ALL") == 3
+        assert sql.count("avg(financial_data.open_price)") == 2
+        assert "sum(financial_data_rollup.sum_open_price)" in sql
+
+    def test_shares_the_cache(self, execute):
+        # Cached by the single item service
+        with mock.patch.object(BaseQuery, "first", return_value=(2.0, 4.0, 12.0, 3)):
+            cached = get_statistics(**item())
+        execute.return_value = [(0, 1.0, 1.0, 1.0, 1)]
+        assert get_batch_statistics.main([item(), item("AAPL")])[0] == cached
+        # Only the miss is computed; as the first (and only) item of the query
+        assert str(execute.call_args[0][0]).count("SELECT") == 1
+        # ...and is then cached for the single item service
+        with mock.patch.object(BaseQuery, "first") as first:
+            assert get_statistics(**item("AAPL")) == {"average_daily_open_price": 1.0, "average_daily_close_price": 1.0, "average_daily_volume": 1.0}
+            first.assert_not_called()
+
+    def test_all_cached(self, execute):
+        execute.return_value = [(0, 1.0, 1.0, 1.0, 1)]
+        items = [item(), item()]
+        assert get_batch_statistics.main(items) == get_batch_statistics.main(items)
+        # Identical items are computed once, and only once
+        execute.assert_called_once()
+        assert str(execute.call_args[0][0]).count("SELECT") == 1
+
+    @mock.patch.object(coverage, "count", return_value=0)
+    def test_no_records_in_coverage(self, count, execute):
+        assert get_batch_statistics.main([item(), item("AAPL")]) == [{}, {}]
+        execute.assert_not_called()
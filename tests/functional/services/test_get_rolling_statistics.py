@@ -0,0 +1,60 @@
+import mock
+import pytest
+from datetime import date, timedelta
+from financial.get_rolling_statistics import main as get_rolling_statistics
+from app import create_app, cache, db
+from financial.coverage import coverage
+
+application = create_app()
+
+
+def rows(start: date, size: int):
+    return [(start + timedelta(days=i), 10.0 + i, 20.0 + i, 100) for i in range(size)]
+
+
+class TestGetRollingStatisticsService:
+    @pytest.fixture(autouse=True)
+    def app_context(self):
+        with application.app_context():
+            cache.clear()
+            with mock.patch.object(coverage, "count", return_value=1), \
+                    mock.patch.object(coverage, "lookback", return_value=date(2023, 5, 30)) as lookback:
+                self.lookback = lookback
+                yield
+
+    @pytest.fixture
+    def execute(self):
+        with mock.patch.object(db.core.session, "execute") as execute:
+            yield execute
+
+    def test_series(self, execute):
+        execute.return_value.all.return_value = rows(date(2023, 5, 30), 5)
+        res = get_rolling_statistics(start_date="2023-06-01", end_date="2023-06-03", symbol="IBM", window=2)
+        self.lookback.assert_called_once_with("IBM", date(2023, 6, 1), 2)
+        execute.assert_called_once()
+        sql = str(execute.call_args[0][0])
+        assert "ORDER BY financial_data.date" in sql
+        # Only the days of the range; the preceding ones only fill their windows
+        assert [point["date"] for point in res] == [date(2023, 6, 1), date(2023, 6, 2), date(2023, 6, 3)]
+        assert res[0]["mean_open_price"] == 11.5
+        assert res[0]["mean_close_price"] == 21.5
+        assert res[0]["vwap"] == 21.5
+        assert res[0]["volatility"] == pytest.approx(abs(22 / 21 - 21 / 20) / 2 ** 0.5)
+
+    def test_not_enough_history(self, execute):
+        execute.return_value.all.return_value = rows(date(2023, 6, 1), 3)
+        res = get_rolling_statistics(start_date="2023-06-01", end_date="2023-06-03", symbol="IBM", window=2)
+        assert res[0] == {"date": date(2023, 6, 1), "mean_open_price": None, "mean_close_price": None, "vwap": None, "volatility": None}
+        assert res[1]["mean_open_price"] == 10.5
+        assert res[1]["volatility"] is None
+        assert res[2]["volatility"] is not None
+
+    def test_no_records_in_range(self, execute):
+        # The coverage index counted records that are not there anymore
+        execute.return_value.all.return_value = rows(date(2023, 5, 30), 2)
+        assert get_rolling_statistics(start_date="2023-06-01", end_date="2023-06-03", symbol="IBM", window=2) == []
+
+    @mock.patch.object(coverage, "count", return_value=0)
+    def test_no_records_in_coverage(self, count, execute):
+        assert get_rolling_statistics(start_date="2023-06-01", end_date="2023-06-03", symbol="IBM", window=2) == []
+        execute.assert_not_called()
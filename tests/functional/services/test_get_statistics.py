@@ -1,57 +1,91 @@
 import mock
-from mock import Mock
-from financial.get_statistics import calc_mean, main as get_statistics
+import pytest
+from financial.get_statistics import main as get_statistics
 from faker.factory import Factory
 from conf.settings import DEFAULT_DATE_FMT
 from tests.factories.financial_data import FinancialData as FDFactory
 from flask_sqlalchemy import BaseQuery
+from app import create_app, cache
+from financial.coverage import coverage
+from financial.series_store import store
 
 
 Faker = Factory.create
 faker = Faker()
 faker.seed(hash(__file__))
+application = create_app()
 
 
 class TestGetStatisticsService:
-    def sample_query(self, symbol: str = FDFactory.rand_symb().name):
-        d1 = faker.date_between()
-        d2 = faker.date_between(d1).strftime(DEFAULT_DATE_FMT)
-        return {"start_date": d1.strftime(DEFAULT_DATE_FMT), "end_date": d2, "symbol": symbol}
+    @pytest.fixture(autouse=True)
+    def app_context(self):
+        with application.app_context():
+            cache.clear()
+            with mock.patch.object(coverage, "count", return_value=1):
+                yield
 
-    @mock.patch.object(BaseQuery, "count", return_value=0)
+    def sample_short_query(self, symbol: str = FDFactory.rand_symb().name):
+        """A range within a single month; i.e. with no full rollup bucket."""
+        d1 = faker.date_between().replace(day=2)
+        d2 = d1.replace(day=faker.pyint(2, 27))
+        return {"start_date": d1.strftime(DEFAULT_DATE_FMT), "end_date": d2.strftime(DEFAULT_DATE_FMT), "symbol": symbol}
+
+    @mock.patch.object(BaseQuery, "first", return_value=None)
     def test_no_records(self, *args, **kwargs):
-        assert get_statistics(**self.sample_query()) == {}
-
-    @mock.patch.object(BaseQuery, "count", return_value=3)
-    def test_with_records(self, *args, **kwargs):
-        next_page = Mock()
-        next_page.items = []
-        paginated_results = Mock()
-        paginated_results.items = [FDFactory.mock() for _ in range(3)]
-        symbol = FDFactory.rand_symb().name
-        for i in range(3):
-            paginated_results.items[i].symbol = symbol
-        paginated_results.next = (lambda: next_page)
-        stats = calc_mean(paginated_results, columns=['symbol', 'open_price', 'close_price', 'volume'])
-        with mock.patch.object(BaseQuery, "paginate", return_value=paginated_results):
-            res = get_statistics(**self.sample_query(symbol))
-            assert res["average_daily_open_price"] == stats.iloc[0]["open_price"]
-            assert res["average_daily_close_price"] == stats.iloc[0]["close_price"]
-            assert res["average_daily_volume"] == stats.iloc[0]["volume"]
-
-    def test_calc(self):
-        next_page = Mock()
-        next_page.items = []
-        paginated_results = Mock()
-        paginated_results.items = [FDFactory.mock() for _ in range(3)]
-        symbol = FDFactory.rand_symb().name
-        for i in range(1, 4):
-            paginated_results.items[i - 1].symbol = symbol
-            paginated_results.items[i - 1].open_price = float(i)  # sum = 6, mean = 2.0
-            paginated_results.items[i - 1].close_price = float(i**2)  # sum = 14, mean = 4.667
-            paginated_results.items[i - 1].volume = i**3  # sum = 36, mean = 12.0
-        paginated_results.next = (lambda: next_page)
-        res = calc_mean(paginated_results, columns=['symbol', 'open_price', 'close_price', 'volume'])
-        assert abs(res.iloc[0]["open_price"] - 2.0) <= 0.0001
-        assert abs(res.iloc[0]["close_price"] - 4.6667) <= 0.0001
-        assert abs(res.iloc[0]["volume"] - 12) <= 0.0001
+        assert get_statistics(**self.sample_short_query()) == {}
+
+    @mock.patch.object(BaseQuery, "first", return_value=(2.0, 4.6667, 12.0, 3))
+    def test_with_records(self, first, *args, **kwargs):
+        res = get_statistics(**self.sample_short_query())
+        first.assert_called_once()
+        assert res == {
+            "average_daily_open_price": 2.0,
+            "average_daily_close_price": 4.6667,
+            "average_daily_volume": 12.0
+        }
+        assert all(isinstance(v, float) for v in res.values())
+
+    def test_single_grouped_query(self):
+        query = self.sample_short_query()
+        with mock.patch.object(BaseQuery, "first", autospec=True, return_value=None) as first:
+            get_statistics(**query)
+            sql = str(first.call_args[0][0])
+        assert sql.count("SELECT") == 1
+        assert "avg(financial_data.open_price)" in sql
+        assert "avg(financial_data.close_price)" in sql
+        assert "avg(financial_data.volume)" in sql
+        assert "count(financial_data.id)" in sql
+        assert "GROUP BY financial_data.symbol" in sql
+
+    @mock.patch.object(BaseQuery, "first", return_value=(None, None, None, 0))
+    def test_no_records_from_rollups(self, *args, **kwargs):
+        assert get_statistics(start_date="2020-01-15", end_date="2022-03-10", symbol=FDFactory.rand_symb().name) == {}
+
+    def test_with_records_from_rollups(self):
+        # Edge days: open sum = 6, close sum = 14, volume sum = 36 over 3 days
+        # Full buckets: open sum = 14, close sum = 26, volume sum = 64 over 2 days
+        with mock.patch.object(BaseQuery, "first", side_effect=[(6.0, 14.0, 36, 3), (14.0, 26.0, 64, 2)]) as first:
+            res = get_statistics(start_date="2020-01-15", end_date="2022-03-10", symbol=FDFactory.rand_symb().name)
+        assert first.call_count == 2
+        assert res == {
+            "average_daily_open_price": 4.0,
+            "average_daily_close_price": 8.0,
+            "average_daily_volume": 20.0
+        }
+
+    @mock.patch.object(coverage, "count", return_value=0)
+    def test_no_records_in_coverage(self, *args, **kwargs):
+        with mock.patch.object(BaseQuery, "first") as first:
+            assert get_statistics(**self.sample_short_query()) == {}
+            first.assert_not_called()
+
+    @mock.patch("financial.get_statistics.READ_ENGINE", "memory")
+    def test_memory_engine(self):
+        stats = {"average_daily_open_price": 1.0, "average_daily_close_price": 2.0, "average_daily_volume": 3.0}
+        query = self.sample_short_query()
+        with mock.patch.object(store, "average", return_value=stats) as average, \
+                mock.patch.object(BaseQuery, "first") as first:
+            assert get_statistics(**query) == stats
+            first.assert_not_called()
+        average.assert_called_once()
+        assert average.call_args[0][0] == query["symbol"]
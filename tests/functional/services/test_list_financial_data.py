@@ -1,43 +1,129 @@
 import mock
 from mock import Mock
 import pytest
-from financial.list_financial_data import main as list_financial_data
+from financial.list_financial_data import main as list_financial_data, seek as seek_financial_data, encode_cursor, decode_cursor
 from faker.factory import Factory
 from conf.settings import DEFAULT_DATE_FMT
 from tests.factories.financial_data import FinancialData as FDFactory
-from lib.exceptions import PageOutofBoundsError
+from lib.exceptions import PageOutofBoundsError, InvalidCursorError
 from flask_sqlalchemy import BaseQuery
+from app import create_app
+from financial.coverage import coverage
+from financial.series_store import Record, store
+from sqlalchemy.dialects import mysql
+from model import FinancialData
 
 
 Faker = Factory.create
 faker = Faker()
 faker.seed(hash(__file__))
+application = create_app()
 
 
 class TestListFinancialDataService:
+    @pytest.fixture(autouse=True)
+    def app_context(self):
+        with application.app_context():
+            yield
+
     def sample_query(self, page: int = 1, limit: int = 5):
         d1 = faker.date_between()
         d2 = faker.date_between(d1).strftime(DEFAULT_DATE_FMT)
         return {"start_date": d1.strftime(DEFAULT_DATE_FMT), "end_date": d2, "symbol": FDFactory.rand_symb().name, "limit": limit, "page": page}
 
-    @mock.patch.object(BaseQuery, "count", return_value=0)
+    @mock.patch.object(coverage, "count", return_value=0)
     def test_no_records(self, *args, **kwargs):
-        assert list_financial_data(**self.sample_query()) == (0, [])
+        with mock.patch.object(BaseQuery, "paginate") as paginate:
+            assert list_financial_data(**self.sample_query()) == (0, [])
+            paginate.assert_not_called()
 
-    @mock.patch.object(BaseQuery, "count", return_value=10)
+    @mock.patch.object(coverage, "count", return_value=10)
     def test_with_records(self, *args, **kwargs):
         paginated_results = Mock()
-        paginated_results.items = [FDFactory.mock() for _ in range(5)]
-        with mock.patch.object(BaseQuery, "paginate", return_value=paginated_results):
-            total, res = list_financial_data(**self.sample_query())
+        records = [FDFactory.mock() for _ in range(5)]
+        paginated_results.items = [(r.id, r.symbol, r.date, r.open_price, r.close_price, r.volume) for r in records]
+        with mock.patch.object(BaseQuery, "paginate", return_value=paginated_results) as paginate:
+            with mock.patch.object(BaseQuery, "count") as count:
+                total, res = list_financial_data(**self.sample_query())
+                count.assert_not_called()
+            paginate.assert_called_once_with(page=1, per_page=5, count=False)
             assert total == 10
             assert len(res) == 5
-            assert res[0] == paginated_results.items[0]
+            # Plain column tuples are memoized, rather than the ORM instances
+            assert isinstance(res[0], Record)
+            assert res[0][:6] == paginated_results.items[0]
 
-    @mock.patch.object(BaseQuery, "count", return_value=5)
+    @mock.patch.object(coverage, "count", return_value=5)
     def test_page_oob(self, *args, **kwargs):
         paginated_results = Mock()
         paginated_results.items = [FDFactory.mock() for _ in range(5)]
         with mock.patch.object(BaseQuery, "paginate", return_value=paginated_results):
             with pytest.raises(PageOutofBoundsError):
                 list_financial_data(**self.sample_query(page=2))
+
+    @mock.patch("financial.list_financial_data.READ_ENGINE", "memory")
+    def test_memory_engine(self):
+        query = self.sample_query(page=2)
+        records = [FDFactory.mock() for _ in range(5)]
+        with mock.patch.object(store, "count", return_value=12), \
+                mock.patch.object(store, "records", return_value=records) as store_records, \
+                mock.patch.object(BaseQuery, "paginate") as paginate:
+            assert list_financial_data(**query) == (12, records)
+            paginate.assert_not_called()
+        store_records.assert_called_once_with(query["symbol"], query["start_date"], query["end_date"], offset=5, limit=5)
+
+
+class TestSeekFinancialDataService:
+    @pytest.fixture(autouse=True)
+    def app_context(self):
+        with application.app_context():
+            yield
+
+    def test_cursor_round_trip(self):
+        record = FDFactory.mock()
+        cursor = encode_cursor(record)
+        assert "=" not in cursor
+        assert decode_cursor(cursor) == (record.symbol.name, record.date, record.id)
+
+    @pytest.mark.parametrize("cursor", ["garbage", "W10", "WyJYIiwiMjAyMy0wMS0wMSIsMV0"])
+    def test_invalid_cursor(self, cursor):
+        with pytest.raises(InvalidCursorError):
+            decode_cursor(cursor)
+
+    def test_last_page(self):
+        items = [FDFactory.mock() for _ in range(3)]
+        with mock.patch.object(BaseQuery, "all", return_value=items):
+            res, next_cursor = seek_financial_data(limit=5, cursor="")
+        assert res == items
+        assert next_cursor is None
+
+    def test_next_page(self):
+        items = [FDFactory.mock() for _ in range(6)]
+        with mock.patch.object(BaseQuery, "all", return_value=items):
+            res, next_cursor = seek_financial_data(limit=5, cursor="")
+        assert res == items[:5]
+        assert next_cursor == encode_cursor(items[4])
+
+    def test_seek_query(self):
+        record = FDFactory.mock()
+        with mock.patch.object(BaseQuery, "all", autospec=True, return_value=[]) as all_:
+            seek_financial_data(limit=5, cursor=encode_cursor(record))
+            sql = str(all_.call_args[0][0].statement.compile(dialect=mysql.dialect()))
+        assert "OFFSET" not in sql
+        assert "count(" not in sql
+        assert "ORDER BY financial_data.symbol, financial_data.date" in sql
+        assert "financial_data.symbol > " in sql
+
+    def test_symbols_in_seek_order(self):
+        # The ENUM index order (MySQL ORDER BY) is the string order of the seek predicate
+        assert [symbol.name for symbol in FinancialData.Symbols] == sorted(symbol.name for symbol in FinancialData.Symbols)
+
+    @mock.patch("financial.list_financial_data.READ_ENGINE", "memory")
+    def test_memory_engine_seek(self):
+        items = [FDFactory.mock() for _ in range(6)]
+        with mock.patch.object(store, "records", return_value=items) as store_records:
+            res, next_cursor = seek_financial_data(limit=5, cursor=encode_cursor(items[0]))
+        assert res == items[:5]
+        assert next_cursor == encode_cursor(items[4])
+        assert store_records.call_args.kwargs["limit"] == 6
+        assert store_records.call_args.kwargs["after"] == (items[0].symbol.name, items[0].date)
@@ -1,17 +1,26 @@
 import mock
 import pytest
-from lib.avantage_api import AlphaVantageAPI, DailyTimeSeriesRecord
-from lib.exceptions import SymbolUndefinedError
+from lib.avantage_api import AlphaVantageAPI, DailyTimeSeriesRecord, DailyTimeSeriesBatch
+from lib.exceptions import SymbolUndefinedError, ApiThrottledError, ResponseNotCachedError
+from lib.response_cache import ResponseCache, ResponseKey
 from random import choice as rsample
 from tests.factories.avantage_resp import DailyTimeSeriesRecords as DTSRsFactory
 from model import FinancialData
+from conf.settings import AVANTAGE_MAX_RETRIES
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+from typing import Dict, List, Optional, Tuple
+from datetime import date
+import json
 import requests
+import threading
+import time
 
 client = AlphaVantageAPI('sample', func="TIME_SERIES_DAILY_ADJUSTED")
 sample_symbol = (lambda: rsample(list(AlphaVantageAPI.VALID_SYMBOLS.as_set())))
 
 
-@mock.patch('requests.get', return_value=requests.models.Response())
+@mock.patch('requests.Session.get', return_value=requests.models.Response())
 @mock.patch('requests.models.Response.json',
             return_value=DTSRsFactory.mock())
 def test_avantage_daily(*args, **kwargs):
@@ -85,3 +94,126 @@ def test_get_biweekly_data_empty(*args, **kwargs):
     for s in [sym, sym.name]:
         res = subject(s)
         assert len(res) == 0
+
+
+class AlphaVantageStub:
+    """Local HTTP server, answering like the AlphaVantage API.
+
+    Answers the scripted `(status, body, delay)` responses in order, then `default`.
+    """
+    def __init__(self, script: Optional[List[Tuple[int, Dict, float]]] = None, default: Tuple[int, Dict, float] = (200, None, 0)):
+        self.script = list(script or [])
+        self.default = (default[0], default[1] or DTSRsFactory.mock(), default[2])
+        self.requests: List[Dict] = []
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with stub.lock:
+                    stub.requests.append(dict(parse_qsl(urlparse(self.path).query)))
+                    status, body, delay = stub.script.pop(0) if stub.script else stub.default
+                # Not `time.sleep`, which the tests patch to skip the backoff of the client
+                threading.Event().wait(delay)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/query"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def stub_client(stub: AlphaVantageStub, **kwargs) -> AlphaVantageAPI:
+    return AlphaVantageAPI("sample", base_url=stub.url, **{"calls_per_minute": 600, **kwargs})
+
+
+def test_stub_fetch_concurrently():
+    with AlphaVantageStub(default=(200, None, 0.3)) as stub:
+        began = time.monotonic()
+        res = dict(stub_client(stub, max_workers=2).fetch_biweekly_data(AlphaVantageAPI.VALID_SYMBOLS))
+        # Both symbols were requested at once, instead of one after the other
+        assert time.monotonic() - began < 0.55
+    assert set(res) == set(AlphaVantageAPI.VALID_SYMBOLS)
+    assert {r["symbol"] for r in stub.requests} == AlphaVantageAPI.VALID_SYMBOLS.as_set(codes_only=True)
+    assert all(r["apikey"] == "sample" and r["function"] == AlphaVantageAPI.DEFAULT_FUNC for r in stub.requests)
+
+
+@mock.patch('lib.avantage_api.time.sleep')
+def test_stub_retries_throttled(sleep):
+    script = [(200, {"Note": "Our standard API call frequency is 5 calls per minute"}, 0), (429, {}, 0)]
+    with AlphaVantageStub(script=script) as stub:
+        data = stub_client(stub)._get_daily_data_json("IBM")
+    assert data == DTSRsFactory.mock()
+    assert len(stub.requests) == 3
+    assert sleep.call_count == 2
+
+
+@mock.patch('lib.avantage_api.time.sleep')
+@mock.patch('lib.avantage_api.AVANTAGE_TIMEOUT_SECONDS', (1, 0.1))
+def test_stub_retries_timeouts(*args):
+    with AlphaVantageStub(script=[(200, {}, 0.5)]) as stub:
+        assert stub_client(stub)._get_daily_data_json("IBM") == DTSRsFactory.mock()
+    assert len(stub.requests) == 2
+
+
+@mock.patch('lib.avantage_api.time.sleep')
+def test_stub_gives_up(sleep):
+    with AlphaVantageStub(default=(503, {}, 0)) as stub:
+        with pytest.raises(ApiThrottledError):
+            stub_client(stub)._get_daily_data_json("IBM")
+    assert len(stub.requests) == AVANTAGE_MAX_RETRIES + 1
+
+
+def test_stub_stream_full_data():
+    with AlphaVantageStub() as stub:
+        res = list(stub_client(stub).stream_full_data("IBM", 3))
+    assert stub.requests[0]["outputsize"] == "full"
+    series = DTSRsFactory.mock()["Time Series (Daily)"]
+    assert [len(batch) for batch in res] == [3] * (len(series) // 3) + ([len(series) % 3] if len(series) % 3 else [])
+    assert [day.isoformat() for batch in res for day in batch.dates] == list(series)
+    assert all(isinstance(batch, DailyTimeSeriesBatch) and batch.symbol == "IBM" for batch in res)
+
+
+def test_stub_stream_full_data_throttled():
+    with AlphaVantageStub(default=(200, {"Information": "Please subscribe to a premium plan"}, 0)) as stub:
+        with pytest.raises(ApiThrottledError):
+            list(stub_client(stub).stream_full_data("IBM", 3))
+
+
+def test_stub_response_cache(tmp_path):
+    cache = ResponseCache(tmp_path, ttl_seconds=60, max_bytes=1 << 20)
+    with AlphaVantageStub() as stub:
+        assert stub_client(stub, cache=cache)._get_daily_data_json("IBM") == DTSRsFactory.mock()
+        assert stub_client(stub, cache=cache)._get_daily_data_json("IBM") == DTSRsFactory.mock()
+        full = [batch.dates for batch in stub_client(stub, cache=cache).stream_full_data("IBM", 3)]
+        assert [batch.dates for batch in stub_client(stub, cache=cache).stream_full_data("IBM", 3)] == full
+    # Once for each output size
+    assert [r["outputsize"] for r in stub.requests] == ["compact", "full"]
+    # Replays never send a request
+    replayed = AlphaVantageAPI("", base_url="http://127.0.0.1:9/query", cache=cache, replay=True, as_of=date(2999, 1, 1))
+    assert replayed._get_daily_data_json("IBM") == DTSRsFactory.mock()
+    with pytest.raises(ResponseNotCachedError):
+        replayed._get_daily_data_json("AAPL")
+
+
+def test_stub_response_cache_skips_throttled(tmp_path):
+    cache = ResponseCache(tmp_path, ttl_seconds=60, max_bytes=1 << 20)
+    with AlphaVantageStub(default=(200, {"Information": "Please subscribe to a premium plan"}, 0)) as stub:
+        with pytest.raises(ApiThrottledError):
+            list(stub_client(stub, cache=cache).stream_full_data("IBM", 3))
+    assert cache.read(ResponseKey(AlphaVantageAPI.DEFAULT_FUNC, "IBM", "full", date.today())) is None
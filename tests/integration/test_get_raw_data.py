@@ -2,11 +2,11 @@ import pytest
 import mock
 from mock import call as mcall
 from app import db
-from lib.avantage_api import AlphaVantageAPI
+from lib.avantage_api import AlphaVantageAPI, DailyTimeSeriesBatch
 from lib.utils import load_test_fixture
 from lib.exceptions import ApiKeyNotFoundError
 from get_raw_data import execute, get_api_key
-from tests.factories.avantage_resp import DailyTimeSeriesRecord
+from tests.factories.avantage_resp import DailyTimeSeriesBatch as DTSBatchFactory
 
 
 @mock.patch('builtins.open', side_effect=FileNotFoundError())
@@ -28,7 +28,7 @@ def test_execute_calling_api_biweekly(*args, **kwargs):
     expected_db_submit_calls = list(map(lambda x: mcall(), AlphaVantageAPI.VALID_SYMBOLS.as_set()))
 
     with mock.patch.object(db.__class__, "submit_transaction", return_value=[]) as db_transaction:
-        with mock.patch.object(AlphaVantageAPI, "get_biweekly_data", return_value=[]) as api_call:
+        with mock.patch.object(AlphaVantageAPI, "get_biweekly_batch", return_value=DailyTimeSeriesBatch("IBM")) as api_call:
             subject()
             api_call.assert_has_calls(expected_api_calls, any_order=True)
             db_transaction.assert_has_calls(expected_db_submit_calls, any_order=True)
@@ -36,11 +36,11 @@ def test_execute_calling_api_biweekly(*args, **kwargs):
 
 def test_execute_db_transactions():
     subject = (lambda: execute())
-    records = [DailyTimeSeriesRecord.mock().to_model() for _ in range(3)]
+    batch = DTSBatchFactory.mock(size=3)
     # Once for each symbol
     expected_calls = [mcall() for _ in range(len(AlphaVantageAPI.VALID_SYMBOLS))]
 
-    with mock.patch.object(AlphaVantageAPI, "get_biweekly_data", return_value=records):
+    with mock.patch.object(AlphaVantageAPI, "get_biweekly_batch", return_value=batch):
         with mock.patch('builtins.open', return_value=load_test_fixture("api_key")):
             with mock.patch.object(db.__class__, "submit_transaction", return_value=[]) as db_submit_transaction:
                 subject()
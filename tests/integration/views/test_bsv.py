@@ -0,0 +1,43 @@
+import mock
+from . import test_client
+from conf.settings import BATCH_STATISTICS_MAX_ITEMS
+
+
+class TestBatchStatisticsView:
+    ENDPOINT = "/api/statistics/batch"
+
+    def send_request(self, body):
+        with test_client() as client:
+            return client.post(self.ENDPOINT, json=body)
+
+    def sample_item(self, symbol: str = "IBM"):
+        return {"symbol": symbol, "start_date": "2023-06-02", "end_date": "2023-06-20"}
+
+    def test_invalid_posts(self):
+        assert self.send_request(None).status_code == 400
+        assert self.send_request({"items": []}).status_code == 400
+        assert self.send_request({"items": [self.sample_item()] * (BATCH_STATISTICS_MAX_ITEMS + 1)}).status_code == 400
+        for invalid in [
+            {"symbol": "X"}, {"start_date": "2023-06-21"}, {"end_date": "June 1st"}, {"end_date": None}, {"symbol": None}
+        ]:
+            resp = self.send_request({"items": [self.sample_item(), {**self.sample_item(), **invalid}]})
+            assert resp.status_code == 400
+            assert resp.json["info"]["error"].startswith("items[1]: ")
+        resp = self.send_request({"items": [self.sample_item(), "IBM"]})
+        assert resp.status_code == 400
+
+    def test_post(self):
+        stats = {"average_daily_open_price": 1.25, "average_daily_close_price": 2.0, "average_daily_volume": 3.0}
+        with mock.patch("routes.get_batch_statistics", return_value=[stats, {}]) as mocked:
+            resp = self.send_request({"items": [self.sample_item(), self.sample_item("AAPL")]})
+        assert resp.status_code == 200
+        items = mocked.call_args[0][0]
+        assert [i["symbol"] for i in items] == ["IBM", "AAPL"]
+        # Parsed as `/statistics` parses them; so the cache keys are the same
+        assert items[0]["start_date"].year == 2023 and not isinstance(items[0]["start_date"], str)
+        ok, empty = resp.json["data"]
+        assert ok == {**self.sample_item(), "average_daily_open_price": 1.2, "average_daily_close_price": 2.0,
+                      "average_daily_volume": 3.0, "status": 200, "error": None}
+        assert empty["status"] == 404
+        assert empty["error"] == "No records found."
+        assert empty["average_daily_open_price"] is None
@@ -0,0 +1,44 @@
+import mock
+from . import test_client
+from financial import export_financial_data
+
+
+class TestExportFinancialDataView:
+    ENDPOINT = "/api/financial_data/export"
+
+    def send_request(self, query_params={}, headers={}):
+        with test_client() as client:
+            return client.get(self.ENDPOINT, query_string=query_params, headers=headers)
+
+    def test_invalid_gets(self):
+        assert self.send_request({"symbol": "X"}).status_code == 400
+        assert self.send_request({"format": "xml"}).status_code == 400
+        assert self.send_request({"start_date": "2023-06-02", "end_date": "2023-06-01"}).status_code == 400
+
+    def test_formats(self):
+        with mock.patch("routes.export_financial_data.main", side_effect=lambda **kwargs: iter(["a\n", "b\n"])) as export:
+            resp = self.send_request({"symbol": "IBM", "limit": 3})
+            assert resp.status_code == 200
+            assert resp.mimetype == "application/x-ndjson"
+            assert resp.data == b"a\nb\n"
+            assert "Content-Length" not in resp.headers
+            export.assert_called_once_with(format="ndjson", symbol="IBM")
+
+            resp = self.send_request(headers={"Accept": "text/csv"})
+            assert resp.data == b"a\nb\n"
+            assert resp.mimetype == "text/csv"
+            assert resp.headers["Content-Disposition"] == 'attachment; filename="financial_data.csv"'
+            # The argument wins over the header
+            resp = self.send_request({"format": "ndjson"}, headers={"Accept": "text/csv"})
+            assert resp.data == b"a\nb\n"
+            assert resp.mimetype == "application/x-ndjson"
+
+    def test_binary_formats(self):
+        with mock.patch("routes.export_financial_data.main", side_effect=lambda **kwargs: iter([b"\0\1"])) as export:
+            resp = self.send_request(headers={"Accept": "application/vnd.financial-data.columns"})
+            assert resp.data == b"\0\1"
+            assert resp.headers["Content-Disposition"] == 'attachment; filename="financial_data.columns"'
+            export.assert_called_once_with(format="columns")
+            if "arrow" in export_financial_data.MEDIA_TYPES:
+                resp = self.send_request(headers={"Accept": "application/vnd.apache.arrow.stream, application/json;q=0.5"})
+                assert resp.mimetype == "application/vnd.apache.arrow.stream"
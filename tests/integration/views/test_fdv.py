@@ -103,3 +103,33 @@ class TestFinancialDataView:
             assert content["pagination"]["page"] == 2
             assert content["pagination"]["pages"] == 5
             assert content["pagination"]["limit"] == 3
+
+    # 200 OK (Cursor Mode)
+    def test_get__cursor_ok(self):
+        list_res = [FDFactory.mock() for _ in range(3)]
+        with mock.patch("routes.seek_financial_data", return_value=(list_res, "next")) as seek_financial_data:
+            with mock.patch("routes.list_financial_data") as list_financial_data:
+                resp = self.send_request({"limit": 3, "cursor": ""})
+                content = jsloads(resp.data)
+                assert resp.status_code == 200
+                list_financial_data.assert_not_called()
+                seek_financial_data.assert_called_once_with(limit=3, cursor="")
+                assert len(content["data"]) == 3
+                assert content["data"][0]["symbol"] == list_res[0].symbol.name
+                assert content["pagination"]["next_cursor"] == "next"
+                assert content["pagination"]["limit"] == 3
+                assert content["pagination"]["count"] is None
+                assert content["pagination"]["pages"] is None
+
+    # 404 Error (Cursor Mode)
+    def test_get__cursor_empty(self):
+        with mock.patch("routes.seek_financial_data", return_value=([], None)):
+            resp = self.send_request({"cursor": ""})
+            assert resp.status_code == 404
+
+    # 400 Error (Cursor Mode)
+    def test_get__cursor_invalid(self):
+        resp = self.send_request({"cursor": "garbage"})
+        content = jsloads(resp.data)
+        assert resp.status_code == 400
+        assert content["info"]["error"] != ""
@@ -0,0 +1,53 @@
+import mock
+from datetime import date
+from . import test_client
+
+
+class TestRollingStatisticsView:
+    ENDPOINT = "/api/statistics/rolling"
+
+    def send_request(self, query_params={}):
+        with test_client() as client:
+            return client.get(self.ENDPOINT, query_string=query_params)
+
+    def sample_query(self):
+        return {"symbol": "IBM", "start_date": "2023-06-01", "end_date": "2023-06-20"}
+
+    def test_invalid_gets(self):
+        assert self.send_request({**self.sample_query(), "symbol": "X"}).status_code == 400
+        assert self.send_request({**self.sample_query(), "end_date": "2023-05-01"}).status_code == 400
+        for window in [0, 1, "x"]:
+            assert self.send_request({**self.sample_query(), "window": window}).status_code == 400
+        for deleted in self.sample_query():
+            assert self.send_request({k: v for k, v in self.sample_query().items() if k != deleted}).status_code == 400
+
+    def test_get__empty(self):
+        with mock.patch("routes.get_rolling_statistics", return_value=[]):
+            resp = self.send_request(self.sample_query())
+        assert resp.status_code == 404
+        assert resp.json["info"]["error"] == "No records found."
+
+    def test_get(self):
+        series = [{"date": date(2023, 6, 1), "mean_open_price": 1.5, "mean_close_price": 2.5, "vwap": 2.25, "volatility": None}]
+        with mock.patch("routes.get_rolling_statistics", return_value=series) as mocked:
+            resp = self.send_request({**self.sample_query(), "window": 5})
+        assert resp.status_code == 200
+        assert mocked.call_args.kwargs["window"] == 5
+        assert resp.json["data"]["window"] == 5
+        assert resp.json["data"]["symbol"] == "IBM"
+        assert resp.json["data"]["series"] == [{**series[0], "date": "2023-06-01"}]
+        assert "ETag" in resp.headers
+        with mock.patch("routes.get_rolling_statistics", return_value=series) as mocked:
+            self.send_request(self.sample_query())
+        assert mocked.call_args.kwargs["window"] == 20
+
+    # The default window has the ETag of the request omitting it
+    def test_get__etag_defaults(self):
+        series = [{"date": date(2023, 6, 1), "mean_open_price": 1.5, "mean_close_price": 2.5, "vwap": 2.25, "volatility": None}]
+        with mock.patch("routes.get_rolling_statistics", return_value=series):
+            etag = self.send_request(self.sample_query()).headers["ETag"]
+            assert self.send_request({**self.sample_query(), "window": 20}).headers["ETag"] == etag
+            assert self.send_request({**self.sample_query(), "window": 5}).headers["ETag"] != etag
+            # Invalid arguments are answered by the view, without a tag
+            resp = self.send_request({**self.sample_query(), "window": 1})
+        assert resp.status_code == 400 and "ETag" not in resp.headers
@@ -81,3 +81,32 @@ class TestStatisticsView:
             assert content["data"]["end_date"] == query['end_date']
             assert len(content["data"].keys()) == 6
             assert "" == content["info"]["error"]
+
+    # 304 Not Modified
+    def test_get__not_modified(self):
+        query = self.sample_query()
+        stats = self.sample_statitstics(query['symbol'])
+        with mock.patch("routes.get_statistics", return_value=stats) as mocked:
+            resp = self.send_request(query)
+            etag = resp.headers["ETag"]
+            assert resp.status_code == 200
+            with test_client() as client:
+                resp = client.get(self.ENDPOINT, query_string=query, headers={"If-None-Match": etag})
+            assert resp.status_code == 304
+            assert resp.headers["ETag"] == etag
+            assert resp.data == b""
+            mocked.assert_called_once()
+
+    # ETag changes with the data generation of the symbol
+    def test_get__etag_generation(self):
+        query = self.sample_query()
+        stats = self.sample_statitstics(query['symbol'])
+        with mock.patch("routes.get_statistics", return_value=stats):
+            with mock.patch("lib.etag.generations.get", return_value=1):
+                etag = self.send_request(query).headers["ETag"]
+                assert self.send_request(dict(reversed(query.items()))).headers["ETag"] == etag
+            with mock.patch("lib.etag.generations.get", return_value=2):
+                with test_client() as client:
+                    resp = client.get(self.ENDPOINT, query_string=query, headers={"If-None-Match": etag})
+                assert resp.status_code == 200
+                assert resp.headers["ETag"] != etag
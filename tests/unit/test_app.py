@@ -0,0 +1,19 @@
+from app import create_app, db, cache
+from lib.cache import TwoTierCache
+
+
+def test_create_app():
+    app = create_app({"TESTING": True, "CACHE_L1_TIMEOUT": 5})
+    assert app.config["TESTING"]
+    assert app.config["SQLALCHEMY_DATABASE_URI"] == db.connection_uri()
+    rules = {rule.rule for rule in app.url_map.iter_rules()}
+    assert {"/api/financial_data", "/api/statistics"} <= rules
+    with app.app_context():
+        assert isinstance(cache.cache, TwoTierCache)
+        assert cache.cache.l1_timeout == 5
+        assert db.core.engine is not None
+    # The extensions can be bound to more than one application
+    other = create_app()
+    with other.app_context():
+        assert isinstance(cache.cache, TwoTierCache)
+        assert cache.cache.l1_timeout != 5
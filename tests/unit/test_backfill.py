@@ -0,0 +1,49 @@
+from datetime import date, datetime, timedelta
+from mock import Mock, patch
+from financial import backfill, ingestion
+from lib.avantage_api import DailyTimeSeriesBatch
+from model import FinancialData, BackfillCheckpoint
+
+
+def batches(newest: date, n: int, size: int):
+    days = [newest - timedelta(days=i) for i in range(n)]
+    return [DailyTimeSeriesBatch("IBM", chunk, [1] * len(chunk), [2] * len(chunk), [3] * len(chunk)) for chunk in (days[i:i + size] for i in range(0, n, size))]
+
+
+def test_advance():
+    checkpoint = BackfillCheckpoint(symbol=FinancialData.Symbols.IBM, newest_date=date(2023, 6, 2), oldest_date=date(2023, 5, 1))
+    session = Mock()
+    session.get.side_effect = lambda cls, symbol: checkpoint if symbol == FinancialData.Symbols.IBM else None
+    backfill.advance(session, [
+        {"symbol": "IBM", "date": datetime(2023, 4, 28)},
+        {"symbol": FinancialData.Symbols.AAPL, "date": datetime(2023, 6, 1)}
+    ])
+    assert (checkpoint.oldest_date, checkpoint.newest_date) == (date(2023, 4, 28), date(2023, 6, 2))
+    created = session.add.call_args[0][0]
+    assert (created.symbol, created.oldest_date, created.newest_date, created.completed) == (FinancialData.Symbols.AAPL, date(2023, 6, 1), date(2023, 6, 1), False)
+
+
+@patch.object(ingestion, "plan_batch", side_effect=lambda session, batch, report: batch)
+@patch.object(backfill, "db")
+def test_run_resumes(db, *args):
+    checkpoint = BackfillCheckpoint(symbol=FinancialData.Symbols.IBM, newest_date=date(2023, 6, 2), oldest_date=date(2023, 5, 24), completed=False)
+    db.core.session.get.return_value = checkpoint
+    client = Mock()
+    client.stream_full_data.return_value = iter(batches(date(2023, 6, 4), 25, 10))
+    assert backfill.run(client, "IBM", ingestion.IngestionReport(), chunk_rows=10)
+    client.stream_full_data.assert_called_once_with("IBM", 10)
+    written = [row["date"] for call in db.bulk_upsert_rows.call_args_list for row in call.kwargs["rows"]]
+    # The committed dates of the interrupted run are skipped
+    assert written[:2] == [date(2023, 6, 4), date(2023, 6, 3)]
+    assert written[2:] == [date(2023, 5, 23) - timedelta(days=i) for i in range(13)]
+    assert [len(call.kwargs["rows"]) for call in db.bulk_upsert_rows.call_args_list] == [2, 8, 5]
+    assert checkpoint.completed
+    assert checkpoint.oldest_date == date(2023, 5, 11)
+
+
+@patch.object(backfill, "db")
+def test_run_completed(db):
+    db.core.session.get.return_value = BackfillCheckpoint(symbol=FinancialData.Symbols.IBM, completed=True)
+    client = Mock()
+    assert not backfill.run(client, "IBM", ingestion.IngestionReport())
+    client.stream_full_data.assert_not_called()
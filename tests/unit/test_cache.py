@@ -0,0 +1,95 @@
+import mock
+import pickle
+from cachelib import FileSystemCache
+from lib.cache import LRUByteCache, TwoTierCache
+from app import cache
+
+
+def blob_size(value) -> int:
+    return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
+def test_app_cache_backend():
+    from app import create_app
+    with create_app().app_context():
+        assert isinstance(cache.cache, TwoTierCache)
+
+
+def test_lru_byte_budget():
+    value = "x" * 100
+    l1 = LRUByteCache(max_bytes=3 * blob_size(value))
+    for key in "abc":
+        assert l1.set(key, value)
+    assert l1.size == 3 * blob_size(value)
+    # Touch `a`, so `b` becomes the least recently used item
+    assert l1.get("a") == value
+    l1.set("d", value)
+    assert l1.get("b") is None
+    assert l1.get("a") == l1.get("c") == l1.get("d") == value
+    assert l1.evictions == 1
+    assert l1.size <= l1.max_bytes
+    # Values larger than the whole budget are not stored
+    assert not l1.set("e", "x" * 1000)
+    assert not l1.has("e")
+
+
+def test_lru_ttl():
+    l1 = LRUByteCache(max_bytes=1024)
+    with mock.patch("lib.cache.time.monotonic", return_value=100.0):
+        l1.set("a", 1, timeout=10)
+        l1.set("b", 2, timeout=0)
+    with mock.patch("lib.cache.time.monotonic", return_value=111.0):
+        assert l1.get("a") is None
+        assert l1.get("b") == 2
+    assert l1.size == blob_size(2)
+
+
+def test_lru_values_are_not_shared():
+    l1 = LRUByteCache(max_bytes=1024)
+    value = {"a": 1}
+    l1.set("k", value)
+    value["a"] = 2
+    assert l1.get("k") == {"a": 1}
+
+
+def test_two_tier_shared_between_workers(tmp_path):
+    def worker():
+        return TwoTierCache(
+            l1=LRUByteCache(max_bytes=1024), l2=FileSystemCache(str(tmp_path)), l1_timeout=30
+        )
+    w1, w2 = worker(), worker()
+    assert w1.get("k") is None
+    w1.set("k", {"v": 1})
+    assert w1.get("k") == {"v": 1}
+    assert w2.get("k") == {"v": 1}
+    assert w2.get("k") == {"v": 1}
+    assert w1.stats()["misses"] == 1
+    assert w1.stats()["hits_l1"] == 1
+    assert w2.stats()["hits_l2"] == 1
+    assert w2.stats()["hits_l1"] == 1
+    w1.delete("k")
+    assert not w1.has("k")
+    assert w2.l2.get("k") is None
+
+
+def test_two_tier_memoize(tmp_path):
+    from flask import Flask
+    from flask_caching import Cache
+    app = Flask("test")
+    app.config.update({
+        "CACHE_TYPE": "lib.cache.TwoTierCache", "CACHE_DIR": str(tmp_path),
+        "CACHE_L1_MAX_BYTES": 1024, "CACHE_L1_TIMEOUT": 5
+    })
+    test_cache = Cache(app)
+    calls = []
+
+    @test_cache.memoize(50)
+    def square(x):
+        calls.append(x)
+        return x * x
+
+    with app.app_context():
+        assert square(3) == square(3) == 9
+        assert calls == [3]
+        assert test_cache.cache.l1_timeout == 5
+        assert test_cache.cache.stats()["hits_l1"] >= 1
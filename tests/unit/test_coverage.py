@@ -0,0 +1,53 @@
+from datetime import date, datetime
+from financial.coverage import DateCoverageIndex
+from lib.generation import DataGeneration
+from model import FinancialData
+
+
+def sample_index(tmp_path) -> DateCoverageIndex:
+    index = DateCoverageIndex(generations=DataGeneration(str(tmp_path / "generations.json")), max_age=3600)
+    index.load([
+        ("IBM", date(2023, 6, 2)),
+        ("IBM", date(2023, 5, 31)),
+        ("IBM", date(2023, 6, 1)),
+        (FinancialData.Symbols.AAPL, date(2023, 6, 1)),
+    ])
+    index._generation = index.generations.get()
+    return index
+
+
+def test_count(tmp_path):
+    index = sample_index(tmp_path)
+    assert index.count() == 4
+    assert index.count("IBM") == 3
+    assert index.count(FinancialData.Symbols.AAPL) == 1
+    assert index.count("IBM", start_date="2023-06-01") == 2
+    assert index.count("IBM", end_date=datetime(2023, 6, 1)) == 2
+    assert index.count("IBM", date(2023, 6, 1), date(2023, 6, 1)) == 1
+    assert index.count(None, "2023-06-01", "2023-06-02") == 3
+    assert index.count("IBM", "2023-06-03", "2023-06-30") == 0
+    assert index.count("IBM", "2023-06-02", "2023-06-01") == 0
+
+
+def test_lookback(tmp_path):
+    index = sample_index(tmp_path)
+    assert index.lookback("IBM", "2023-06-02", 1) == date(2023, 6, 1)
+    assert index.lookback("IBM", date(2023, 6, 2), 2) == date(2023, 5, 31)
+    # Not as many records before the date
+    assert index.lookback("IBM", date(2023, 6, 2), 5) == date(2023, 5, 31)
+    assert index.lookback("IBM", date(2023, 5, 1), 5) == date(2023, 5, 1)
+    assert index.lookback("IBM", date(2023, 7, 1), 2) == date(2023, 6, 1)
+    assert index.lookback(FinancialData.Symbols.AAPL, date(2023, 7, 1), 1) == date(2023, 6, 1)
+
+
+def test_staleness(tmp_path):
+    index = sample_index(tmp_path)
+    assert not index.is_stale()
+    # An ingestion from another process
+    DataGeneration(str(tmp_path / "generations.json")).bump(["IBM"])
+    assert index.is_stale()
+    index._generation = index.generations.get()
+    assert not index.is_stale()
+    index.max_age = 0
+    assert index.is_stale()
+    assert DateCoverageIndex(generations=index.generations).is_stale()
@@ -0,0 +1,51 @@
+from sqlalchemy.dialects import mysql, sqlite
+from lib.db import AdaptiveBatchSize, MySQL, SQLite
+from model import FinancialData
+
+
+def test_upsert_index_keys():
+    assert FinancialData.upsert_index_keys() == ["symbol", "date"]
+
+
+def test_sqlite_upsert_statement():
+    stmt = SQLite.upsert_statement(None, FinancialData, update_keys=["open_price", "updated_at"])
+    sql = str(stmt.compile(dialect=sqlite.dialect()))
+    assert sql.startswith("INSERT INTO financial_data")
+    assert "ON CONFLICT (symbol, date) DO UPDATE SET" in sql
+    assert "open_price = excluded.open_price" in sql
+    assert "close_price = excluded" not in sql
+
+
+def test_mysql_upsert_statement():
+    stmt = MySQL.upsert_statement(None, FinancialData, update_keys=["open_price", "updated_at"])
+    sql = str(stmt.compile(dialect=mysql.dialect()))
+    assert sql.startswith("INSERT INTO financial_data")
+    assert "ON DUPLICATE KEY UPDATE open_price = VALUES(open_price), updated_at = VALUES(updated_at)" in sql
+
+
+def test_adaptive_batch_size_bounds():
+    sizer = AdaptiveBatchSize(initial=10, bounds=(50, 400), target_seconds=0.2)
+    assert sizer.size == 50
+    # Fast commits grow the batch, at most doubling each time
+    sizer.observe(rows=50, seconds=0.001)
+    assert sizer.size == 100
+    for _ in range(10):
+        sizer.observe(rows=sizer.size, seconds=0.001)
+    assert sizer.size == 400
+    # Slow commits shrink the batch, at most halving each time
+    sizer.observe(rows=400, seconds=10)
+    assert sizer.size == 200
+    for _ in range(10):
+        sizer.observe(rows=sizer.size, seconds=10)
+    assert sizer.size == 50
+
+
+def test_adaptive_batch_size_converges_to_target():
+    sizer = AdaptiveBatchSize(initial=100, bounds=(1, 10000), target_seconds=0.2)
+    # 1ms per row => 200 rows per 0.2s
+    for _ in range(5):
+        sizer.observe(rows=sizer.size, seconds=sizer.size * 0.001)
+    assert sizer.size == 200
+    # Empty batches carry no information
+    sizer.observe(rows=0, seconds=5)
+    assert sizer.size == 200
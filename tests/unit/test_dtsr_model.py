@@ -1,9 +1,12 @@
 from model import FinancialData
 from tests.factories.avantage_resp import DailyTimeSeriesRecords as DTSRsFactory
-from lib.avantage_api import AlphaVantageAPI, DailyTimeSeriesRecord
+from lib.avantage_api import AlphaVantageAPI, DailyTimeSeriesRecord, DailyTimeSeriesBatch
+from lib.exceptions import SymbolUndefinedError
 from conf.settings import DEFAULT_DATE_FMT
 from random import choice as rsample
-from datetime import datetime
+from datetime import datetime, date
+import mock
+import pytest
 
 
 def test_dtsr_to_x():
@@ -29,3 +32,31 @@ def test_dtsr_to_x():
     assert actual_obj == expected_obj
     # To Dict
     assert actual_dict == expected_dict
+
+
+def test_dtsb_from_records():
+    records_dict = DTSRsFactory.mock()["Time Series (Daily)"]
+    with mock.patch.object(FinancialData, "is_symbol_valid", wraps=FinancialData.is_symbol_valid) as validate:
+        batch = DailyTimeSeriesBatch.from_records(FinancialData.Symbols.IBM, records_dict.items())
+        # Once per batch, not per row
+        validate.assert_called_once()
+    assert len(batch) == len(records_dict)
+    assert batch.symbol == "IBM"
+    row = batch.rows()[0]
+    assert row == {
+        "symbol": "IBM", "date": date(2023, 6, 2), "open_price": 130.38, "close_price": 132.42,
+        "volume": 5375796, "updated_at": batch.updated_at
+    }
+    assert set(row) == set(FinancialData.as_sql_table()[1])
+    with pytest.raises(SymbolUndefinedError):
+        DailyTimeSeriesBatch.from_records("X", records_dict.items())
+
+
+def test_dtsb_take():
+    records_dict = DTSRsFactory.mock()["Time Series (Daily)"]
+    batch = DailyTimeSeriesBatch.from_records("IBM", records_dict.items())
+    taken = batch.take([1, 0])
+    assert taken.dates == [batch.dates[1], batch.dates[0]]
+    assert list(taken.volumes) == [batch.volumes[1], batch.volumes[0]]
+    assert taken.updated_at == batch.updated_at
+    assert not batch.take([])
@@ -0,0 +1,64 @@
+"""Fast path of the list responses (`lib/fastjson.py`).
+
+Run with `pytest -s tests/unit/test_fastjson.py` to print the benchmark.
+"""
+import json
+import time
+from datetime import date
+from flask_restx import marshal
+from app import create_app
+from lib.fastjson import FastMarshal
+from model import FinancialDataSerializer
+from routes import FinancialDataView, serialize_financial_data
+from tests.factories.financial_data import FinancialData as FDFactory
+
+KEYS = list(FinancialDataView.DATA)
+BENCHMARK_ROWS = 10000
+
+
+def regular(objs) -> str:
+    """The body of the response, as `api.marshal_with` + `output_json` make it."""
+    return json.dumps(marshal(serialize_financial_data(objs), FinancialDataView.DATA))
+
+
+def records(n: int):
+    return [FDFactory.mock() for _ in range(n)]
+
+
+def test_compile_identical():
+    objs = records(200)
+    edge_prices = [0.04, -0.04, 0.05, 99.95, 130.38, 1e13 + 0.25, 1e14, 1e15 + 0.5, 1e17, -1e17, 2.5e-7, float("inf"), float("nan")]
+    for price, obj in zip(edge_prices, objs):
+        obj.open_price = price
+        obj.close_price = -price
+    objs[1].date = date(2023, 6, 2)
+    assert FinancialDataSerializer.compile(KEYS)(objs) == regular(objs)
+    assert FinancialDataSerializer.compile(KEYS)([]) == regular([]) == "[]"
+    # Excluded fields are never built
+    assert FinancialDataSerializer.compile(["date", "volume"])(objs[:1]) == json.dumps([{"date": objs[0].date.isoformat(), "volume": objs[0].volume}])
+
+
+def test_fast_marshal_identical():
+    objs = records(20)
+    app = create_app()
+    with app.test_request_context():
+        envelope = {"data": objs, "pagination": {"count": 40, "page": 1, "limit": 20, "pages": 2}}
+        expected = json.dumps(marshal({**envelope, "data": serialize_financial_data(objs)}, FinancialDataView.RESPONSE)) + "\n"
+        fast = FastMarshal(FinancialDataView.RESPONSE, "data", FinancialDataSerializer.compile(KEYS), serialize_financial_data)
+        assert fast.dumps(envelope) == expected
+
+
+def test_benchmark():
+    objs = records(BENCHMARK_ROWS)
+    encode = FinancialDataSerializer.compile(KEYS)
+    timings = {}
+    for name, func in (("marshal_with", regular), ("compiled", encode)):
+        began = time.perf_counter()
+        for _ in range(3):
+            func(objs)
+        timings[name] = (time.perf_counter() - began) / 3
+    print()
+    for name, seconds in timings.items():
+        print(f"{name:>14}: {BENCHMARK_ROWS / seconds:>12,.0f} rows/s")
+    print(f"{'speedup':>14}: {timings['marshal_with'] / timings['compiled']:.1f}x")
+    assert timings["compiled"] < timings["marshal_with"] / 2
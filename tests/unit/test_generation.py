@@ -0,0 +1,38 @@
+from lib.generation import DataGeneration
+from model import FinancialData
+
+
+def test_generation_bump(tmp_path):
+    path = str(tmp_path / "generations.json")
+    writer, reader = DataGeneration(path), DataGeneration(path)
+    assert reader.get() == 0
+    assert reader.get("IBM") == 0
+    writer.bump(["IBM", FinancialData.Symbols.AAPL])
+    writer.bump([FinancialData.Symbols.IBM])
+    assert reader.get("IBM") == 2
+    assert reader.get(FinancialData.Symbols.AAPL) == 1
+    assert reader.get() == 3
+    # Only monotonically increasing
+    before = reader.get()
+    writer.bump(["AAPL"])
+    assert reader.get() > before
+
+
+def test_generation_namespace(tmp_path):
+    generations = DataGeneration(str(tmp_path / "generations.json"))
+    name = generations.namespace("financial.get_statistics.main")
+    assert name == generations.namespace("financial.get_statistics.main")
+    generations.bump(["IBM"])
+    assert name != generations.namespace("financial.get_statistics.main")
+
+
+def test_generation_pending(tmp_path):
+    path = str(tmp_path / "generations.json")
+    warmer, worker = DataGeneration(path), DataGeneration(path)
+    with warmer.pending(["IBM"]):
+        upcoming = warmer.namespace("financial.get_statistics.main")
+        assert warmer.get("IBM") == 1
+        assert worker.get("IBM") == 0
+    assert warmer.get("IBM") == 0
+    warmer.bump(["IBM"])
+    assert worker.namespace("financial.get_statistics.main") == upcoming
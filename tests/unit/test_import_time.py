@@ -0,0 +1,55 @@
+"""Import-time report of the API application (`python -X importtime`).
+
+Run with `pytest -s tests/unit/test_import_time.py` to print the report.
+"""
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Tuple
+import os
+import subprocess
+import sys
+
+ROOT = Path(__file__).resolve().parents[2]
+# Only needed by other entry points (ingestion, optional formats) or environments
+DEFERRED_MODULES = {"pandas", "numpy", "pyarrow", "requests", "flask_cors"}
+PROJECT_PACKAGES = {"app", "routes", "model", "financial", "lib", "conf", "__init__"}
+# Self time of the project modules; i.e. excluding the third-party packages they import
+PROJECT_BUDGET_US = 250_000
+
+
+def import_times(statement: str) -> Dict[str, Tuple[int, int]]:
+    """Returns the (self, cumulative) import time in microseconds, per module."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+        env={**os.environ, "APP_ENV": "dev"}
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def aggregate(times: Dict[str, Tuple[int, int]]) -> Dict[str, int]:
+    """Sums the self times per top-level package."""
+    totals = defaultdict(int)
+    for name, (self_us, _) in times.items():
+        totals[name.split(".")[0]] += self_us
+    return dict(totals)
+
+
+def test_api_import_time():
+    times = import_times("from app import create_app; create_app()")
+    totals = aggregate(times)
+    print("\nImport time per top-level package (self, ms):")
+    for package, us in sorted(totals.items(), key=lambda item: -item[1])[:15]:
+        print(f"    {package:<24}{us / 1000:>8.1f}")
+
+    assert "routes" in times
+    assert not DEFERRED_MODULES & set(totals)
+    project_us = sum(us for package, us in totals.items() if package in PROJECT_PACKAGES)
+    print(f"    {'(project)':<24}{project_us / 1000:>8.1f}")
+    assert project_us < PROJECT_BUDGET_US
@@ -0,0 +1,101 @@
+import json
+import struct
+from datetime import date, datetime, timedelta
+from mock import Mock
+from financial import ingestion
+from lib.avantage_api import DailyTimeSeriesBatch
+from model import FinancialData, IngestionWatermark
+from conf.settings import INGESTION_HASH_WINDOW_DAYS
+
+
+def as_float32(value: float) -> float:
+    return struct.unpack("f", struct.pack("f", value))[0]
+
+
+def record(day: date, open_price: str = "130.38", close_price: str = "132.42", volume: str = "5375796") -> FinancialData:
+    return FinancialData(
+        symbol="IBM", date=datetime.combine(day, datetime.min.time()),
+        open_price=open_price, close_price=close_price, volume=volume, updated_at=datetime.now()
+    )
+
+
+def session_with(watermark=None, rows=()) -> Mock:
+    session = Mock()
+    session.get.return_value = watermark
+    session.query.return_value.filter.return_value = list(rows)
+    return session
+
+
+def test_row_hash():
+    # The strings of the API, and the values read back from the single precision columns
+    assert ingestion.row_hash("130.38", "132.42", "5375796") == ingestion.row_hash(as_float32(130.38), as_float32(132.42), 5375796)
+    assert ingestion.row_hash("130.38", "132.42", "5375796") != ingestion.row_hash("130.38", "132.42", "5375797")
+    # Close to a rounding boundary of the decimal digits
+    assert ingestion.row_hash("999.99995", "1234.56785", "1") == ingestion.row_hash(as_float32(999.99995), as_float32(1234.56785), 1)
+    assert ingestion.row_hash("130.38", "132.42", "5375796") != ingestion.row_hash("130.38003", "132.42", "5375796")
+
+
+def test_plan_with_watermark():
+    day = date(2023, 6, 1)
+    watermark = IngestionWatermark(symbol=FinancialData.Symbols.IBM, last_date=day, row_hashes=json.dumps({
+        (day - timedelta(days=1)).isoformat(): ingestion.row_hash("130.38", "132.42", "5375796"),
+        day.isoformat(): ingestion.row_hash("130.38", "132.42", "5375796")
+    }))
+    session = session_with(watermark)
+    report = ingestion.IngestionReport()
+    unchanged, revised, new = record(day - timedelta(days=1)), record(day, close_price="133"), record(day + timedelta(days=1))
+    assert ingestion.plan(session, "IBM", [unchanged, revised, new], report) == [revised, new]
+    assert report.counts == {"IBM": {"inserted": 1, "updated": 1, "skipped": 1}}
+    assert report.changed_symbols() == ["IBM"]
+    # All the dates were covered by the watermark
+    session.query.assert_not_called()
+
+
+def test_plan_without_watermark():
+    day = date(2023, 6, 1)
+    session = session_with(rows=[(day, as_float32(130.38), as_float32(132.42), 5375796)])
+    report = ingestion.IngestionReport()
+    new = record(day + timedelta(days=1))
+    assert ingestion.plan(session, FinancialData.Symbols.IBM, [record(day), new], report) == [new]
+    assert report.totals() == {"inserted": 1, "updated": 0, "skipped": 1}
+    assert report.changed_symbols() == ["IBM"]
+    # The hashes read from the table are kept in a new watermark
+    watermark = session.add.call_args[0][0]
+    assert watermark.last_date == day
+    assert list(json.loads(watermark.row_hashes)) == [day.isoformat()]
+
+
+def test_plan_unchanged():
+    report = ingestion.IngestionReport()
+    assert ingestion.plan(session_with(), "IBM", [], report) == []
+    assert report.changed_symbols() == []
+
+
+def test_record_rows():
+    last_date = date(2023, 6, 1)
+    old = last_date - timedelta(days=INGESTION_HASH_WINDOW_DAYS + 1)
+    watermark = IngestionWatermark(symbol=FinancialData.Symbols.IBM, last_date=last_date, row_hashes=json.dumps({old.isoformat(): "x"}))
+    session = session_with(watermark)
+    rows = [
+        {"symbol": "IBM", "date": datetime(2023, 6, 2), "open_price": "1", "close_price": "2", "volume": "3"},
+        {"symbol": "IBM", "date": datetime(2023, 5, 30), "open_price": "1", "close_price": "2", "volume": "3"}
+    ]
+    ingestion.record_rows(session, rows)
+    assert watermark.last_date == date(2023, 6, 2)
+    # Older hashes than the window are dropped
+    assert sorted(json.loads(watermark.row_hashes)) == ["2023-05-30", "2023-06-02"]
+    session.add.assert_not_called()
+
+
+def test_plan_batch():
+    day = date(2023, 6, 1)
+    watermark = IngestionWatermark(symbol=FinancialData.Symbols.IBM, last_date=day, row_hashes=json.dumps({
+        day.isoformat(): ingestion.row_hash("130.38", "132.42", "5375796")
+    }))
+    report = ingestion.IngestionReport()
+    batch = DailyTimeSeriesBatch(
+        "IBM", [day, day + timedelta(days=1)], [130.38, 130.38], [132.42, 132.42], [5375796, 5375796]
+    )
+    changed = ingestion.plan_batch(session_with(watermark), batch, report)
+    assert changed.dates == [day + timedelta(days=1)]
+    assert report.counts == {"IBM": {"inserted": 1, "updated": 0, "skipped": 1}}
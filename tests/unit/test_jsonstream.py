@@ -0,0 +1,37 @@
+import json
+import pytest
+from lib.jsonstream import iter_object_items
+from lib.utils import load_test_fixture
+
+
+def chunked(text: str, size: int):
+    data = text.encode()
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 64, 1 << 20])
+def test_iter_object_items(size):
+    doc = json.load(load_test_fixture("sample_avantage_dts_adj.json"))
+    doc["Meta Data"] = {"1. Information": "Daily {Prices}: \"adjusted\"", "4. Output Size": 12345, "5. Time Zone": "Zürich"}
+    doc["Trailer"] = [1, 2.5, None]
+    others = {}
+    items = iter_object_items(chunked(json.dumps(doc, indent=4), size), "Time Series (Daily)", on_other=others.__setitem__)
+    assert list(items) == list(doc["Time Series (Daily)"].items())
+    assert others == {"Meta Data": doc["Meta Data"], "Trailer": doc["Trailer"]}
+
+
+def test_iter_object_items_lazily():
+    def chunks():
+        yield '{"Time Series (Daily)": {"2023-06-02": {"1. open": "1"}, '
+        raise ConnectionError()
+    items = iter_object_items(chunks(), "Time Series (Daily)")
+    # The first member is yielded before the rest of the document is read
+    assert next(items) == ("2023-06-02", {"1. open": "1"})
+    with pytest.raises(ConnectionError):
+        next(items)
+
+
+def test_iter_object_items_missing_or_truncated():
+    assert list(iter_object_items(['{"Note": "Thank you for using Alpha Vantage!"}'], "Time Series (Daily)")) == []
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_object_items(['{"Time Series (Daily)": {"2023-06-02": {"1. open": "1"}'], "Time Series (Daily)"))
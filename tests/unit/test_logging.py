@@ -0,0 +1,136 @@
+import logging
+import os
+import pytest
+import threading
+from lib.logging import APIErrorHandler, Loggable, QueuedLogging, SamplingFilter, Summary
+from werkzeug.exceptions import HTTPException
+
+
+def test_summary():
+    assert str(Summary(list(range(1000)))) == "list[1000](0, 1, 2, ...)"
+    assert str(Summary({"a": 1, "b": 2})) == "{'a': 1, 'b': 2}"
+    assert str(Summary("IBM", as_repr=True)) == "'IBM'"
+    assert str(Summary((2, list(range(1000))))) == "(2, list[1000](0, 1, 2, ...))"
+    assert str(Summary(("IBM",))) == "('IBM',)"
+    text = str(Summary("x" * 1000))
+    assert text.startswith("x" * 500) and text.endswith("... (+500 chars)")
+
+
+def test_summary_is_lazy():
+    class Expensive:
+        def __str__(self):
+            raise AssertionError("formatted")
+    summary = Summary(Expensive())
+    logger = logging.getLogger("test_summary_is_lazy")
+    logger.setLevel(logging.WARNING)
+    logger.info("%s", summary)
+
+
+def test_loggable(caplog):
+    @Loggable("test_loggable")
+    def main(symbol, limit=5):
+        return list(range(limit))
+
+    with caplog.at_level(logging.INFO, logger="test_loggable"):
+        assert main("IBM", limit=100) == list(range(100))
+    record, = caplog.records
+    assert record.getMessage() == ".main('IBM', limit=100) => list[100](0, 1, 2, ...)"
+    assert record.function == "main" and record.outcome == "returned" and record.elapsed_ms >= 0
+
+
+def test_stacked_handlers_log_once(caplog):
+    @APIErrorHandler("test_stacked", BaseException, 500, "Error")
+    @APIErrorHandler("test_stacked", KeyError, 400)
+    @APIErrorHandler("test_stacked", ValueError, 404)
+    def get(raises=None):
+        if raises:
+            raise raises("message")
+        return "ok"
+
+    with caplog.at_level(logging.INFO, logger="test_stacked"):
+        assert get() == "ok"
+        with pytest.raises(HTTPException) as e:
+            get(KeyError)
+    assert e.value.code == 400
+    assert [(record.levelname, record.getMessage()) for record in caplog.records] == [
+        ("INFO", ".get() => ok"),
+        ("INFO", ".get(<class 'KeyError'>)"),
+        ("ERROR", "'message'")
+    ]
+
+
+def test_sampling_filter(monkeypatch):
+    sampling = SamplingFilter({"hot": 0.25, "hot.cold": 1})
+    assert sampling.rate("hot.path") == 0.25
+    assert sampling.rate("hot.cold.path") == 1
+    assert sampling.rate("other") == 1
+    monkeypatch.setattr("lib.logging.random.random", lambda: 0.5)
+    info = logging.LogRecord("hot.path", logging.INFO, "", 0, "", (), None)
+    error = logging.LogRecord("hot.path", logging.ERROR, "", 0, "", (), None)
+    assert not sampling.filter(info)
+    assert sampling.filter(error)
+    monkeypatch.setattr("lib.logging.random.random", lambda: 0.1)
+    assert sampling.filter(info)
+
+
+def test_queued_logging(tmp_path):
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    try:
+        log = QueuedLogging(tmp_path / "test.log", sample_rates={"test_queued.sampled": 0})
+        logging.getLogger("test_queued").info("kept")
+        logging.getLogger("test_queued.sampled").info("dropped")
+        logging.getLogger("test_queued.sampled").warning("warned")
+        log.stop()
+        lines = (tmp_path / "test.log").read_text().splitlines()
+        assert [line.split(" ", 3)[-1] for line in lines] == ["test_queued: kept", "test_queued.sampled: warned"]
+    finally:
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        for handler in handlers:
+            root.addHandler(handler)
+        root.setLevel(level)
+
+
+def test_queued_records_are_formatted_by_the_listener(tmp_path):
+    class Value:
+        def __str__(self):
+            threads.append(threading.current_thread())
+            return "value"
+    threads = []
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    try:
+        log = QueuedLogging(tmp_path / "test.log", sample_rates={})
+        logging.getLogger("test_lazy").info("%s", Summary(Value()))
+        log.stop()
+        assert threads and threading.current_thread() not in threads
+        assert (tmp_path / "test.log").read_text().endswith("test_lazy: value\n")
+    finally:
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        for handler in handlers:
+            root.addHandler(handler)
+        root.setLevel(level)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="Requires fork")
+def test_queued_logging_after_fork(tmp_path):
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    try:
+        log = QueuedLogging(tmp_path / "test.log", sample_rates={})
+        pid = os.fork()
+        if not pid:
+            logging.getLogger("test_fork").info("child")
+            log.stop()
+            os._exit(0)
+        os.waitpid(pid, 0)
+        log.stop()
+        assert (tmp_path / "test.log").read_text().splitlines()[0].endswith("test_fork: child")
+    finally:
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        for handler in handlers:
+            root.addHandler(handler)
+        root.setLevel(level)
@@ -0,0 +1,167 @@
+import json
+import os
+import pytest
+import time
+from cachelib import SimpleCache
+from flask import Flask
+from flask_restx import Api, Resource
+from sqlalchemy import create_engine, text
+from lib import metrics
+from lib.cache import LRUByteCache, TwoTierCache
+from lib.metrics import CacheMetrics, MeteredQueuePool, registry
+from financial.ingestion import IngestionReport
+
+DEAD_PID = 2 ** 22 + 1
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(registry, "directory", tmp_path)
+    monkeypatch.setattr(registry, "collectors", {})
+    registry._reset()
+    yield
+    registry._reset()
+
+
+def samples(name):
+    return {
+        line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+        for line in registry.exposition().splitlines() if line.startswith(name)
+    }
+
+
+def test_histogram_exposition():
+    metrics.REQUEST_SECONDS.observe(0.003, resource="StatisticsView", method="GET", status=200)
+    metrics.REQUEST_SECONDS.observe(0.2, resource="StatisticsView", method="GET", status=200)
+    text_ = registry.exposition()
+    assert "# TYPE http_request_duration_seconds histogram" in text_
+    labels = 'method="GET",resource="StatisticsView",status="200"'
+    result = samples("http_request_duration_seconds")
+    assert result[f'http_request_duration_seconds_bucket{{{labels},le="0.005"}}'] == 1
+    assert result[f'http_request_duration_seconds_bucket{{{labels},le="0.1"}}'] == 1
+    assert result[f'http_request_duration_seconds_bucket{{{labels},le="0.25"}}'] == 2
+    assert result[f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}}'] == 2
+    assert result[f"http_request_duration_seconds_count{{{labels}}}"] == 2
+    assert result[f"http_request_duration_seconds_sum{{{labels}}}"] == pytest.approx(0.203)
+
+
+def test_processes_are_merged(tmp_path):
+    metrics.INGESTION_RUNS.inc()
+    metrics.INGESTION_LAST_RUN.set(100)
+    metrics.SQL_SECONDS.observe(0.002, operation="SELECT")
+    # An exited process; not written for a while
+    path = tmp_path / f"{DEAD_PID}-0a1b2c3d.json"
+    path.write_text(json.dumps({
+        "values": [
+            ["ingestion_runs_total", [], 2],
+            ["ingestion_last_run_timestamp_seconds", [], 200],
+            ["cache_bytes_l1", [], 1000]
+        ],
+        "histograms": [["db_statement_duration_seconds", [["operation", "SELECT"]], [0, 0, 1] + [0] * 9 + [0.002]]]
+    }))
+    os.utime(path, (time.time() - 60, time.time() - 60))
+    # A running one (the parent of the tests)
+    (tmp_path / f"{os.getppid()}-4e5f6a7b.json").write_text(json.dumps({
+        "values": [["ingestion_runs_total", [], 4], ["cache_bytes_l1", [], 500]], "histograms": []
+    }))
+    for _ in range(2):
+        assert samples("ingestion_runs_total") == {"ingestion_runs_total": 7}
+        assert samples("ingestion_last_run_timestamp_seconds") == {"ingestion_last_run_timestamp_seconds": 200}
+        # Gauges of exited processes are dropped
+        assert samples("cache_bytes_l1") == {"cache_bytes_l1": 500}
+        assert samples("db_statement_duration_seconds_count") == {'db_statement_duration_seconds_count{operation="SELECT"}': 2}
+    # The file of the exited process was folded into the aggregate
+    assert not path.exists()
+    assert sorted(p.stem for p in tmp_path.glob("*.json") if p.stem != registry.name) == [f"{os.getppid()}-4e5f6a7b", "aggregate"]
+
+
+def test_folded_files_are_not_counted_twice(tmp_path):
+    # A file left behind after being folded
+    path = tmp_path / f"{DEAD_PID}-0a1b2c3d.json"
+    path.write_text(json.dumps({"values": [["ingestion_runs_total", [], 2]], "histograms": []}))
+    (tmp_path / "aggregate.json").write_text(json.dumps({
+        "values": [["ingestion_runs_total", [], 5]], "histograms": [], "folded": [path.stem]
+    }))
+    assert samples("ingestion_runs_total") == {"ingestion_runs_total": 5}
+    assert not path.exists()
+
+
+def test_flush(tmp_path):
+    metrics.INGESTION_RUNS.inc()
+    registry.flush()
+    path, = tmp_path.glob("*.json")
+    assert path.stem == registry.name and registry.name.startswith(f"{os.getpid()}-")
+    assert json.loads(path.read_text())["values"] == [["ingestion_runs_total", [], 1]]
+
+
+def test_flushing_starts_on_the_first_observation(tmp_path):
+    local = metrics.Registry(tmp_path / "enabled")
+    assert not local._flushing
+    local.observe("db_statement_duration_seconds", (), 0, 0.001, len(metrics.SQL_BUCKETS))
+    assert local._flushing
+    # Nothing is recorded, nor written, when disabled
+    disabled = metrics.Registry(tmp_path / "disabled", enabled=False)
+    disabled.add("ingestion_runs_total", (), 1)
+    disabled.flush()
+    assert not disabled._flushing and not disabled.values
+    assert not (tmp_path / "disabled").exists()
+
+
+def test_cache_lookups():
+    cache = TwoTierCache(l1=LRUByteCache(1024), l2=SimpleCache(), l1_timeout=30)
+    cache.set("key", 1)
+    cache.get("key")
+    with CacheMetrics("get_statistics"):
+        cache.get("key")
+        cache.get("missing")
+        cache.get("get_statistics_memver")
+        cache.l1.clear()
+        cache.get("key")
+    assert samples("cache_lookups_total") == {
+        'cache_lookups_total{function="get_statistics",result="hit_l1"}': 1,
+        'cache_lookups_total{function="get_statistics",result="hit_l2"}': 1,
+        'cache_lookups_total{function="get_statistics",result="miss"}': 1
+    }
+
+
+def test_sql_statements():
+    metrics.instrument_engines()
+    engine = create_engine("sqlite://", poolclass=MeteredQueuePool)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        with pytest.raises(Exception):
+            conn.execute(text("SELECT * FROM missing"))
+        conn.execute(text("SELECT 2"))
+    assert samples("db_statement_duration_seconds_count") == {'db_statement_duration_seconds_count{operation="SELECT"}': 2}
+    assert samples("db_pool_checkout_wait_seconds_count") == {"db_pool_checkout_wait_seconds_count": 1}
+
+
+def test_record_ingestion(tmp_path):
+    report = IngestionReport()
+    report.add("IBM", "inserted", 10)
+    report.add("IBM", "skipped", 4)
+    metrics.record_ingestion(report)
+    assert samples("ingested_rows_total") == {
+        'ingested_rows_total{kind="inserted",symbol="IBM"}': 10,
+        'ingested_rows_total{kind="skipped",symbol="IBM"}': 4
+    }
+    assert samples("ingestion_runs_total") == {"ingestion_runs_total": 1}
+    assert list(tmp_path.glob("*.json"))
+
+
+def test_init_app():
+    app = Flask("test")
+    api = Api(app, prefix="/api")
+
+    @api.route("/statistics")
+    class StatisticsView(Resource):
+        def get(self):
+            return {}
+
+    metrics.init_app(app)
+    client = app.test_client()
+    client.get("/api/statistics")
+    resp = client.get("/metrics")
+    assert resp.content_type == metrics.CONTENT_TYPE
+    assert 'http_request_duration_seconds_count{method="GET",resource="StatisticsView",status="200"} 1' in resp.get_data(as_text=True)
+    assert "singleflight_calls_total" in resp.get_data(as_text=True)
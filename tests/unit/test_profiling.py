@@ -0,0 +1,65 @@
+import pstats
+import sys
+import threading
+import time
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+from lib.profiling import ID_HEADER, RequestProfiler, StackSampler
+
+
+def slow_statistics():
+    time.sleep(0.05)
+    return b"{}"
+
+
+def app(environ, start_response):
+    return Response(slow_statistics())(environ, start_response)
+
+
+def test_stack_sampler():
+    def work():
+        time.sleep(0.05)
+
+    with StackSampler(threading.get_ident(), sys._getframe(), interval=0.001) as sampler:
+        work()
+    stack, count = sampler.stacks.most_common(1)[0]
+    # Python 3.10 has no qualified names of the code objects
+    assert stack == f"{__name__}.{'test_stack_sampler.<locals>.work' if sys.version_info >= (3, 11) else 'work'}"
+    assert count > 5
+    assert sampler.collapsed().startswith(f"{stack} {count}\n")
+
+
+def test_requests_with_the_token_are_profiled(tmp_path):
+    client = Client(RequestProfiler(app, str(tmp_path), token="secret"))
+    assert ID_HEADER not in client.get("/api/statistics").headers
+    assert ID_HEADER not in client.get("/api/statistics", headers={"X-Profile": "wrong"}).headers
+    assert not list(tmp_path.iterdir())
+
+    resp = client.get("/api/statistics", headers={"X-Profile": "secret"})
+    assert resp.data == b"{}"
+    profile_id = resp.headers[ID_HEADER]
+    assert profile_id.endswith("-GET-api_statistics")
+    assert sorted(path.name for path in tmp_path.iterdir()) == [f"{profile_id}.collapsed", f"{profile_id}.prof"]
+    stats = pstats.Stats(str(tmp_path / f"{profile_id}.prof"))
+    assert any(name == "slow_statistics" for _, _, name in stats.stats)
+    stacks = (tmp_path / f"{profile_id}.collapsed").read_text().splitlines()
+    assert any(f"{__name__}.slow_statistics" in line for line in stacks)
+    # From the application down
+    assert all(line.startswith(f"{__name__}.app;") for line in stacks)
+
+
+def test_sampled_requests_are_profiled(tmp_path, monkeypatch):
+    client = Client(RequestProfiler(app, str(tmp_path), sample_rate=0.5))
+    monkeypatch.setattr("lib.profiling.random.random", lambda: 0.9)
+    assert ID_HEADER not in client.get("/").headers
+    monkeypatch.setattr("lib.profiling.random.random", lambda: 0.1)
+    assert client.get("/").headers[ID_HEADER].endswith("-GET-root")
+
+
+def test_disabled_by_default(monkeypatch):
+    from app import create_app
+    monkeypatch.setattr("app.PROFILE_TOKEN", None)
+    monkeypatch.setattr("app.PROFILE_SAMPLE_RATE", 0)
+    assert not isinstance(create_app().wsgi_app, RequestProfiler)
+    monkeypatch.setattr("app.PROFILE_TOKEN", "secret")
+    assert isinstance(create_app().wsgi_app, RequestProfiler)
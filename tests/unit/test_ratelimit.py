@@ -0,0 +1,29 @@
+from lib.ratelimit import TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    # 5 calls per minute
+    limiter = TokenBucket(rate=5 / 60, capacity=5, clock=clock, sleep=clock.sleep)
+    for _ in range(5):
+        limiter.acquire()
+    assert clock.now == 0
+    assert limiter.try_acquire() == 12
+    limiter.acquire()
+    assert clock.now == 12
+    # Refills up to the capacity only
+    clock.now += 3600
+    for _ in range(5):
+        assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() > 0
@@ -0,0 +1,55 @@
+import os
+import time
+import pytest
+from datetime import date
+from lib.response_cache import ResponseCache, ResponseKey
+
+KEY = ResponseKey("TIME_SERIES_DAILY_ADJUSTED", "IBM", "compact", date(2023, 6, 2))
+
+
+def test_put_read(tmp_path):
+    cache = ResponseCache(tmp_path, ttl_seconds=60, max_bytes=1 << 20)
+    assert cache.read(KEY) is None
+    cache.put(KEY, b'{"a": 1}')
+    cache.put(KEY._replace(symbol="AAPL"), b'{"a": 1}')
+    assert cache.read(KEY) == cache.read(KEY._replace(symbol="AAPL")) == b'{"a": 1}'
+    # Content addressed: identical bodies are stored once
+    assert len(list(cache.objects.glob("*/*.json.gz"))) == 1
+
+
+def test_ttl_and_replay(tmp_path):
+    cache = ResponseCache(tmp_path, ttl_seconds=60, max_bytes=1 << 20)
+    cache.put(KEY, b"old")
+    stale = time.time() - 120
+    os.utime(cache._ref_path(KEY), (stale, stale))
+    assert cache.read(KEY) is None
+    assert cache.read(KEY, replay=True) == b"old"
+    # The newest response up to the as-of date
+    cache.put(KEY._replace(as_of=date(2023, 6, 5)), b"new")
+    assert cache.read(KEY._replace(as_of=date(2023, 6, 4)), replay=True) == b"old"
+    assert cache.read(KEY._replace(as_of=date(2023, 6, 9)), replay=True) == b"new"
+    assert cache.read(KEY._replace(as_of=date(2023, 6, 1)), replay=True) is None
+
+
+def test_writer_discards_incomplete(tmp_path):
+    cache = ResponseCache(tmp_path, ttl_seconds=60, max_bytes=1 << 20)
+    with pytest.raises(ConnectionError):
+        with cache.writer(KEY) as writer:
+            for chunk in writer.tee([b'{"a": ', b"1"]):
+                pass
+            raise ConnectionError()
+    assert cache.read(KEY) is None
+    assert not any(cache.objects.iterdir())
+
+
+def test_evict(tmp_path):
+    cache = ResponseCache(tmp_path, ttl_seconds=60, max_bytes=1 << 20)
+    body = os.urandom(4096)
+    for i, day in enumerate([date(2023, 6, 1), date(2023, 6, 2), date(2023, 6, 3)]):
+        cache.put(KEY._replace(as_of=day), body + bytes([i]))
+        os.utime(cache._ref_path(KEY._replace(as_of=day)), (time.time() - 10 + i, time.time() - 10 + i))
+    cache.max_bytes = 2 * 4200
+    assert cache.evict() == 1
+    # The oldest one was dropped
+    assert cache.read(KEY._replace(as_of=date(2023, 6, 1))) is None
+    assert cache.read(KEY._replace(as_of=date(2023, 6, 3))) == body + bytes([2])
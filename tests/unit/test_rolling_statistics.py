@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from financial.get_rolling_statistics import rolling
+
+rng = np.random.default_rng(7)
+
+
+def sample(size: int):
+    return rng.random(size) * 100 + 50, rng.random(size) * 100 + 50, rng.integers(1, 10 ** 6, size).astype(float)
+
+
+@pytest.mark.parametrize("window", [2, 5, 20])
+def test_rolling(window):
+    open_prices, close_prices, volumes = sample(100)
+    result = rolling(open_prices, close_prices, volumes, window)
+    returns = close_prices[1:] / close_prices[:-1] - 1
+    for i in range(len(close_prices)):
+        days = slice(i - window + 1, i + 1)
+        if i < window - 1:
+            assert np.isnan(result["mean_open_price"][i]) and np.isnan(result["vwap"][i])
+        else:
+            assert result["mean_open_price"][i] == pytest.approx(open_prices[days].mean())
+            assert result["mean_close_price"][i] == pytest.approx(close_prices[days].mean())
+            assert result["vwap"][i] == pytest.approx((close_prices[days] * volumes[days]).sum() / volumes[days].sum())
+        if i < window:
+            assert np.isnan(result["volatility"][i])
+        else:
+            assert result["volatility"][i] == pytest.approx(returns[i - window:i].std(ddof=1))
+
+
+def test_rolling_short():
+    result = rolling(*sample(3), window=5)
+    assert all(np.isnan(values).all() and len(values) == 3 for values in result.values())
+
+
+def test_rolling_constant():
+    # No negative variance out of rounding errors; and no volume
+    result = rolling(np.full(30, 1.1), np.full(30, 1.1), np.zeros(30), window=10)
+    assert (result["volatility"][10:] == 0).all()
+    assert np.isnan(result["vwap"]).all()
+
+
+def test_rolling_non_finite():
+    # Only the windows holding the missing price are NaN
+    open_prices, close_prices, volumes = sample(40)
+    close_prices[10] = np.nan
+    result = rolling(open_prices, close_prices, volumes, window=5)
+    assert np.isnan(result["mean_close_price"][10:15]).all()
+    assert not np.isnan(result["mean_close_price"][15:]).any()
+    assert result["mean_close_price"][-1] == pytest.approx(close_prices[-5:].mean())
+    assert not np.isnan(result["mean_open_price"][4:]).any()
+    assert np.isnan(result["volatility"][10:16]).all()
+    assert not np.isnan(result["volatility"][16:]).any()
@@ -0,0 +1,47 @@
+import mock
+from datetime import date
+from financial import rollups
+from model import FinancialDataRollup
+
+
+def test_rollup_attrs():
+    assert FinancialDataRollup.upsert_index_keys() == ["symbol", "granularity", "period_start"]
+    assert set(FinancialDataRollup.granularity.type.enums) == {"MONTH", "YEAR"}
+
+
+def test_split_range_edges_only():
+    assert rollups.split_range(date(2023, 2, 3), date(2023, 2, 20)) == ([(date(2023, 2, 3), date(2023, 2, 20))], [], [])
+    assert rollups.split_range(date(2023, 1, 20), date(2023, 2, 10)) == (
+        [(date(2023, 1, 20), date(2023, 1, 31)), (date(2023, 2, 1), date(2023, 2, 10))], [], []
+    )
+
+
+def test_split_range_buckets():
+    edges, months, years = rollups.split_range(date(2019, 11, 15), date(2022, 3, 10))
+    assert edges == [(date(2019, 11, 15), date(2019, 11, 30)), (date(2022, 3, 1), date(2022, 3, 10))]
+    assert months == [date(2019, 12, 1), date(2022, 1, 1), date(2022, 2, 1)]
+    assert years == [date(2020, 1, 1), date(2021, 1, 1)]
+
+
+def test_split_range_exact_buckets():
+    assert rollups.split_range(date(2020, 1, 1), date(2020, 12, 31)) == ([], [], [date(2020, 1, 1)])
+    assert rollups.split_range(date(2020, 2, 1), date(2020, 2, 29)) == ([], [date(2020, 2, 1)], [])
+
+
+def test_refresh_rows_groups_by_symbol():
+    rows = [
+        {"symbol": "IBM", "date": date(2023, 6, 1)},
+        {"symbol": FinancialDataRollup.symbol.type.enum_class.IBM, "date": date(2022, 12, 30)},
+        {"symbol": "AAPL", "date": "2023-06-02"},
+    ]
+    with mock.patch.object(rollups, "refresh") as refresh:
+        rollups.refresh_rows("session", rows)
+    refresh.assert_called_once_with("session", {
+        "IBM": {date(2023, 6, 1), date(2022, 12, 30)},
+        "AAPL": {date(2023, 6, 2)}
+    })
+
+
+def test_month_runs():
+    months = [date(2023, 2, 1), date(2022, 12, 1), date(2023, 1, 1), date(2023, 6, 1)]
+    assert rollups._month_runs(months) == [(date(2022, 12, 1), date(2023, 2, 28)), (date(2023, 6, 1), date(2023, 6, 30))]
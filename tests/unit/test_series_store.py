@@ -0,0 +1,114 @@
+import mock
+import pytest
+from datetime import date, datetime, timedelta
+from mock import MagicMock
+from app import create_app, db
+from financial.series_store import TimeSeriesStore
+from lib.generation import DataGeneration
+from model import FinancialData
+
+application = create_app()
+T0, T1 = datetime(2023, 6, 1, 12), datetime(2023, 6, 2, 12)
+
+
+def rows(symbol_id: int, start: date, size: int, updated_at: datetime = T0):
+    return [(symbol_id * 1000 + i, start + timedelta(days=i), 10.0 + i, 20.0 + i, 100 * (i + 1), updated_at) for i in range(size)]
+
+
+class FakeTable:
+    """Answers the queries of the store from in-memory rows, per symbol."""
+    def __init__(self, data):
+        self.data = data
+        self.queries = []
+
+    def execute(self, query):
+        params = query.compile().params
+        symbol = next(value for key, value in params.items() if key.startswith("symbol"))
+        rows = sorted(self.data.get(symbol.name if hasattr(symbol, "name") else symbol, []), key=lambda row: row[1])
+        since = next((value for key, value in params.items() if key.startswith("updated_at")), None)
+        if since is not None:
+            rows = [row for row in rows if row[5] >= since]
+        result = MagicMock()
+        result.all.return_value = rows
+        result.scalar.return_value = len(rows)
+        self.queries.append(str(query))
+        return result
+
+
+@pytest.fixture
+def table():
+    return FakeTable({"IBM": rows(1, date(2023, 5, 1), 5), "AAPL": rows(2, date(2023, 5, 3), 3)})
+
+
+@pytest.fixture
+def store(tmp_path, table):
+    with application.app_context():
+        with mock.patch.object(db.core.session, "execute", side_effect=table.execute):
+            yield TimeSeriesStore(generations=DataGeneration(str(tmp_path / "generations.json")))
+
+
+def test_count_and_average(store, table):
+    assert store.count() == 8
+    assert store.count("IBM", "2023-05-02", datetime(2023, 5, 4)) == 3
+    assert store.count("IBM", date(2023, 6, 1)) == 0
+    assert store.average("IBM", "2023-05-02", "2023-05-04") == {
+        "average_daily_open_price": 12.0, "average_daily_close_price": 22.0, "average_daily_volume": 300.0
+    }
+    assert store.average("IBM", "2023-05-04", "2023-05-02") == {}
+    # Loaded once per symbol
+    assert store.loads == 2
+    assert len(table.queries) == 2
+
+
+def test_records(store):
+    first = store.records(offset=0, limit=4)
+    assert [(record.symbol, record.date) for record in first] == [
+        (FinancialData.Symbols.AAPL, date(2023, 5, 3)), (FinancialData.Symbols.AAPL, date(2023, 5, 4)),
+        (FinancialData.Symbols.AAPL, date(2023, 5, 5)), (FinancialData.Symbols.IBM, date(2023, 5, 1))
+    ]
+    assert first[3].id == 1000 and first[3].open_price == 10.0 and first[3].volume == 100
+    # The offset continues in the next symbol
+    assert [record.id for record in store.records(offset=4, limit=2)] == [1001, 1002]
+    assert [record.id for record in store.records(start_date="2023-05-04", offset=1, limit=10)] == [2002, 1003, 1004]
+    assert store.records(offset=8, limit=2) == []
+    # Past a cursor
+    assert [record.id for record in store.records(limit=3, after=("AAPL", date(2023, 5, 4)))] == [2002, 1000, 1001]
+    assert [record.id for record in store.records("IBM", limit=3, after=("IBM", date(2023, 5, 3)))] == [1003, 1004]
+
+
+def test_window(store):
+    (days, open_prices, _, _), first = store.window("IBM", "2023-05-04", "2023-05-05", lookback=2)
+    assert first == 2
+    assert days.tolist() == [date(2023, 5, d).toordinal() for d in range(2, 6)]
+    assert open_prices.tolist() == [11.0, 12.0, 13.0, 14.0]
+    (days, _, _, _), first = store.window("IBM", "2023-05-02", "2023-05-02", lookback=5)
+    assert (len(days), first) == (2, 1)
+
+
+def test_append(store, table):
+    store.count("IBM")
+    # Two new days, with the same `updated_at` as ones already loaded
+    table.data["IBM"] += [
+        (1005, date(2023, 5, 6), 15.0, 25.0, 600, T0), (1006, date(2023, 5, 7), 16.0, 26.0, 700, T1)
+    ]
+    store.generations.bump(["IBM"])
+    assert store.count("IBM") == 7
+    assert (store.loads, store.appends) == (1, 1)
+    assert store.average("IBM", "2023-05-05", "2023-05-07") == {
+        "average_daily_open_price": 15.0, "average_daily_close_price": 25.0, "average_daily_volume": 600.0
+    }
+    assert store.series("IBM").updated_at == T1
+
+
+def test_reload(store, table):
+    store.count("IBM")
+    # A revised (older) day
+    table.data["IBM"][1] = (1001, date(2023, 5, 2), 99.0, 20.0, 200, T1)
+    store.generations.bump(["IBM"])
+    assert store.average("IBM", "2023-05-02", "2023-05-02")["average_daily_open_price"] == 99.0
+    assert (store.loads, store.appends) == (2, 0)
+    # A deleted one
+    del table.data["IBM"][0]
+    store.generations.bump(["IBM"])
+    assert store.count("IBM") == 4
+    assert store.loads == 3
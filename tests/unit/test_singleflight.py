@@ -0,0 +1,89 @@
+import multiprocessing
+import threading
+import time
+import pytest
+from lib.singleflight import SingleFlight
+
+
+def run_concurrently(func, n, *args, **kwargs):
+    results, errors = [None] * n, [None] * n
+
+    def target(i):
+        try:
+            results[i] = func(*args, **kwargs)
+        except Exception as e:
+            errors[i] = e
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_concurrent_calls_are_coalesced():
+    flight = SingleFlight("test_coalesced", cross_process=False)
+    executions = []
+
+    @flight
+    def compute(symbol, start_date=None):
+        executions.append(symbol)
+        time.sleep(0.2)
+        return {"symbol": symbol}
+
+    results, _ = run_concurrently(compute, 8, "IBM")
+    assert executions == ["IBM"]
+    assert all(result == {"symbol": "IBM"} for result in results)
+    assert flight.stats() == {"calls": 8, "coalesced": 7, "cross_process_waits": 0, "in_flight": 0}
+    # Positional and keyword arguments are normalized; later calls run again
+    compute(symbol="IBM", start_date=None)
+    assert executions == ["IBM", "IBM"]
+
+
+def test_distinct_calls_are_not_coalesced():
+    flight = SingleFlight("test_distinct", namespace=lambda name: f"{name}@1", cross_process=False)
+
+    @flight
+    def compute(symbol):
+        time.sleep(0.05)
+        return symbol
+
+    assert [compute(s) for s in ("IBM", "AAPL")] == ["IBM", "AAPL"]
+    assert flight.stats()["coalesced"] == 0
+
+
+def test_errors_are_shared():
+    flight = SingleFlight("test_errors", cross_process=False)
+
+    @flight
+    def compute():
+        time.sleep(0.2)
+        raise KeyError("missing")
+
+    _, errors = run_concurrently(compute, 4)
+    assert all(isinstance(e, KeyError) for e in errors)
+    assert flight.stats()["coalesced"] == 3
+    with pytest.raises(KeyError):
+        compute()
+
+
+def _hold_lock(lock_dir, started):
+    @SingleFlight("test_cross_process", cross_process=True, lock_dir=lock_dir)
+    def compute():
+        started.set()
+        time.sleep(0.5)
+    compute()
+
+
+def test_cross_process_leaders_wait(tmp_path):
+    ctx = multiprocessing.get_context("fork")
+    started = ctx.Event()
+    other = ctx.Process(target=_hold_lock, args=(str(tmp_path), started))
+    other.start()
+    assert started.wait(5)
+    flight = SingleFlight("test_cross_process", cross_process=True, lock_dir=str(tmp_path))
+    began = time.monotonic()
+    flight(lambda: None)()
+    other.join()
+    assert time.monotonic() - began > 0.2
+    assert flight.stats()["cross_process_waits"] == 1
@@ -0,0 +1,65 @@
+import json
+import mock
+import os
+from datetime import date, datetime
+from financial.warmup import ShapeRecorder, resolve, prewarm
+from model import FinancialData
+
+
+TODAY = date(2023, 5, 20)
+
+
+def test_shape_normalization():
+    kwargs = {"start_date": datetime(2023, 5, 6), "end_date": "2023-05-20", "symbol": "IBM"}
+    shape = ShapeRecorder.normalize("statistics", kwargs, today=TODAY)
+    assert json.loads(shape) == {"endpoint": "statistics", "start_date": -14, "end_date": 0, "symbol": "IBM"}
+    # The same relative range on another day has the same shape
+    assert ShapeRecorder.normalize("statistics", {**kwargs, "start_date": "2023-05-07", "end_date": "2023-05-21"}, today=date(2023, 5, 21)) == shape
+    assert resolve(json.loads(shape), today=TODAY) == {"start_date": datetime(2023, 5, 6), "end_date": datetime(2023, 5, 20), "symbol": "IBM"}
+
+
+def test_top_shapes(tmp_path):
+    recorder = ShapeRecorder(str(tmp_path), flush_seconds=0)
+    for _ in range(3):
+        recorder.record("financial_data", {"limit": 50, "page": 1})
+    recorder.record("financial_data", {"limit": 10, "page": 2})
+    (tmp_path / "1.json").write_text(json.dumps({json.dumps({"endpoint": "financial_data", "limit": 10, "page": 2}): 5}))
+    (tmp_path / "2.json").write_text(json.dumps({json.dumps({"endpoint": "financial_data", "limit": 7, "page": 1}): 100}))
+    os.utime(tmp_path / "2.json", (0, 0))
+
+    n_defaults = 2 * len(FinancialData.Symbols) + 1
+    shapes = recorder.top(n=n_defaults + 2, max_age=3600)
+    # The default shapes come first, then the most requested ones of the recent processes
+    assert shapes[0] == {"endpoint": "statistics", "symbol": "AAPL", "start_date": -14, "end_date": 0}
+    assert shapes[n_defaults:] == [
+        {"endpoint": "financial_data", "limit": 10, "page": 2},
+        {"endpoint": "financial_data", "limit": 50, "page": 1}
+    ]
+    # The counts of old processes are dropped
+    assert not (tmp_path / "2.json").exists()
+
+
+def test_shapes_are_bounded(tmp_path):
+    recorder = ShapeRecorder(str(tmp_path), flush_seconds=3600, max_shapes=3)
+    for page in range(1, 4):
+        for _ in range(page):
+            recorder.record("financial_data", {"limit": 5, "page": page})
+    for page in range(4, 100):
+        recorder.record("financial_data", {"limit": 5, "page": page})
+    assert len(recorder.counts) <= 6
+    recorder.flush()
+    flushed = json.loads((tmp_path / f"{os.getpid()}.json").read_text())
+    assert len(flushed) == 3
+    assert flushed[json.dumps({"endpoint": "financial_data", "limit": 5, "page": 3})] == 3
+
+
+def test_prewarm_budget():
+    service = mock.Mock(side_effect=[None, ValueError(), None])
+    shapes = [{"endpoint": "statistics", "symbol": "IBM", "start_date": -14, "end_date": 0}] * 3
+    assert prewarm({"statistics": service}, shapes=shapes, budget=10) == 2
+    assert service.call_count == 3
+
+    with mock.patch("financial.warmup.time.monotonic", side_effect=[0, 0, 11]):
+        service = mock.Mock()
+        assert prewarm({"statistics": service}, shapes=shapes, budget=10) == 1
+        service.assert_called_once()
@@ -0,0 +1,26 @@
+"""Production (WSGI) application entry point.
+
+Served by `gunicorn -c conf/gunicorn.conf.py wsgi:application`. With `preload_app`, this
+module is imported once by the master process: the models, the fixtures, the routes and the
+in-process indices are loaded before the workers are forked, so the workers share them
+(copy-on-write) and start warm. The inherited database connections are dropped in each
+worker (see `post_fork` of `conf/gunicorn.conf.py`).
+
+Before forking, the master also warms the hot query shapes (for at most
+`STARTUP_WARMUP_BUDGET_SECONDS`); this fills the shared cache, and the SQL compilation cache
+inherited by the workers, so a new container serves its first requests warm.
+"""
+from app import create_app, db
+from conf.settings import STARTUP_WARMUP_BUDGET_SECONDS, READ_ENGINE
+from financial import warmup
+from financial.coverage import coverage
+from financial.series_store import store
+
+application = create_app()
+
+with application.app_context():
+    db.initialize()
+    coverage.build()
+    if READ_ENGINE == "memory":
+        store.build()
+    warmup.prewarm(budget=STARTUP_WARMUP_BUDGET_SECONDS)